@@ -0,0 +1,163 @@
+"""
+Duraciones de las etapas del servicio a partir de los hitos:
+- wait: creación (u hora programada) -> arrival_origin
+- pickup: arrival_origin -> pet_on_board
+- trip: pet_on_board -> delivered
+- total: creación (u hora programada) -> delivered
+
+rollup_days() lee las solicitudes entregadas en un rango de días con una sola query
+agrupada (agregación condicional sobre los hitos) y guarda por día, guía, tipo de
+servicio y etapa la cantidad, la suma y un histograma en MilestoneDailySummary.
+summarize() combina esos histogramas para calcular p50/p95 de cualquier rango sin
+tocar la tabla de hitos.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import MilestoneDailySummary, ServiceRequest, ServiceRequestMilestone
+
+STAGES = ['wait', 'pickup', 'trip', 'total']
+GROUP_FIELDS = {'guide': 'guide_id', 'service_type': 'service_type'}
+
+# límites superiores (segundos) de los tramos del histograma, crecen un 25% cada uno
+# (15 s a ~25 h); el último tramo junta todo lo que supera al último límite
+BUCKET_BOUNDS = [round(15 * 1.25 ** i) for i in range(40)]
+
+
+def _bucket(seconds):
+    for index, bound in enumerate(BUCKET_BOUNDS):
+        if seconds <= bound:
+            return index
+    return len(BUCKET_BOUNDS)
+
+
+def percentile(histogram, pct):
+    """Percentil aproximado (interpolando dentro del tramo) de un histograma, o None si está vacío."""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = pct / 100 * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            low = BUCKET_BOUNDS[index - 1] if index else 0
+            if index >= len(BUCKET_BOUNDS):
+                return float(low)
+            return low + (BUCKET_BOUNDS[index] - low) * (rank - seen) / count
+        seen += count
+    return float(BUCKET_BOUNDS[-1])
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def stage_durations(start, arrival, on_board, delivered):
+    """{etapa: segundos} de las etapas con ambos extremos registrados."""
+    points = {
+        'wait': (start, arrival),
+        'pickup': (arrival, on_board),
+        'trip': (on_board, delivered),
+        'total': (start, delivered),
+    }
+    # una programada puede empezar antes de su hora: no hay duraciones negativas
+    return {stage: max((end - begin).total_seconds(), 0.0)
+            for stage, (begin, end) in points.items() if begin and end}
+
+
+def delivered_rows(first_day, last_day):
+    """
+    Solicitudes entregadas entre first_day y last_day (inclusive) con el instante de
+    cada hito, en una query: las entregas salen del índice (milestone, recorded_at) y
+    los tres hitos de cada solicitud se pivotean con Max(..., filter=...).
+    """
+    delivered = ServiceRequestMilestone.objects.filter(
+        milestone='delivered', recorded_at__gte=_day_start(first_day),
+        recorded_at__lt=_day_start(last_day + timedelta(days=1)),
+    ).values('request_id')
+    at = {
+        name: models.Max('milestones__recorded_at', filter=models.Q(milestones__milestone=milestone))
+        for name, milestone in [('arrival_at', 'arrival_origin'), ('on_board_at', 'pet_on_board'),
+                                ('delivered_at', 'delivered')]
+    }
+    # 'id' en values(): se agrupa por solicitud
+    return ServiceRequest.objects.filter(pk__in=delivered).order_by().values(
+        'id', 'assigned_guide_id', 'service_type', 'schedule_type', 'scheduled_datetime', 'created_at',
+    ).annotate(**at)
+
+
+def rollup_days(first_day, last_day):
+    """Recalcula los resúmenes de first_day..last_day. Devuelve cuántas filas guardó."""
+    groups = defaultdict(lambda: [0, 0.0, [0] * (len(BUCKET_BOUNDS) + 1)])
+    for row in delivered_rows(first_day, last_day):
+        start = row['created_at']
+        if row['schedule_type'] == 'scheduled' and row['scheduled_datetime']:
+            start = row['scheduled_datetime']
+        day = timezone.localdate(row['delivered_at'])
+        durations = stage_durations(start, row['arrival_at'], row['on_board_at'], row['delivered_at'])
+        for stage, seconds in durations.items():
+            group = groups[(day, row['assigned_guide_id'], row['service_type'], stage)]
+            group[0] += 1
+            group[1] += seconds
+            group[2][_bucket(seconds)] += 1
+
+    summaries = [
+        MilestoneDailySummary(day=day, guide_id=guide_id, service_type=service_type, stage=stage,
+                              count=count, total_seconds=total, histogram=histogram)
+        for (day, guide_id, service_type, stage), (count, total, histogram) in groups.items()
+    ]
+    with transaction.atomic():
+        MilestoneDailySummary.objects.filter(day__gte=first_day, day__lte=last_day).delete()
+        MilestoneDailySummary.objects.bulk_create(summaries)
+    return len(summaries)
+
+
+def update_summaries(today=None):
+    """
+    Rollup incremental: desde el último día resumido (puede haber quedado a medias)
+    hasta hoy. Sin resúmenes previos arranca en la primera entrega registrada.
+    Devuelve (primer día, último día, filas) o None si no hay entregas.
+    """
+    today = today or timezone.localdate()
+    first_day = MilestoneDailySummary.objects.aggregate(last=models.Max('day'))['last']
+    if first_day is None:
+        first = ServiceRequestMilestone.objects.filter(milestone='delivered')\
+            .order_by('recorded_at').values_list('recorded_at', flat=True).first()
+        if first is None:
+            return None
+        first_day = timezone.localdate(first)
+    return first_day, today, rollup_days(first_day, today)
+
+
+def _result_order(item):
+    # por grupo (los sin guía al final) y las etapas en orden
+    (key, stage), _ = item
+    return key is None, key or 0, STAGES.index(stage)
+
+
+def summarize(first_day, last_day, group_by='service_type'):
+    """p50/p95/promedio por grupo ('guide' o 'service_type') y etapa, desde los resúmenes diarios."""
+    field = GROUP_FIELDS[group_by]
+    merged = {}
+    rows = MilestoneDailySummary.objects.filter(day__gte=first_day, day__lte=last_day)\
+        .values_list(field, 'stage', 'count', 'total_seconds', 'histogram')
+    for key, stage, count, total, histogram in rows:
+        entry = merged.setdefault((key, stage), [0, 0.0, [0] * (len(BUCKET_BOUNDS) + 1)])
+        entry[0] += count
+        entry[1] += total
+        for index, n in enumerate(histogram):
+            entry[2][index] += n
+    results = []
+    for (key, stage), (count, total, histogram) in sorted(merged.items(), key=_result_order):
+        results.append({
+            field: key,
+            'stage': stage,
+            'count': count,
+            'avg_seconds': round(total / count, 1),
+            'p50_seconds': round(percentile(histogram, 50), 1),
+            'p95_seconds': round(percentile(histogram, 95), 1),
+        })
+    return results
@@ -5,4 +5,5 @@ class MyAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "my_app"
     def ready(self):
-        import my_app.signals
\ No newline at end of file
+        import my_app.db  # PRAGMA de las conexiones SQLite
+        import my_app.signals
@@ -0,0 +1,176 @@
+"""
+Vistas async (Django puro, DRF no soporta vistas async) para los endpoints de sólo
+lectura más consultados y el stream SSE. Sirven su beneficio bajo zoolito.asgi: una
+conexión lenta espera en el event loop sin ocupar un thread del worker.
+Devuelven el mismo JSON que sus equivalentes en views.py.
+"""
+import asyncio
+import functools
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import exceptions
+
+from .authentication import CachedJWTAuthentication
+from .events import GUIDES_CHANNEL, broker, format_sse, guide_channel, outbox_relay, user_channel
+from .models import Profile, ServiceRequest
+from .renderers import FastJSONRenderer
+from .serializers import GuidePublicProfileSerializer, ServiceRequestSerializer, UserSerializer
+from .throttling import IPTokenBucketThrottle, acheck
+
+CHUNK_SIZE = 200
+SSE_KEEPALIVE_SECONDS = 20
+
+_renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    response = json_response({"detail": exc.detail} if not isinstance(exc.detail, dict) else exc.detail,
+                             status=exc.status_code)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(None)
+    return response
+
+
+async def authenticate(request):
+    """(user, token) del JWT de la request o None; AuthenticationFailed si el token es inválido."""
+    return await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+
+
+async def is_guide(user, token):
+    role = token.get('role')
+    if role is not None:
+        return role == 'guide'
+    return await Profile.objects.filter(user_id=user.id, role='guide').aexists()
+
+
+def async_api_view(allow_anonymous=False, guide_only=False, throttle_scope=None):
+    """
+    Autenticación JWT, permisos y límite por IP (throttle_scope, ver throttling.py)
+    equivalentes a los de las APIView sync, sólo GET.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return error_response(exceptions.MethodNotAllowed(request.method))
+            if throttle_scope:
+                ident = f'ip:{IPTokenBucketThrottle().get_ident(request)}'
+                wait = await acheck(request, throttle_scope, ident)
+                if wait is not None:
+                    response = error_response(exceptions.Throttled(wait))
+                    response['Retry-After'] = str(math.ceil(wait))
+                    return response
+            try:
+                auth = await authenticate(request)
+            except exceptions.AuthenticationFailed as exc:  # incluye InvalidToken
+                return error_response(exc)
+            if auth is None and not allow_anonymous:
+                return error_response(exceptions.NotAuthenticated())
+            user, token = auth if auth else (None, None)
+            if guide_only and not await is_guide(user, token):
+                return error_response(exceptions.PermissionDenied())
+            return await view(request, user, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def serialize_requests(qs):
+    rows = [sr async for sr in qs.with_details().aiterator(chunk_size=CHUNK_SIZE)]
+    return ServiceRequestSerializer(rows, many=True).data
+
+
+@async_api_view()
+async def user_history_requests(request, user):
+    qs = ServiceRequest.objects.filter(user=user).order_by('-created_at', '-id')
+    return json_response(await serialize_requests(qs))
+
+
+@async_api_view(guide_only=True)
+async def guide_available_requests(request, user):
+    qs = ServiceRequest.objects.in_pool().order_by('created_at', 'id')
+    return json_response(await serialize_requests(qs))
+
+
+@async_api_view(guide_only=True)
+async def guide_assigned_requests(request, user):
+    qs = ServiceRequest.objects.filter(assigned_guide=user).order_by('-created_at')
+    return json_response(await serialize_requests(qs))
+
+
+@async_api_view(allow_anonymous=True, throttle_scope='guide-profile')
+async def guide_public_profile(request, user, guide_id):
+    try:
+        guide = await User.objects.select_related('rating_stats').aget(pk=guide_id)
+    except User.DoesNotExist:
+        # mismo mensaje que get_object_or_404 en la vista sync
+        return error_response(exceptions.NotFound(f"No {User._meta.object_name} matches the given query."))
+    stats = getattr(guide, 'rating_stats', None)
+    data = {
+        "guide_id": guide.id,
+        "username": guide.username,
+        "full_name": f"{guide.first_name} {guide.last_name}".strip(),
+        "rating_avg": stats.rating_avg if stats else 0.0,
+        "rating_count": stats.rating_count if stats else 0,
+        "rating_histogram": stats.histogram if stats else {str(n): 0 for n in range(1, 6)},
+    }
+    return json_response(GuidePublicProfileSerializer(data).data)
+
+
+@async_api_view()
+async def current_user(request, user):
+    # usuario y perfil en una query; el serializer no debe ir a la base desde el event loop
+    user = await User.objects.select_related('profile').aget(pk=user.pk)
+    return json_response(UserSerializer(user).data)
+
+
+async def events_stream(request):
+    """
+    Server-Sent Events con las novedades en tiempo real (requiere servir con zoolito.asgi):
+    - guías: request.created / request.accepted del pool, sus propios hitos y request.reminder
+    - usuarios: milestone.created y request.reminder de sus solicitudes
+    Autenticación con el mismo JWT (cabecera Authorization) que el resto de la API.
+    """
+    if not isinstance(request, ASGIRequest):
+        return json_response({"detail": "Este endpoint requiere un servidor ASGI (zoolito.asgi)."}, status=501)
+    try:
+        auth = await authenticate(request)
+    except exceptions.AuthenticationFailed as exc:
+        return error_response(exc)
+    if auth is None:
+        return error_response(exceptions.NotAuthenticated())
+    user, token = auth
+
+    if token.get('role') == 'guide':
+        channels = [GUIDES_CHANNEL, guide_channel(user.id)]
+    else:
+        channels = [user_channel(user.id)]
+
+    async def stream():
+        async with broker.subscribe(channels) as subscriber:
+            # eventos de los workers (dispatch_scheduled, match_requests)
+            outbox_relay.ensure_running()
+            yield b'retry: 5000\n\n'
+            while True:
+                if subscriber.overflowed:
+                    # se perdieron eventos: el cliente debe recargar sus listados
+                    subscriber.overflowed = False
+                    yield format_sse({'type': 'resync', 'data': {}})
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+                    continue
+                yield format_sse(event)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx no debe bufferear el stream
+    return response
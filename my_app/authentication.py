@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+USER_CACHE_PREFIX = 'zoolito:auth-user'
+
+
+def user_cache_key(user_id):
+    return f'{USER_CACHE_PREFIX}:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication que guarda el usuario en cache por AUTH_USER_CACHE_TIMEOUT
+    segundos, así las requests seguidas del mismo token (p.ej. el polling de los guías)
+    no consultan auth_user. El rol viaja como claim en el token (ver IsGuide), por lo
+    que la autorización tampoco necesita leer el perfil.
+    El cache se invalida en cada save y al borrar el usuario (signals.py).
+    """
+
+    def get_user(self, validated_token):
+        timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if not timeout or user_id is None:
+            return super().get_user(validated_token)
+
+        user = cache.get(user_cache_key(user_id))
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(user_cache_key(user_id), user, timeout)
+        return user
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    ModelBackend que trae el perfil junto con el usuario: el login (TokenObtainPairView)
+    necesita el rol para el claim y así sigue siendo una sola query.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.select_related('profile').get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # mismo costo que con un usuario existente (ver ModelBackend)
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,73 @@
+"""
+Ruteo de lecturas a las réplicas y ajustes de conexión de SQLite. Las réplicas y
+los PRAGMA se configuran por entorno en zoolito/settings.py (DB_*, SQLITE_*).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def read_from_replicas():
+    """Dentro del bloque las lecturas del ORM van a una réplica (si hay configuradas)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Dentro del bloque las lecturas van a 'default' aunque la request lea de réplicas:
+    para lo que no tolera el atraso de una réplica (cursores de sync, respuestas cacheadas).
+    """
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    """
+    Lecturas dentro de read_from_replicas() (las requests GET/HEAD, ver
+    ReadReplicaMiddleware) a una réplica al azar; todo lo demás a 'default'.
+    Las réplicas pueden ir atrasadas: un GET justo después de una escritura puede
+    no verla todavía. Las respuestas cacheadas y ?since= leen de 'default' (read_from_primary).
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and _replica_reads.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # también para instancias leídas de una réplica
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # todas las bases tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # el esquema llega a las réplicas por replicación
+        return db not in settings.DATABASE_REPLICAS
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # Django 5.0 no tiene init_command para SQLite: los PRAGMA van en cada conexión nueva
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# canales
+GUIDES_CHANNEL = 'guides'
+
+
+def guide_channel(guide_id):
+    return f'guide:{guide_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class _Subscriber:
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event):
+        # corre en el loop del suscriptor
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # cliente demasiado lento: se descarta y se le pide que resincronice
+            self.overflowed = True
+
+
+class EventBroker:
+    """
+    Pub/sub en memoria del proceso. Los suscriptores son conexiones SSE (corrutinas en
+    el loop de ASGI); publish() se puede llamar desde código sync (views, signals) en
+    cualquier thread. Con varios procesos cada uno tiene su propio broker: los eventos
+    sólo llegan a las conexiones del proceso que los publica (los de otros procesos
+    pasan por OutboxEvent, ver publish_via_outbox).
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({sub for subs in self._channels.values() for sub in subs})
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        sub = _Subscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(sub)
+        try:
+            yield sub
+        finally:
+            with self._lock:
+                for channel in channels:
+                    subs = self._channels.get(channel)
+                    if subs is not None:
+                        subs.discard(sub)
+                        if not subs:
+                            del self._channels[channel]
+
+    def publish(self, channels, event_type, data):
+        event = {'type': event_type, 'data': data}
+        with self._lock:
+            targets = {sub for channel in channels for sub in self._channels.get(channel, ())}
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, event)
+            except RuntimeError:
+                # el loop ya se cerró; la suscripción se limpia al salir del contexto
+                pass
+
+
+broker = EventBroker()
+
+
+def publish_on_commit(channels, event_type, data):
+    """Publica cuando la transacción actual hace commit (de inmediato si no hay transacción)."""
+    channels = list(channels)
+    transaction.on_commit(lambda: broker.publish(channels, event_type, data))
+
+
+def publish_via_outbox(events):
+    """
+    Para procesos sin conexiones SSE (workers): guarda [(channels, type, data)] en
+    OutboxEvent dentro de la transacción actual, así el evento existe si y sólo si el
+    cambio hizo commit. Lo entregan los procesos web con OutboxRelay.
+    """
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(channels=list(channels), event_type=event_type, data=data)
+        for channels, event_type, data in events
+    ])
+
+
+def prune_outbox(now=None):
+    """Borra los eventos que ya no va a leer ningún relay. Devuelve cuántos."""
+    now = now or timezone.now()
+    retention = timedelta(minutes=getattr(settings, 'EVENT_OUTBOX_RETENTION_MINUTES', 10))
+    return OutboxEvent.objects.filter(created_at__lt=now - retention).delete()[0]
+
+
+class OutboxRelay:
+    """
+    Lleva al broker de este proceso los eventos de OutboxEvent: un thread consulta la
+    tabla cada EVENT_OUTBOX_POLL_SECONDS mientras haya conexiones SSE abiertas
+    (ensure_running() al suscribirse). Lee los creados desde el último visto menos
+    EVENT_OUTBOX_OVERLAP_SECONDS, porque un evento con created_at anterior puede hacer
+    commit después, y descarta los ids ya entregados.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._thread = None
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._seen = {}
+
+    def ensure_running(self):
+        interval = getattr(settings, 'EVENT_OUTBOX_POLL_SECONDS', 1.0)
+        if not interval:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.reset()
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='outbox-relay', daemon=True)
+            self._thread.start()
+
+    def reset(self, now=None):
+        # sólo interesan los eventos posteriores a las suscripciones actuales
+        self._cursor = now or timezone.now()
+        self._seen = {}
+
+    def _run(self, interval):
+        stop = threading.Event()
+        try:
+            while True:
+                with self._lock:
+                    # sin conexiones termina; la próxima suscripción arranca otro thread
+                    if not self.broker.subscriber_count():
+                        self._thread = None
+                        return
+                try:
+                    self.poll()
+                except DatabaseError:
+                    logger.exception('No se pudieron leer los eventos de OutboxEvent')
+                    close_old_connections()
+                stop.wait(interval)
+        finally:
+            close_old_connections()
+
+    def poll(self):
+        """Publica en el broker los eventos nuevos. Devuelve cuántos."""
+        overlap = timedelta(seconds=getattr(settings, 'EVENT_OUTBOX_OVERLAP_SECONDS', 5))
+        rows = OutboxEvent.objects.filter(created_at__gte=self._cursor - overlap).order_by('id')\
+            .values_list('id', 'channels', 'event_type', 'data', 'created_at')
+        published = 0
+        for pk, channels, event_type, data, created_at in rows:
+            if pk in self._seen:
+                continue
+            self._seen[pk] = created_at
+            self._cursor = max(self._cursor, created_at)
+            self.broker.publish(channels, event_type, data)
+            published += 1
+        # los ids que quedaron fuera de la ventana ya no se vuelven a leer
+        self._seen = {pk: at for pk, at in self._seen.items() if at >= self._cursor - overlap}
+        return published
+
+
+outbox_relay = OutboxRelay(broker)
+
+
+def request_event_data(sr):
+    """Resumen de la solicitud para el evento, armado sin ir a la base."""
+    return {
+        'id': sr.id,
+        'service_type': sr.service_type,
+        'schedule_type': sr.schedule_type,
+        'scheduled_datetime': sr.scheduled_datetime,
+        'origin_text': sr.origin_text,
+        'origin_lat': sr.origin_lat,
+        'origin_lng': sr.origin_lng,
+        'dest_text': sr.dest_text,
+        'created_at': sr.created_at,
+    }
+
+
+def publish_milestones(milestones, owners):
+    """Avisa cada hito al dueño de la solicitud y al guía que lo registró. owners: {request_id: user_id}."""
+    for m in milestones:
+        channels = [guide_channel(m.recorded_by_id)]
+        if owners.get(m.request_id):
+            channels.append(user_channel(owners[m.request_id]))
+        publish_on_commit(channels, 'milestone.created', {
+            'request_id': m.request_id,
+            'milestone': m.milestone,
+            'recorded_at': m.recorded_at,
+        })
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n".encode()
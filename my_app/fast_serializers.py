@@ -0,0 +1,156 @@
+"""
+Serialización rápida (opcional) de los listados grandes de solicitudes: arma los dicts
+desde filas .values() con conversores precompilados por campo, sin instanciar modelos
+ni pasar por los Field de DRF. El JSON resultante es el mismo que el de
+ServiceRequestSerializer (FastSerializerTests lo compara byte a byte), así que sólo
+se usa en listados de sólo lectura; las escrituras siguen con los serializers de DRF.
+"""
+from decimal import Context, Decimal
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from rest_framework.settings import api_settings
+
+from .models import Pet, ServiceRating, ServiceRequest, ServiceRequestMilestone
+from .serializers import (
+    PetSerializer, ServiceRatingSerializer, ServiceRequestMilestoneSerializer, ServiceRequestSerializer,
+)
+
+
+def _datetime(value):
+    # igual que DateTimeField de DRF: zona horaria actual e ISO 8601 con 'Z' para UTC
+    if value is None:
+        return None
+    if settings.USE_TZ:
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _decimal(field):
+    # igual que DecimalField de DRF: cuantizado a decimal_places, como string salvo COERCE_DECIMAL_TO_STRING=False
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+    context = Context(prec=field.max_digits)
+    as_string = api_settings.COERCE_DECIMAL_TO_STRING
+
+    def convert(value):
+        if value is None:
+            return None
+        value = value.quantize(exponent, context=context)
+        return f'{value:f}' if as_string else value
+    return convert
+
+
+def _getter(model, name, column):
+    """Función fila -> valor JSON de la columna `column` (campo `name` de `model`)."""
+    field = model._meta.get_field(name)
+    get = itemgetter(column)
+    if isinstance(field, models.DateTimeField):
+        return lambda row: _datetime(get(row))
+    if isinstance(field, models.DecimalField):
+        convert = _decimal(field)
+        return lambda row: convert(get(row))
+    return get
+
+
+def _compile(model, names, prefix=''):
+    """[(campo, getter)] y columnas de .values() para campos de `model` sin relaciones anidadas."""
+    plan = [(name, _getter(model, name, prefix + name)) for name in names]
+    return plan, [prefix + name for name in names]
+
+
+class _Plan:
+    def __init__(self, fields):
+        names = [f for f in ServiceRequestSerializer.Meta.fields if fields is None or f in fields]
+        # id y created_at siempre: los usan los hitos y la paginación por cursor
+        self.columns = ['id', 'created_at']
+        self.getters = []
+        self.milestones = None
+        for name in names:
+            if name == 'pet_detail':
+                plan, columns = _compile(Pet, PetSerializer.Meta.fields, 'pet__')
+                self.getters.append((name, self.nested(plan, 'pet__id')))
+            elif name == 'rating':
+                plan, columns = _compile(ServiceRating, ServiceRatingSerializer.Meta.fields, 'rating__')
+                self.getters.append((name, self.nested(plan, 'rating__id')))
+            elif name == 'milestones':
+                # recorded_by es un StringRelatedField: str(User) es el username
+                columns = {f: 'recorded_by__username' if f == 'recorded_by' else f
+                           for f in ServiceRequestMilestoneSerializer.Meta.fields}
+                plan = [(f, itemgetter(c) if f == 'recorded_by' else _getter(ServiceRequestMilestone, f, c))
+                        for f, c in columns.items()]
+                self.milestones = (plan, ['request_id', *columns.values()])
+                self.getters.append((name, None))
+                continue
+            else:
+                plan, columns = _compile(ServiceRequest, [name])
+                self.getters.extend(plan)
+            self.columns.extend(c for c in columns if c not in self.columns)
+
+    @staticmethod
+    def nested(plan, pk_column):
+        def get(row):
+            if row[pk_column] is None:
+                return None
+            return {name: getter(row) for name, getter in plan}
+        return get
+
+    def milestones_by_request(self, request_ids):
+        plan, columns = self.milestones
+        grouped = {pk: [] for pk in request_ids}
+        # mismo orden que el prefetch de with_details() (Meta.ordering de los hitos)
+        for row in ServiceRequestMilestone.objects.filter(request_id__in=request_ids).values(*columns):
+            grouped[row['request_id']].append({name: getter(row) for name, getter in plan})
+        return grouped
+
+    def serialize(self, rows):
+        rows = list(rows)
+        milestones = self.milestones_by_request([row['id'] for row in rows]) if self.milestones else None
+        data = []
+        for row in rows:
+            item = {}
+            for name, getter in self.getters:
+                item[name] = milestones[row['id']] if getter is None else getter(row)
+            data.append(item)
+        return data
+
+
+@lru_cache(maxsize=None)
+def _plan(fields):
+    return _Plan(fields)
+
+
+class FastServiceRequestSerializer:
+    """
+    Reemplazo de ServiceRequestSerializer(many=True) para list_response: primero
+    prepare(queryset) y después FastServiceRequestSerializer(rows, many=True).data.
+    """
+    fields = None  # None: representación completa (ver for_fieldset)
+
+    def __init__(self, rows, many=True):
+        assert many, "FastServiceRequestSerializer sólo serializa listados"
+        self.rows = rows
+
+    @classmethod
+    def for_fieldset(cls, fields):
+        """Variante para los campos de ServiceRequestSerializer.fieldset_from_params."""
+        return cls if fields is None else _fieldset_class(tuple(fields))
+
+    @classmethod
+    def prepare(cls, queryset):
+        # .values() reemplaza a .only()/select_related; los hitos van en una query aparte
+        return queryset.prefetch_related(None).values(*_plan(cls.fields).columns)
+
+    @property
+    def data(self):
+        return _plan(self.fields).serialize(self.rows)
+
+
+@lru_cache(maxsize=None)
+def _fieldset_class(fields):
+    return type(FastServiceRequestSerializer.__name__, (FastServiceRequestSerializer,), {'fields': fields})
@@ -0,0 +1,56 @@
+import math
+
+# tamaño de celda de la grilla en grados (~1.1 km de lado en latitud)
+GRID_CELL_DEGREES = 0.01
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+# por encima de esta cantidad de celdas el IN deja de convenir y se filtra por bounding box
+MAX_CELLS_PER_QUERY = 400
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _row(lat):
+    return int(math.floor((float(lat) + 90) / GRID_CELL_DEGREES))
+
+
+def _col(lng):
+    return int(math.floor((float(lng) + 180) / GRID_CELL_DEGREES)) % GRID_COLUMNS
+
+
+def cell_for(lat, lng):
+    """Celda de la grilla para un punto, o None si falta alguna coordenada."""
+    if lat is None or lng is None:
+        return None
+    return _row(lat) * GRID_COLUMNS + _col(lng)
+
+
+def bounding_box(lat, lng, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) que contiene el círculo de radio radius_km."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    dlng = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180)
+    return (
+        max(lat - dlat, -90), min(lat + dlat, 90),
+        max(lng - dlng, -180), min(lng + dlng, 180),
+    )
+
+
+def cells_in_box(min_lat, max_lat, min_lng, max_lng, max_cells=MAX_CELLS_PER_QUERY):
+    """Lista de celdas que cubren el bounding box, o None si son más de max_cells."""
+    rows = range(_row(min_lat), _row(max_lat) + 1)
+    # _col(180) envuelve a la columna 0 (180 y -180 son el mismo meridiano): el rango
+    # termina en la última columna y, si la caja llega a 180, suma la 0
+    cols = list(range(_col(min_lng), min(int(math.floor((float(max_lng) + 180) / GRID_CELL_DEGREES)),
+                                         GRID_COLUMNS - 1) + 1))
+    if max_lng >= 180 and cols[0] != 0:
+        cols.append(0)
+    if max_cells is not None and len(rows) * len(cols) > max_cells:
+        return None
+    return [r * GRID_COLUMNS + c for r in rows for c in cols]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
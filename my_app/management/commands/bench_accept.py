@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from my_app.models import ServiceRequest
+
+
+class Command(BaseCommand):
+    help = (
+        "Hace competir a varios guías en paralelo por las mismas solicitudes vía "
+        "AcceptRequestView, verifica que cada una tenga un único ganador y mide el throughput. "
+        "Crea sus propios datos y los borra al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # los 400 de los perdedores son esperables, no los logueamos
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        threads = options['threads']
+        tag = uuid.uuid4().hex[:8]
+        owner = User.objects.create_user(username=f'bench-owner-{tag}')
+        guides = []
+        for i in range(threads):
+            guide = User.objects.create_user(username=f'bench-guide-{tag}-{i}')
+            guide.profile.role = 'guide'
+            guide.profile.save()
+            guides.append(guide)
+        requests = ServiceRequest.objects.bulk_create([
+            ServiceRequest(user=owner, service_type='paseo', schedule_type='immediate',
+                           origin_text='bench', dest_text='bench')
+            for _ in range(options['requests'])
+        ])
+
+        try:
+            winners, errors, elapsed = self.race(requests, guides)
+        finally:
+            User.objects.filter(username__startswith='bench-').filter(username__contains=tag).delete()
+
+        attempts = len(requests) * len(guides)
+        double = sum(1 for w in winners.values() if w > 1)
+        self.stdout.write(
+            f"{attempts} intentos en {elapsed:.3f}s ({attempts / elapsed:.0f} req/s), "
+            f"{len(winners)} solicitudes asignadas, {double} con más de un ganador, {errors} errores"
+        )
+        if double or len(winners) != len(requests):
+            self.stderr.write(self.style.ERROR("Asignación inconsistente"))
+
+    def race(self, requests, guides):
+        winners = {}
+        errors = 0
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(guides))
+
+        def worker(guide):
+            nonlocal errors
+            client = APIClient()
+            client.force_authenticate(guide)
+            barrier.wait()
+            try:
+                for sr in requests:
+                    response = client.post(reverse('request-accept', args=[sr.pk]))
+                    with lock:
+                        if response.status_code == 200:
+                            winners[sr.pk] = winners.get(sr.pk, 0) + 1
+                        elif response.status_code != 400:
+                            errors += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(g,)) for g in guides]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return winners, errors, time.perf_counter() - start
@@ -0,0 +1,121 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from my_app.serializers import get_tokens_for_user
+from .benchmark import benchmark_database, get_actors, percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el throughput con conexiones concurrentes de los endpoints de lectura por el "
+        "camino WSGI (APIView sync, un thread por conexión) y por el camino ASGI (vistas de "
+        "my_app/async_views.py en el event loop). Usa una base de test sembrada como benchmark. "
+        "La caché de respuestas queda desactivada en ambos caminos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                            help="Cantidad de conexiones simultáneas a probar")
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Requests totales por endpoint, camino y nivel de concurrencia")
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help="Threads del worker WSGI simulado (las conexiones extra esperan turno)")
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--guides', type=int, default=10)
+        parser.add_argument('--requests-per-user', type=int, default=20)
+        parser.add_argument('--only', nargs='*', help="Nombres de endpoints a medir")
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Usa la base configurada y los datos sembrados existentes en lugar de una base de test")
+
+    def handle(self, *args, **options):
+        with benchmark_database(options, self.stdout):
+            owner, guide = get_actors()
+            scenarios = [
+                ('user-history-requests', owner, reverse('user-history-requests'),
+                 reverse('async-user-history-requests')),
+                ('guide-available', guide, reverse('guide-available'), reverse('async-guide-available')),
+                ('guide-assigned', guide, reverse('guide-assigned'), reverse('async-guide-assigned')),
+                ('guide-profile', None, reverse('guide-profile', args=[guide.pk]),
+                 reverse('async-guide-profile', args=[guide.pk])),
+                ('me', owner, reverse('current-user'), reverse('async-current-user')),
+            ]
+            tokens = {user.pk: get_tokens_for_user(user)['access'] for user in (owner, guide)}
+
+            header = f"{'endpoint':24} {'conc':>5} {'wsgi req/s':>11} {'asgi req/s':>11} {'wsgi p95':>9} {'asgi p95':>9}"
+            self.stdout.write(header)
+            self.stdout.write('-' * len(header))
+            for name, user, sync_url, async_url in scenarios:
+                if options['only'] and name not in options['only']:
+                    continue
+                headers = {'Authorization': f'Bearer {tokens[user.pk]}'} if user else {}
+                for concurrency in options['concurrency']:
+                    # las vistas async no pasan por la caché de respuestas: sin ella en ambos
+                    # caminos para comparar el mismo trabajo (y cada corrida parte de cero)
+                    with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+                        cache.clear()
+                        wsgi = self.run_wsgi(sync_url, headers, concurrency, options)
+                        cache.clear()
+                        asgi = asyncio.run(self.run_asgi(async_url, headers, concurrency, options))
+                    self.stdout.write(
+                        f"{name:24} {concurrency:5d} {wsgi['rps']:11.1f} {asgi['rps']:11.1f} "
+                        f"{wsgi['p95_ms']:9.2f} {asgi['p95_ms']:9.2f}"
+                    )
+
+    def summarize(self, timings, elapsed):
+        return {
+            'rps': len(timings) / elapsed if elapsed else 0.0,
+            'p95_ms': percentile(timings, 95),
+            'mean_ms': statistics.fmean(timings),
+        }
+
+    def run_wsgi(self, url, headers, concurrency, options):
+        """Cada conexión ocupa un thread mientras espera; con más conexiones que threads hacen cola."""
+        per_connection = max(1, options['requests'] // concurrency)
+
+        def connection_loop():
+            client = Client()
+            timings = []
+            try:
+                for _ in range(per_connection):
+                    start = time.perf_counter()
+                    response = client.get(url, headers=headers)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    assert response.status_code == 200, (url, response.status_code)
+            finally:
+                # cada thread abre su propia conexión a la base
+                connections.close_all()
+            return timings
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, options['wsgi_threads'])) as pool:
+            start = time.perf_counter()
+            futures = [pool.submit(connection_loop) for _ in range(concurrency)]
+            timings = [t for f in futures for t in f.result()]
+            elapsed = time.perf_counter() - start
+        return self.summarize(timings, elapsed)
+
+    async def run_asgi(self, url, headers, concurrency, options):
+        """Las conexiones son corrutinas del mismo loop; el ORM async corre en el thread de sync_to_async."""
+        per_connection = max(1, options['requests'] // concurrency)
+        client = AsyncClient()
+
+        async def connection_loop():
+            timings = []
+            for _ in range(per_connection):
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, (url, response.status_code)
+            return timings
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(connection_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return self.summarize([t for timings in results for t in timings], elapsed)
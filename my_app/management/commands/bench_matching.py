@@ -0,0 +1,93 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from my_app import geo
+from my_app.matching import MatchGuide, MatchingParams, MatchRequest, run_matching, solve
+from my_app.models import GuideAvailability, ServiceRequest
+from .benchmark import benchmark_database, get_actors
+
+# centro de los datos sintéticos (Santiago) y dispersión en grados
+CENTER = (-33.45, -70.66)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el motor de asignación (my_app/matching.py) con datos sintéticos: solve() en memoria "
+        "para cada tamaño pedido y, con --db, una pasada completa de run_matching sobre una base de "
+        "test (lectura, resolución y escritura en una transacción)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, nargs='+', default=[1000, 5000])
+        parser.add_argument('--guides', type=int, nargs='+', default=[100, 500])
+        parser.add_argument('--spread', type=float, default=0.2,
+                            help="Dispersión de las ubicaciones en grados alrededor del centro")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--db', action='store_true', help="Mide también run_matching contra la base")
+
+    def handle(self, *args, **options):
+        params = MatchingParams.from_settings()
+        header = f"{'solicitudes':>11} {'guías':>6} {'matriz':>9} {'asignadas':>9} {'km prom':>8} {'ms':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for n_requests in options['requests']:
+            for n_guides in options['guides']:
+                requests, guides = self.synthetic(n_requests, n_guides, options)
+                start = time.perf_counter()
+                pairs = solve(requests, guides, params)
+                elapsed = (time.perf_counter() - start) * 1000
+                self.stdout.write(
+                    f"{n_requests:11d} {n_guides:6d} {n_requests * n_guides:9d} {len(pairs):9d} "
+                    f"{self.mean_distance(pairs, requests, guides):8.2f} {elapsed:9.1f}"
+                )
+        if options['db']:
+            self.bench_database(max(options['requests']), max(options['guides']), options)
+
+    def synthetic(self, n_requests, n_guides, options):
+        rng = random.Random(options['seed'])
+        spread = options['spread']
+
+        def point():
+            return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+        requests = [MatchRequest(i, *point()) for i in range(n_requests)]
+        guides = [MatchGuide(i, *point(), rng.uniform(3, 5), rng.choice([0, 0, 1])) for i in range(n_guides)]
+        return requests, guides
+
+    def mean_distance(self, pairs, requests, guides):
+        if not pairs:
+            return 0.0
+        requests = {r.id: r for r in requests}
+        guides = {g.id: g for g in guides}
+        return sum(geo.haversine_km(requests[r].lat, requests[r].lng, guides[g].lat, guides[g].lng)
+                   for r, g in pairs) / len(pairs)
+
+    def bench_database(self, n_requests, n_guides, options):
+        seed = {'use_current_db': False, 'users': 5, 'guides': 1, 'requests_per_user': 1}
+        with benchmark_database(seed, self.stdout):
+            owner, _ = get_actors()
+            requests, guides = self.synthetic(n_requests, n_guides, options)
+            ServiceRequest.objects.filter(assigned_guide__isnull=True).delete()
+            ServiceRequest.objects.bulk_create(
+                ServiceRequest(user=owner, service_type='paseo', schedule_type='immediate', origin_text='bench',
+                               dest_text='bench', origin_lat=round(r.lat, 7), origin_lng=round(r.lng, 7))
+                for r in requests
+            )
+            users = User.objects.bulk_create(User(username=f'bench-guide-{g.id}') for g in guides)
+            GuideAvailability.objects.bulk_create(
+                GuideAvailability(guide=user, available=True, lat=round(g.lat, 7), lng=round(g.lng, 7))
+                for user, g in zip(users, guides)
+            )
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                assigned = run_matching(now=timezone.now(), batch_size=n_requests)
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stdout.write(
+                f"run_matching: {n_requests} solicitudes x {n_guides} guías -> {len(assigned)} asignadas "
+                f"en {elapsed:.1f} ms, {len(ctx.captured_queries)} queries"
+            )
@@ -0,0 +1,93 @@
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from rest_framework.request import Request
+
+from my_app.throttling import IPTokenBucketThrottle
+from .benchmark import benchmark_database, get_actors, percentile
+
+UNLIMITED = '1000000000/s'
+
+
+class _View:
+    throttle_scope = 'bench'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el costo del token bucket de my_app/throttling.py: allow_request() aislado (con la caché "
+        "configurada) y el p50 de endpoints reales con y sin límite, incluido el rechazo de un registro "
+        "antes del hashing de la contraseña."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=20000, help="Llamadas a allow_request por escenario")
+        parser.add_argument('--iterations', type=int, default=200, help="Requests por endpoint")
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--guides', type=int, default=3)
+        parser.add_argument('--requests-per-user', type=int, default=5)
+        parser.add_argument('--use-current-db', action='store_true')
+
+    def handle(self, *args, **options):
+        self.stdout.write("allow_request()")
+        request = Request(RequestFactory().get('/'))
+        calls = options['calls']
+        with override_settings(RATE_LIMITS={'bench': UNLIMITED}):
+            self.report('misma IP, permitida', self.time_calls(request, calls, same_ip=True))
+            self.report('IP nueva en cada llamada', self.time_calls(request, calls, same_ip=False))
+        with override_settings(RATE_LIMITS={'bench': '1/day'}):
+            self.report('rechazada', self.time_calls(request, calls, same_ip=True))
+        with override_settings(RATE_LIMITS={}):
+            self.report('scope sin límite', self.time_calls(request, calls, same_ip=True))
+
+        with benchmark_database(options, self.stdout):
+            _, guide = get_actors()
+            profile = reverse('guide-profile', args=[guide.pk])
+            self.stdout.write("\nendpoints (p50 ms)")
+            with override_settings(RATE_LIMITS={}):
+                base = self.time_requests('get', profile, options['iterations'])
+            with override_settings(RATE_LIMITS={'guide-profile': UNLIMITED}):
+                limited = self.time_requests('get', profile, options['iterations'])
+            self.stdout.write(f"{'guide-profile sin límite':32} {percentile(base, 50):8.3f}")
+            self.stdout.write(f"{'guide-profile con límite':32} {percentile(limited, 50):8.3f} "
+                              f"(+{percentile(limited, 50) - percentile(base, 50):.3f})")
+
+            register = reverse('register')
+            with override_settings(RATE_LIMITS={'register': UNLIMITED}):
+                allowed = self.time_requests('post', register, 10, register=True)
+            with override_settings(RATE_LIMITS={'register': '1/day'}):
+                rejected = self.time_requests('post', register, options['iterations'], register=True)
+            self.stdout.write(f"{'register permitido (hashing)':32} {percentile(allowed, 50):8.3f}")
+            self.stdout.write(f"{'register rechazado (429)':32} {percentile(rejected, 50):8.3f}")
+
+    def report(self, name, timings):
+        self.stdout.write(f"{name:32} {statistics.fmean(timings) * 1e6:8.2f} µs/llamada")
+
+    def time_calls(self, request, calls, same_ip):
+        cache.clear()
+        throttle = IPTokenBucketThrottle()
+        view = _View()
+        timings = []
+        for i in range(calls):
+            request._request.META['REMOTE_ADDR'] = '10.0.0.1' if same_ip else f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+            start = time.perf_counter()
+            throttle.allow_request(request, view)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def time_requests(self, method, url, iterations, register=False):
+        cache.clear()
+        client = Client()
+        timings = []
+        for i in range(iterations):
+            data = {'username': f'bench-throttle-{time.time_ns()}-{i}', 'password': 'Bench-pass-123',
+                    'password2': 'Bench-pass-123'} if register else None
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code in (200, 201, 429), (url, response.status_code)
+        return timings
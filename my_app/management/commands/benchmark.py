@@ -0,0 +1,317 @@
+import json
+import logging
+import platform
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from my_app import urls as app_urls
+from my_app.models import Pet, ServiceRequest, ServiceRequestMilestone
+from my_app.serializers import get_tokens_for_user
+from my_app.sync import SINCE_PARAM, format_cursor
+from .seed_data import SEED_PASSWORD, SEED_PREFIX
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+@contextmanager
+def benchmark_database(options, stdout):
+    """
+    Base de test descartable sembrada con seed_data (o la base actual con
+    --use-current-db) durante el bloque.
+    """
+    # los 4xx esperables (p.ej. solicitudes ya asignadas) no interesan en la salida
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    setup_test_environment()
+    old_name = None
+    if not options['use_current_db']:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        if not options['use_current_db']:
+            call_command(
+                'seed_data', users=options['users'], guides=options['guides'],
+                requests_per_user=options['requests_per_user'], stdout=stdout,
+            )
+        cache.clear()
+        # los benchmarks repiten los endpoints mucho más rápido que cualquier RATE_LIMITS
+        with override_settings(RATE_LIMITS={}):
+            yield
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def get_actors():
+    """Usuario con más solicitudes y guía con más asignaciones entre los datos sembrados."""
+    seeded = User.objects.filter(username__startswith=SEED_PREFIX)
+    owner = seeded.filter(profile__role='user').annotate(n=Count('service_requests')).order_by('-n').first()
+    guide = seeded.filter(profile__role='guide').annotate(n=Count('assigned_requests')).order_by('-n').first()
+    if owner is None or guide is None:
+        raise CommandError("No hay datos sembrados; ejecute seed_data o quite --use-current-db")
+    return owner, guide
+
+
+# rutas de my_app/urls.py que no se miden: el stream SSE no termina y las variantes async
+# se comparan con bench_async
+UNBENCHMARKED = {'events'}
+UNBENCHMARKED_PREFIXES = ('async-',)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de la API: siembra datos (seed_data) en una base de test descartable, recorre "
+        "todas las rutas de my_app/urls.py con el cliente de test y reporta p50/p95, queries y pico "
+        "de memoria por endpoint. Puede guardar el resultado como JSON y compararlo con un baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--guides', type=int, default=10)
+        parser.add_argument('--requests-per-user', type=int, default=20)
+        parser.add_argument('--only', nargs='*', help="Nombres de endpoints a medir")
+        parser.add_argument('--output', help="Archivo JSON donde guardar los resultados")
+        parser.add_argument('--baseline', help="JSON de una corrida anterior para comparar")
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help="Porcentaje de aumento de p95 considerado regresión")
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Usa la base configurada y los datos sembrados existentes en lugar de una base de test")
+
+    def handle(self, *args, **options):
+        with benchmark_database(options, self.stdout):
+            results = self.run_benchmarks(options)
+
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'users': options['users'],
+                'guides': options['guides'],
+                'requests_per_user': options['requests_per_user'],
+            },
+            'endpoints': results,
+        }
+        self.print_report(results)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2, sort_keys=True)
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"Regresiones: {', '.join(regressions)}")
+
+    # escenarios
+
+    def fresh_requests(self, owner, count, guide=None, milestones=()):
+        """Solicitudes nuevas para los escenarios que modifican datos (una por iteración)."""
+        requests = []
+        for _ in range(count):
+            sr = ServiceRequest.objects.create(
+                user=owner, service_type='paseo', schedule_type='immediate',
+                origin_text='bench', dest_text='bench', assigned_guide=guide,
+                confirmed='delivered' in milestones,
+            )
+            for milestone in milestones:
+                ServiceRequestMilestone.objects.create(request=sr, milestone=milestone, recorded_by=guide)
+            requests.append(sr)
+        return iter(requests)
+
+    def build_scenarios(self, owner, guide, admin, total):
+        pet = Pet.objects.filter(owner=owner).first()
+        sample = ServiceRequest.objects.filter(user=owner).first()
+        pet_ids = list(Pet.objects.filter(owner=owner).values_list('id', flat=True)[:20])
+        request_ids = list(ServiceRequest.objects.filter(user=owner).values_list('id', flat=True)[:20])
+        # delta típico de una app que sincronizó hace un rato
+        since = {SINCE_PARAM: format_cursor(timezone.now() - timedelta(hours=1))}
+        located = ServiceRequest.objects.filter(assigned_guide__isnull=True, origin_lat__isnull=False).first()
+        counter = iter(range(10**9))
+        lazy = {}
+
+        def pool(name, factory):
+            # los fixtures de escenarios que escriben se crean sólo si el escenario se ejecuta
+            def next_item():
+                if name not in lazy:
+                    lazy[name] = factory()
+                return next(lazy[name])
+            return next_item
+
+        to_accept = pool('accept', lambda: self.fresh_requests(owner, total))
+        to_milestone = pool('milestone', lambda: self.fresh_requests(owner, total, guide))
+        to_batch = pool('batch', lambda: self.fresh_requests(owner, total, guide))
+        to_rate = pool('rate', lambda: self.fresh_requests(
+            owner, total, guide, milestones=('arrival_origin', 'pet_on_board', 'delivered')))
+
+        request_data = {'service_type': 'paseo', 'schedule_type': 'immediate',
+                        'origin_text': 'bench', 'dest_text': 'bench'}
+        nearby = {'lat': str(located.origin_lat), 'lng': str(located.origin_lng), 'radius': 5} if located else {}
+
+        return [
+            ('pets:list', owner, 'get', lambda: (reverse('pets'), None)),
+            ('pets:create', owner, 'post', lambda: (reverse('pets'), {'name': 'Bench'})),
+            ('pet-detail:get', owner, 'get', lambda: (reverse('pet-detail', args=[pet.pk]), None)),
+            ('pet-detail:patch', owner, 'patch', lambda: (reverse('pet-detail', args=[pet.pk]), {'notes': 'bench'})),
+            ('requests:list', owner, 'get', lambda: (reverse('requests'), None)),
+            ('requests:create', owner, 'post', lambda: (reverse('requests'), request_data)),
+            ('pet-bulk', owner, 'post', lambda: (reverse('pet-bulk'), [{'name': 'Bench'}] * 20)),
+            ('pet-bulk:patch', owner, 'patch', lambda: (reverse('pet-bulk'), [
+                {'id': pk, 'notes': 'bench'} for pk in pet_ids])),
+            ('request-bulk', owner, 'post', lambda: (reverse('request-bulk'), [request_data] * 20)),
+            ('request-bulk:patch', owner, 'patch', lambda: (reverse('request-bulk'), [
+                {'id': pk, 'observations': 'bench'} for pk in request_ids])),
+            ('request-detail:get', owner, 'get', lambda: (reverse('request-detail', args=[sample.pk]), None)),
+            ('register', None, 'post', lambda: (reverse('register'), {
+                'username': f'{SEED_PREFIX}bench_{next(counter)}', 'password': 'bench-pass-1',
+                'password2': 'bench-pass-1'})),
+            ('token', None, 'post', lambda: (reverse('token_obtain_pair'), {
+                'username': owner.username, 'password': SEED_PASSWORD})),
+            ('guide-available', guide, 'get', lambda: (reverse('guide-available'), None)),
+            ('guide-available:page', guide, 'get', lambda: (reverse('guide-available'), {'page_size': 20})),
+            ('guide-available:nearby', guide, 'get', lambda: (reverse('guide-available'), nearby)),
+            ('guide-assigned', guide, 'get', lambda: (reverse('guide-assigned'), None)),
+            ('guide-assigned:since', guide, 'get', lambda: (reverse('guide-assigned'), since)),
+            ('guide-availability:get', guide, 'get', lambda: (reverse('guide-availability'), None)),
+            ('guide-availability:patch', guide, 'patch', lambda: (reverse('guide-availability'), {
+                'available': True, 'lat': nearby.get('lat', '-33.45'), 'lng': nearby.get('lng', '-70.66')})),
+            ('request-accept', guide, 'post', lambda: (reverse('request-accept', args=[to_accept().pk]), None)),
+            ('request-milestones', guide, 'post', lambda: (
+                reverse('request-milestones', args=[to_milestone().pk]), {'milestone': 'arrival_origin'})),
+            ('milestone-batch', guide, 'post', lambda: (reverse('milestone-batch'), [
+                {'request': to_batch().pk, 'milestone': 'arrival_origin'}])),
+            ('me', owner, 'get', lambda: (reverse('current-user'), None)),
+            ('request-rating', owner, 'post', lambda: (
+                reverse('request-rating', args=[to_rate().pk]), {'stars': 5})),
+            ('pending-feedback', owner, 'get', lambda: (reverse('pending-feedback'), None)),
+            ('pending-feedback-count', owner, 'get', lambda: (reverse('pending-feedback-count'), None)),
+            ('milestone-analytics', admin, 'get', lambda: (reverse('milestone-analytics'), None)),
+            ('guide-profile', None, 'get', lambda: (reverse('guide-profile', args=[guide.pk]), None)),
+            ('user-history-requests', owner, 'get', lambda: (reverse('user-history-requests'), None)),
+            ('user-history-requests:page', owner, 'get', lambda: (reverse('user-history-requests'), {'page_size': 20})),
+            ('user-history-requests:since', owner, 'get', lambda: (reverse('user-history-requests'), since)),
+        ]
+
+    def run_benchmarks(self, options):
+        owner, guide = get_actors()
+        admin, _ = User.objects.get_or_create(username=f'{SEED_PREFIX}bench_admin', defaults={'is_staff': True})
+        iterations, warmup = options['iterations'], options['warmup']
+        clients = {None: APIClient()}
+        for user in (owner, guide, admin):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {get_tokens_for_user(user)['access']}")
+            clients[user.pk] = client
+
+        results = {}
+        covered = set()
+        for name, user, method, make in self.build_scenarios(owner, guide, admin, iterations + warmup + 1):
+            if options['only'] and name not in options['only']:
+                continue
+            client = clients[user.pk if user else None]
+            call = getattr(client, method)
+
+            def request():
+                url, data = make()
+                covered.add(resolve(url).url_name)
+                fmt = 'json' if method != 'get' else None
+                return call(url, data, format=fmt) if fmt else call(url, data)
+
+            for _ in range(warmup):
+                request()
+
+            timings, queries, statuses = [], [], set()
+            for _ in range(iterations):
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - start
+                timings.append(elapsed * 1000)
+                queries.append(len(ctx.captured_queries))
+                statuses.add(response.status_code)
+
+            # memoria en una pasada aparte para no inflar las latencias con tracemalloc
+            tracemalloc.start()
+            request()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'mean_ms': round(statistics.fmean(timings), 3),
+                'queries': max(queries),
+                'peak_kb': round(peak / 1024, 1),
+                'status': sorted(statuses),
+            }
+        if not options['only']:
+            self.warn_uncovered(covered)
+        return results
+
+    def warn_uncovered(self, covered):
+        """Avisa de las rutas de my_app/urls.py sin escenario, para que no queden fuera del baseline."""
+        missing = sorted(
+            p.name for p in app_urls.urlpatterns
+            if p.name not in covered and p.name not in UNBENCHMARKED and not p.name.startswith(UNBENCHMARKED_PREFIXES)
+        )
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Rutas sin escenario de benchmark: {', '.join(missing)}"))
+
+    # reporte
+
+    def print_report(self, results):
+        header = f"{'endpoint':32} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KB':>9}  status"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:32} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['queries']:8d} {r['peak_kb']:9.1f}  "
+                f"{','.join(map(str, r['status']))}"
+            )
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)['endpoints']
+        regressions = []
+        self.stdout.write(f"\nComparación con {baseline_path}")
+        for name, r in results.items():
+            base = baseline.get(name)
+            if not base:
+                self.stdout.write(f"{name:32} (sin baseline)")
+                continue
+            delta = (r['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0.0
+            flags = []
+            if delta > threshold:
+                flags.append('p95')
+            if r['queries'] > base['queries']:
+                flags.append('queries')
+            if flags:
+                regressions.append(name)
+            line = (f"{name:32} p95 {base['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms ({delta:+.1f}%), "
+                    f"queries {base['queries']} -> {r['queries']}")
+            self.stdout.write(self.style.ERROR(line + '  REGRESIÓN') if flags else line)
+        return regressions
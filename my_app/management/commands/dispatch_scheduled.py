@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from my_app.events import prune_outbox
+from my_app.scheduling import release_due_requests, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Libera al listado de los guías las solicitudes programadas que entran en "
+        "SCHEDULED_RELEASE_LEAD_MINUTES y envía los recordatorios de SCHEDULED_REMINDER_LEAD_MINUTES. "
+        "Sin --loop hace una sola pasada (para cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Repite la pasada cada --interval segundos")
+        parser.add_argument('--interval', type=float, default=30)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            # en un worker de larga duración las conexiones se renuevan como en cada request
+            close_old_connections()
+            released = release_due_requests(batch_size=options['batch_size'])
+            reminded = send_due_reminders(batch_size=options['batch_size'])
+            prune_outbox()
+            if released or reminded or not options['loop']:
+                self.stdout.write(f"{released} solicitudes liberadas, {reminded} recordatorios enviados")
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
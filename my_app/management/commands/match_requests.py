@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from my_app.events import prune_outbox
+from my_app.matching import run_matching
+
+
+class Command(BaseCommand):
+    help = (
+        "Asigna en bloque las solicitudes del pool a los guías disponibles (ver my_app/matching.py). "
+        "Sin --loop hace una sola pasada (para cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Repite la pasada cada --interval segundos")
+        parser.add_argument('--interval', type=float, default=15)
+        parser.add_argument('--batch-size', type=int, help="Solicitudes por pasada (MATCHING_BATCH_SIZE)")
+
+    def handle(self, *args, **options):
+        if isinstance(cache, LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                "La caché es local (LocMemCache): los procesos web seguirán sirviendo el historial "
+                "cacheado previo a la asignación hasta RESPONSE_CACHE_TIMEOUT. Configurar REDIS_URL."
+            ))
+        while True:
+            close_old_connections()
+            assigned = run_matching(batch_size=options['batch_size'])
+            prune_outbox()
+            if assigned or not options['loop']:
+                self.stdout.write(f"{len(assigned)} solicitudes asignadas")
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
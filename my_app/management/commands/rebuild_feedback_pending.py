@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from my_app.models import ServiceRequest
+
+
+class Command(BaseCommand):
+    help = "Recalcula feedback_pending (entregadas con guía y sin calificar) para filas creadas antes del campo."
+
+    def handle(self, *args, **options):
+        pending = ServiceRequest.objects.filter(confirmed=True, assigned_guide__isnull=False, rating__isnull=True)
+        marked = ServiceRequest.objects.filter(feedback_pending=False, pk__in=pending.values('pk'))\
+            .update(feedback_pending=True)
+        cleared = ServiceRequest.objects.filter(feedback_pending=True).exclude(pk__in=pending.values('pk'))\
+            .update(feedback_pending=False)
+        self.stdout.write(self.style.SUCCESS(f"{marked} marcadas y {cleared} desmarcadas"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from my_app.models import GuideRatingStats
+
+
+class Command(BaseCommand):
+    help = "Reconstruye GuideRatingStats desde ServiceRating."
+
+    def handle(self, *args, **options):
+        total = GuideRatingStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{total} guías actualizados"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from my_app import geo
+from my_app.models import ServiceRequest
+
+
+class Command(BaseCommand):
+    help = "Recalcula origin_cell de las solicitudes (necesario para filas creadas antes del índice espacial)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        qs = ServiceRequest.objects.only('id', 'origin_lat', 'origin_lng', 'origin_cell').order_by('id')
+        batch = []
+        updated = 0
+        for sr in qs.iterator(chunk_size=batch_size):
+            cell = geo.cell_for(sr.origin_lat, sr.origin_lng)
+            if cell != sr.origin_cell:
+                sr.origin_cell = cell
+                batch.append(sr)
+            if len(batch) >= batch_size:
+                ServiceRequest.objects.bulk_update(batch, ['origin_cell'], touch=False)
+                updated += len(batch)
+                batch = []
+        if batch:
+            ServiceRequest.objects.bulk_update(batch, ['origin_cell'], touch=False)
+            updated += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"{updated} solicitudes actualizadas"))
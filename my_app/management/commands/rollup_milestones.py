@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from my_app.analytics import GROUP_FIELDS, rollup_days, summarize, update_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Actualiza los resúmenes diarios de duración de etapas (MilestoneDailySummary) desde el último "
+        "día resumido, o recalcula --from/--to completo. Con --report imprime p50/p95 (--from/--to o los últimos 30 días)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='first_day', type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument('--to', dest='last_day', type=date.fromisoformat, help="AAAA-MM-DD (por defecto hoy)")
+        parser.add_argument('--report', choices=sorted(GROUP_FIELDS), help="Agrupar el reporte por guía o servicio")
+
+    def handle(self, *args, **options):
+        last_day = options['last_day'] or timezone.localdate()
+        if options['first_day']:
+            if options['first_day'] > last_day:
+                raise CommandError("--from posterior a --to")
+            first_day = options['first_day']
+            rows = rollup_days(first_day, last_day)
+        else:
+            done = update_summaries(last_day)
+            if done is None:
+                self.stdout.write("No hay entregas registradas")
+                return
+            first_day, _, rows = done
+        self.stdout.write(self.style.SUCCESS(f"{rows} resúmenes guardados ({first_day} a {last_day})"))
+
+        if options['report']:
+            # con --from el rango pedido; si no, los últimos 30 días
+            first_day = options['first_day'] or last_day - timedelta(days=29)
+            self.stdout.write(f"{first_day} a {last_day}")
+            results = summarize(first_day, last_day, options['report'])
+            field = GROUP_FIELDS[options['report']]
+            header = f"{field:>14} {'etapa':>7} {'n':>6} {'prom s':>9} {'p50 s':>9} {'p95 s':>9}"
+            self.stdout.write(header)
+            self.stdout.write('-' * len(header))
+            for row in results:
+                self.stdout.write(
+                    f"{str(row[field]):>14} {row['stage']:>7} {row['count']:6d} {row['avg_seconds']:9.1f} "
+                    f"{row['p50_seconds']:9.1f} {row['p95_seconds']:9.1f}"
+                )
@@ -0,0 +1,131 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from my_app.models import (
+    MILESTONE_CHOICES, GuideRatingStats, Pet, Profile, ServiceRating, ServiceRequest, ServiceRequestMilestone,
+)
+
+SEED_PREFIX = 'seed_'
+SEED_PASSWORD = 'seed-password'
+
+# área de referencia para coordenadas (Santiago)
+CENTER_LAT = -33.45
+CENTER_LNG = -70.66
+SPREAD_DEGREES = 0.15
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera usuarios, guías, mascotas, solicitudes, hitos y calificaciones de prueba "
+        f"a escala configurable. Los usuarios se crean con prefijo '{SEED_PREFIX}' y "
+        f"contraseña '{SEED_PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--guides', type=int, default=10)
+        parser.add_argument('--pets-per-user', type=int, default=2)
+        parser.add_argument('--requests-per-user', type=int, default=20)
+        parser.add_argument('--assigned-ratio', type=float, default=0.6,
+                            help="Fracción de solicitudes asignadas a un guía")
+        parser.add_argument('--delivered-ratio', type=float, default=0.7,
+                            help="Fracción de las asignadas que llegan a 'delivered'")
+        parser.add_argument('--rated-ratio', type=float, default=0.6,
+                            help="Fracción de las entregadas que tienen calificación")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help="Borra los datos sembrados antes de generar")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        if options['clear']:
+            User.objects.filter(username__startswith=SEED_PREFIX).delete()
+
+        tag = f"{SEED_PREFIX}{timezone.now():%Y%m%d%H%M%S}_{rnd.randrange(10**6)}"
+        password = make_password(SEED_PASSWORD)  # un solo hash, es lo más caro de sembrar
+        users = User.objects.bulk_create(
+            [User(username=f'{tag}_user{i}', password=password) for i in range(options['users'])]
+            + [User(username=f'{tag}_guide{i}', password=password, first_name='Guía', last_name=str(i))
+               for i in range(options['guides'])],
+            batch_size=batch_size,
+        )
+        owners = users[:options['users']]
+        guides = users[options['users']:]
+        # bulk_create no dispara signals: los perfiles se crean acá
+        Profile.objects.bulk_create(
+            [Profile(user=u, role='user') for u in owners] + [Profile(user=g, role='guide') for g in guides],
+            batch_size=batch_size,
+        )
+
+        pets = Pet.objects.bulk_create([
+            Pet(owner=owner, name=f'Mascota {i}', species=rnd.choice(['perro', 'gato']), notes='x' * 200)
+            for owner in owners for i in range(options['pets_per_user'])
+        ], batch_size=batch_size)
+        pets_by_owner = {}
+        for pet in pets:
+            pets_by_owner.setdefault(pet.owner_id, []).append(pet)
+
+        now = timezone.now()
+        requests = []
+        for owner in owners:
+            for _ in range(options['requests_per_user']):
+                lat = Decimal(f'{CENTER_LAT + rnd.uniform(-SPREAD_DEGREES, SPREAD_DEGREES):.7f}')
+                lng = Decimal(f'{CENTER_LNG + rnd.uniform(-SPREAD_DEGREES, SPREAD_DEGREES):.7f}')
+                assigned = bool(guides) and rnd.random() < options['assigned_ratio']
+                requests.append(ServiceRequest(
+                    user=owner,
+                    service_type=rnd.choice(ServiceRequest.SERVICE_CHOICES)[0],
+                    schedule_type='immediate',
+                    origin_text='Origen sembrado', origin_lat=lat, origin_lng=lng,
+                    dest_text='Destino sembrado',
+                    pet=rnd.choice(pets_by_owner[owner.id]) if owner.id in pets_by_owner else None,
+                    observations='o' * rnd.randrange(0, 500),
+                    assigned_guide=rnd.choice(guides) if assigned else None,
+                ))
+        requests = ServiceRequest.objects.bulk_create(requests, batch_size=batch_size)
+
+        milestones = []
+        ratings = []
+        delivered_ids = []
+        order = [m[0] for m in MILESTONE_CHOICES]
+        for sr in requests:
+            if not sr.assigned_guide_id:
+                continue
+            done = len(order) if rnd.random() < options['delivered_ratio'] else rnd.randrange(len(order))
+            for milestone in order[:done]:
+                milestones.append(ServiceRequestMilestone(request=sr, milestone=milestone, recorded_by_id=sr.assigned_guide_id))
+            if done == len(order):
+                delivered_ids.append(sr.id)
+                if rnd.random() < options['rated_ratio']:
+                    ratings.append(ServiceRating(request=sr, user_id=sr.user_id, guide_id=sr.assigned_guide_id,
+                                                 stars=rnd.randint(1, 5), comment='Sembrado'))
+        ServiceRequestMilestone.objects.bulk_create(milestones, batch_size=batch_size)
+        ServiceRating.objects.bulk_create(ratings, batch_size=batch_size)
+        rated_ids = {rating.request.id for rating in ratings}
+        for start in range(0, len(delivered_ids), batch_size):
+            chunk = delivered_ids[start:start + batch_size]
+            ServiceRequest.objects.filter(id__in=chunk).update(confirmed=True)
+            ServiceRequest.objects.filter(id__in=[pk for pk in chunk if pk not in rated_ids]).update(feedback_pending=True)
+
+        # fechas repartidas en el último año para que el orden por created_at sea realista
+        # (auto_now_add ignora los valores pasados a bulk_create)
+        for start in range(0, len(requests), batch_size):
+            chunk = requests[start:start + batch_size]
+            for sr in chunk:
+                sr.created_at = now - timedelta(minutes=rnd.randrange(0, 60 * 24 * 365))
+            ServiceRequest.objects.bulk_update(chunk, ['created_at'], touch=False)
+
+        GuideRatingStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(owners)} usuarios, {len(guides)} guías, {len(pets)} mascotas, {len(requests)} solicitudes, "
+            f"{len(milestones)} hitos, {len(ratings)} calificaciones (prefijo {tag})"
+        ))
@@ -0,0 +1,173 @@
+"""
+Asignación automática por lotes (comando match_requests): junta las solicitudes del
+pool con ubicación de origen y los guías disponibles con ubicación reciente
+(GuideAvailability), puntúa cada par y asigna en bloque en una sola transacción.
+
+Costo de un par, en km "equivalentes" (menor es mejor):
+    distancia + MATCHING_LOAD_PENALTY_KM * solicitudes activas del guía
+              + MATCHING_RATING_WEIGHT_KM * (5 - promedio de calificaciones)
+
+solve() es greedy sobre un heap de pares: sólo se generan los pares dentro de
+MATCHING_MAX_DISTANCE_KM (guías indexados por celda de geo.py, sin matriz completa
+solicitudes x guías) y cuando un guía suma una asignación sus pares pendientes se
+reevalúan con la carga nueva al salir del heap.
+"""
+import heapq
+import math
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import geo
+from .events import GUIDES_CHANNEL, guide_channel, publish_via_outbox
+from .models import GuideAvailability, GuideRatingStats, ServiceRequest
+from .response_cache import invalidate, user_history_scope
+
+# promedio que se usa para los guías sin calificaciones
+UNRATED_AVG = 3.0
+# cuántas solicitudes se asignan por UPDATE
+WRITE_CHUNK_SIZE = 500
+
+MatchRequest = namedtuple('MatchRequest', 'id lat lng')
+MatchGuide = namedtuple('MatchGuide', 'id lat lng rating_avg load')
+
+
+class MatchingParams(namedtuple('MatchingParams', 'max_distance_km max_active load_penalty_km rating_weight_km')):
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_distance_km=getattr(settings, 'MATCHING_MAX_DISTANCE_KM', 10),
+            max_active=getattr(settings, 'MATCHING_MAX_ACTIVE_PER_GUIDE', 2),
+            load_penalty_km=getattr(settings, 'MATCHING_LOAD_PENALTY_KM', 2.0),
+            rating_weight_km=getattr(settings, 'MATCHING_RATING_WEIGHT_KM', 1.0),
+        )
+
+    def cost(self, distance_km, rating_avg, load):
+        return distance_km + self.load_penalty_km * load + self.rating_weight_km * (5 - rating_avg)
+
+
+def solve(requests, guides, params):
+    """
+    requests: [MatchRequest] en orden de prioridad (a igual costo gana la primera).
+    guides: [MatchGuide] con la carga actual. Devuelve [(request_id, guide_id)].
+    """
+    by_cell = defaultdict(list)
+    for guide in guides:
+        if guide.load < params.max_active:
+            by_cell[geo.cell_for(guide.lat, guide.lng)].append(guide)
+    # las solicitudes de una misma celda comparten candidatos: la caja se agranda dos celdas
+    margin_km = 2 * geo.GRID_CELL_DEGREES * geo.KM_PER_DEGREE_LAT
+    nearby_by_cell = {}
+
+    pairs = []
+    for order, request in enumerate(requests):
+        cell = geo.cell_for(request.lat, request.lng)
+        if cell not in nearby_by_cell:
+            # en memoria no hay límite de celdas como en el IN de near()
+            cells = geo.cells_in_box(*geo.bounding_box(request.lat, request.lng, params.max_distance_km + margin_km),
+                                     max_cells=None)
+            nearby_by_cell[cell] = [g for c in cells for g in by_cell.get(c, ())]
+        # a menos de max_distance_km la aproximación equirectangular difiere de haversine
+        # en menos de un 0,1% y evita la trigonometría por par
+        km_per_degree_lng = geo.KM_PER_DEGREE_LAT * math.cos(math.radians(request.lat))
+        for guide in nearby_by_cell[cell]:
+            distance = math.hypot((guide.lat - request.lat) * geo.KM_PER_DEGREE_LAT,
+                                  (guide.lng - request.lng) * km_per_degree_lng)
+            if distance <= params.max_distance_km:
+                pairs.append((params.cost(distance, guide.rating_avg, guide.load), order,
+                              request.id, guide.id, guide.load, distance))
+    heapq.heapify(pairs)
+
+    load = {guide.id: guide.load for guide in guides}
+    rating = {guide.id: guide.rating_avg for guide in guides}
+    assigned = set()
+    result = []
+    while pairs:
+        cost, order, request_id, guide_id, seen_load, distance = heapq.heappop(pairs)
+        if request_id in assigned or load[guide_id] >= params.max_active:
+            continue
+        if load[guide_id] != seen_load:
+            # el costo sólo sube con la carga: se reinserta y se compara contra el resto
+            heapq.heappush(pairs, (params.cost(distance, rating[guide_id], load[guide_id]), order,
+                                   request_id, guide_id, load[guide_id], distance))
+            continue
+        assigned.add(request_id)
+        load[guide_id] += 1
+        result.append((request_id, guide_id))
+    return result
+
+
+def load_guides(now):
+    """Guías disponibles con ubicación reciente, con su calificación y carga (3 queries)."""
+    fresh = now - timedelta(minutes=getattr(settings, 'MATCHING_LOCATION_MAX_AGE_MINUTES', 15))
+    rows = list(GuideAvailability.objects.filter(available=True, updated_at__gte=fresh, lat__isnull=False,
+                                                 lng__isnull=False).values_list('guide_id', 'lat', 'lng'))
+    ids = [guide_id for guide_id, _, _ in rows]
+    if not ids:
+        return []
+    ratings = {
+        guide_id: rating_sum / rating_count
+        for guide_id, rating_sum, rating_count in GuideRatingStats.objects.filter(guide_id__in=ids, rating_count__gt=0)
+        .values_list('guide_id', 'rating_sum', 'rating_count')
+    }
+    # activas: asignadas y todavía no entregadas
+    loads = dict(ServiceRequest.objects.filter(assigned_guide__in=ids, confirmed=False).order_by()
+                 .values('assigned_guide').annotate(n=models.Count('id')).values_list('assigned_guide', 'n'))
+    return [MatchGuide(guide_id, float(lat), float(lng), ratings.get(guide_id, UNRATED_AVG), loads.get(guide_id, 0))
+            for guide_id, lat, lng in rows]
+
+
+def load_requests(batch_size):
+    """Las batch_size solicitudes más antiguas del pool con ubicación de origen."""
+    rows = ServiceRequest.objects.in_pool().filter(origin_lat__isnull=False, origin_lng__isnull=False)\
+        .order_by('created_at', 'id').values_list('id', 'origin_lat', 'origin_lng')[:batch_size]
+    return [MatchRequest(pk, float(lat), float(lng)) for pk, lat, lng in rows]
+
+
+def write_assignments(pairs, now):
+    """
+    Aplica las asignaciones en una transacción, con un UPDATE condicional (sigue en el
+    pool) por cada WRITE_CHUNK_SIZE solicitudes. Devuelve las que efectivamente se
+    asignaron: las que un guía aceptó mientras tanto quedan con ese guía.
+    Corre en el proceso de match_requests: los eventos van por el outbox y la
+    invalidación del historial sólo llega a los procesos web con una caché compartida.
+    """
+    written = []
+    owners = set()
+    with transaction.atomic():
+        for start in range(0, len(pairs), WRITE_CHUNK_SIZE):
+            chunk = dict(pairs[start:start + WRITE_CHUNK_SIZE])
+            ServiceRequest.objects.in_pool().filter(pk__in=chunk).update(
+                assigned_guide=models.Case(
+                    *[models.When(pk=request_id, then=models.Value(guide_id)) for request_id, guide_id in chunk.items()],
+                    output_field=models.IntegerField(),
+                ),
+                updated_at=now,
+            )
+            for request_id, guide_id, user_id in ServiceRequest.objects.filter(pk__in=chunk)\
+                    .values_list('id', 'assigned_guide_id', 'user_id'):
+                if chunk[request_id] == guide_id:
+                    written.append((request_id, guide_id))
+                    if user_id:
+                        owners.add(user_id)
+        # update() no dispara signals
+        if owners:
+            invalidate(*(user_history_scope(user_id) for user_id in owners))
+        publish_via_outbox([([GUIDES_CHANNEL, guide_channel(guide_id)], 'request.accepted',
+                             {'id': request_id, 'guide_id': guide_id}) for request_id, guide_id in written])
+    return written
+
+
+def run_matching(now=None, batch_size=None):
+    """Una pasada completa: lee, resuelve y escribe. Devuelve [(request_id, guide_id)]."""
+    now = now or timezone.now()
+    params = MatchingParams.from_settings()
+    guides = load_guides(now)
+    if not guides:
+        return []
+    requests = load_requests(batch_size or getattr(settings, 'MATCHING_BATCH_SIZE', 2000))
+    pairs = solve(requests, guides, params)
+    return write_assignments(pairs, now) if pairs else []
@@ -0,0 +1,159 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .db import read_from_replicas
+
+logger = logging.getLogger('my_app.profiling')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.05,        # fracción de requests instrumentadas
+    'SLOW_REQUEST_MS': 500,     # se loguea si la request supera este tiempo...
+    'SLOW_QUERY_COUNT': 30,     # ...o esta cantidad de queries
+    'SERVER_TIMING': True,      # agrega la cabecera Server-Timing
+    'MAX_DUPLICATES': 5,        # fingerprints repetidos incluidos en el log
+}
+
+
+def get_profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+class _QueryRecorder:
+    """execute_wrapper que acumula cantidad, tiempo y SQL (sin parámetros) de cada query."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[sql] += 1
+
+
+class RequestProfilingMiddleware:
+    """
+    Mide por request el tiempo total, la cantidad de queries, el tiempo en SQL y las
+    queries repetidas (mismo SQL, típico de un N+1). Con muestreo (SAMPLE_RATE) el
+    costo en producción queda acotado a las requests elegidas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_profiling_settings()
+        # bajo ASGI con vistas async no forzamos el pasaje a un thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.config['ENABLED'] and random.random() < self.config['SAMPLE_RATE']
+
+    def record_queries(self, recorder):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        recorder = _QueryRecorder()
+        start = time.perf_counter()
+        with self.record_queries(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, start, recorder)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        recorder = _QueryRecorder()
+        start = time.perf_counter()
+        # las conexiones son por thread: el wrapper se instala en el thread donde
+        # sync_to_async (thread_sensitive) ejecuta el ORM de esta request
+        stack = await sync_to_async(self.record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, start, recorder)
+
+    def finish(self, request, response, start, recorder):
+        config = self.config
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.duration * 1000
+
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = (
+                f'app;dur={total_ms:.1f}, '
+                f'db;dur={db_ms:.1f};desc="{recorder.count} queries"'
+            )
+
+        if total_ms >= config['SLOW_REQUEST_MS'] or recorder.count >= config['SLOW_QUERY_COUNT']:
+            self.log_slow_request(request, response, total_ms, db_ms, recorder)
+        return response
+
+    def log_slow_request(self, request, response, total_ms, db_ms, recorder):
+        match = getattr(request, 'resolver_match', None)
+        duplicates = [
+            {'sql': sql, 'count': count}
+            for sql, count in recorder.fingerprints.most_common(self.config['MAX_DUPLICATES'])
+            if count > 1
+        ]
+        record = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 1),
+            'db_ms': round(db_ms, 1),
+            'queries': recorder.count,
+            'duplicates': duplicates,
+        }
+        logger.warning(json.dumps(record), extra={'profile': record})
+
+
+class ReadReplicaMiddleware:
+    """Las requests GET/HEAD leen de las réplicas configuradas (my_app.db.ReadReplicaRouter)."""
+
+    sync_capable = True
+    async_capable = True
+    read_methods = ('GET', 'HEAD')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in self.read_methods:
+            return self.get_response(request)
+        with read_from_replicas():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in self.read_methods:
+            return await self.get_response(request)
+        # sync_to_async copia el contexto: el ORM en el thread también ve la marca
+        with read_from_replicas():
+            return await self.get_response(request)
@@ -1,5 +1,12 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
+from . import geo
 
 ROLE_CHOICES = [
     ('user', 'Usuario'),
@@ -19,7 +26,66 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
-class Pet(models.Model):
+def scheduled_release_lead():
+    """Anticipación con la que una solicitud programada entra al pool de los guías."""
+    return timedelta(minutes=getattr(settings, 'SCHEDULED_RELEASE_LEAD_MINUTES', 60))
+
+class ChangeTrackingModel(models.Model):
+    """
+    Recuerda los valores leídos de la base y en save() sin update_fields escribe sólo
+    las columnas que cambiaron; si no cambió ninguna, no hay UPDATE (ni signals).
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self):
+        # los campos diferidos (.only()/.defer()) no están en __dict__ y no se comparan
+        self._loaded_values = {
+            f.attname: self.__dict__[f.attname]
+            for f in self._meta.concrete_fields if f.attname in self.__dict__
+        }
+
+    def changed_fields(self):
+        """Campos modificados desde la lectura, o None si la instancia no viene de la base."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.attname in self.__dict__
+            and (f.attname not in loaded or self.__dict__[f.attname] != loaded[f.attname])
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            changed = self.changed_fields()
+            if changed is not None:
+                if not changed:
+                    return
+                kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._snapshot()
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        loaded = getattr(self, '_loaded_values', {})
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None:
+            self._snapshot()
+            return
+        for name in fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+        self._loaded_values = loaded
+
+class Pet(ChangeTrackingModel):
     owner = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -34,7 +100,117 @@ class Pet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
-class ServiceRequest(models.Model):
+class ServiceRequestQuerySet(models.QuerySet):
+    def with_details(self):
+        # trae pet, rating y milestones (con recorded_by) en un número fijo de queries,
+        # sin importar cuántas filas serialice ServiceRequestSerializer
+        return self.select_related('pet', 'rating').prefetch_related(
+            models.Prefetch(
+                'milestones',
+                queryset=ServiceRequestMilestone.objects.select_related('recorded_by'),
+            )
+        )
+
+    def for_fieldset(self, fields=None):
+        """
+        Como with_details(), pero para una representación parcial de ServiceRequestSerializer
+        (`fields`, ver fieldset_from_params): sólo lee las columnas y relaciones que se
+        van a serializar. Con fields=None trae todo.
+        """
+        if fields is None:
+            return self.with_details()
+        fields = set(fields)
+        # id y created_at siempre: los usa la paginación por cursor
+        columns = {'id', 'created_at'} | (fields - {'pet_detail', 'milestones', 'rating'})
+        qs = self
+        if 'pet_detail' in fields:
+            columns.add('pet')
+            qs = qs.select_related('pet')
+        if 'rating' in fields:
+            qs = qs.select_related('rating')
+        if 'milestones' in fields:
+            qs = qs.prefetch_related(models.Prefetch(
+                'milestones',
+                queryset=ServiceRequestMilestone.objects.select_related('recorded_by'),
+            ))
+        return qs.only(*columns)
+
+    def in_pool(self):
+        """Solicitudes que los guías pueden tomar: sin asignar y, si son programadas, ya liberadas."""
+        return self.filter(assigned_guide__isnull=True).filter(
+            models.Q(schedule_type='immediate') | models.Q(released_at__isnull=False)
+        )
+
+    def near(self, lat, lng, radius_km):
+        # prefiltro por celdas de la grilla (indexadas) y bounding box; el radio exacto
+        # se calcula después con haversine sobre los candidatos
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius_km)
+        qs = self.filter(
+            origin_lat__gte=min_lat, origin_lat__lte=max_lat,
+            origin_lng__gte=min_lng, origin_lng__lte=max_lng,
+        )
+        cells = geo.cells_in_box(min_lat, max_lat, min_lng, max_lng)
+        # con demasiadas celdas queda el bounding box, por sr_pool_origin_idx en el pool
+        if cells is not None:
+            qs = qs.filter(origin_cell__in=cells)
+        return qs
+
+    # bulk_create/bulk_update no llaman a save(): la celda de origen se mantiene acá
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        now = timezone.now()
+        for obj in objs:
+            obj.origin_cell = geo.cell_for(obj.origin_lat, obj.origin_lng)
+            obj.release_if_due(now)
+            obj.feedback_pending = obj.confirmed and obj.assigned_guide_id is not None
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, touch=True, **kwargs):
+        """`touch=False` para escrituras internas que el cliente no ve (no las reenvía ?since=)."""
+        fields = list(fields)
+        objs = list(objs)
+        relocated = bool({'origin_lat', 'origin_lng'} & set(fields))
+        schedule = {'schedule_type', 'scheduled_datetime'} & set(fields)
+        now = timezone.now()
+        for obj in objs:
+            if relocated:
+                obj.origin_cell = geo.cell_for(obj.origin_lat, obj.origin_lng)
+            if schedule:
+                changed = obj.changed_fields()
+                if changed is None or schedule & set(changed):
+                    obj.reset_schedule(now)
+            if touch:
+                obj.updated_at = now
+        extra = ['origin_cell'] if relocated else []
+        if touch:
+            extra.append('updated_at')
+        if schedule:
+            extra += ['released_at', 'reminder_sent_at']
+        fields.extend(f for f in extra if f not in fields)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def pending_feedback(self, user):
+        """
+        Entregadas con guía y sin calificar. feedback_pending se mantiene al registrar el hito
+        delivered y al calificar (índice parcial, sin joins); el SET_NULL al borrar el guía no
+        pasa por save(), de ahí el filtro por assigned_guide.
+        """
+        return self.filter(user=user, feedback_pending=True, assigned_guide__isnull=False)
+
+    def touch(self):
+        """Marca las solicitudes como modificadas para ?since= (hitos, calificación, mascota)."""
+        return self.update(updated_at=timezone.now())
+
+    def assign_guide(self, pk, guide):
+        """
+        Asigna el guía sólo si la solicitud sigue en el pool (libre y, si es programada,
+        ya liberada), en un único UPDATE condicional. Devuelve True si este guía ganó la asignación.
+        """
+        return self.in_pool().filter(pk=pk).update(assigned_guide=guide, updated_at=timezone.now()) == 1
+
+
+class ServiceRequest(ChangeTrackingModel):
     SERVICE_CHOICES = [
         ('traslado', 'Traslado'),
         ('paseo', 'Paseo'),
@@ -62,6 +238,14 @@ class ServiceRequest(models.Model):
     origin_lat = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True)
     origin_lng = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True)
 
+    # celda de la grilla de origen (ver geo.py), se mantiene en save()
+    origin_cell = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+
+    # programadas: cuándo entraron al pool de los guías y cuándo se avisó que se acercan
+    # (ver scheduling.py y el comando dispatch_scheduled)
+    released_at = models.DateTimeField(null=True, blank=True, editable=False)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+
     dest_text = models.CharField(max_length=300)
     dest_lat = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True)
     dest_lng = models.DecimalField(max_digits=10, decimal_places=7, blank=True, null=True)
@@ -73,12 +257,106 @@ class ServiceRequest(models.Model):
 
     observations = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # última escritura de la solicitud, sus hitos o su calificación (cursor de ?since=, ver sync.py)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
     confirmed = models.BooleanField(default=False)
+    # entregada (confirmed, con guía) y todavía sin calificar: se marca en save() al
+    # confirmarla y se limpia al calificarla (signals.py)
+    feedback_pending = models.BooleanField(default=False, editable=False)
     assigned_guide = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_requests')
 
+    objects = ServiceRequestQuerySet.as_manager()
+
+    class Meta:
+        # índices con la forma de las queries de views.py
+        indexes = [
+            # historial del usuario y ServiceRequestListCreateView: user = ? ORDER BY created_at, id
+            models.Index(fields=['user', 'created_at', 'id'], name='sr_user_created_idx'),
+            # GuideAvailableRequestsList: sólo las no asignadas, ORDER BY created_at, id
+            models.Index(fields=['created_at', 'id'], name='sr_unassigned_created_idx',
+                         condition=models.Q(assigned_guide__isnull=True)),
+            # modo cercanía con radios grandes (más de MAX_CELLS_PER_QUERY celdas, desde ~10 km):
+            # near() filtra por bounding box y el rango de latitud sale de este índice
+            models.Index(fields=['origin_lat', 'origin_lng'], name='sr_pool_origin_idx',
+                         condition=models.Q(assigned_guide__isnull=True)),
+            # GuideAssignedRequestsList: assigned_guide = ? ORDER BY created_at DESC
+            models.Index(fields=['assigned_guide', 'created_at'], name='sr_guide_created_idx'),
+            # PendingFeedbackList y su conteo: sólo las pendientes de calificar, por usuario
+            models.Index(fields=['user'], name='sr_user_feedback_pending_idx',
+                         condition=models.Q(feedback_pending=True)),
+            # ?since= del historial y de las asignadas al guía: updated_at > ? ORDER BY updated_at, id
+            models.Index(fields=['user', 'updated_at', 'id'], name='sr_user_updated_idx'),
+            models.Index(fields=['assigned_guide', 'updated_at', 'id'], name='sr_guide_updated_idx'),
+            # dispatch_scheduled: sólo las programadas pendientes, por fecha; cada pasada
+            # lee un rango del índice y no la tabla
+            models.Index(fields=['scheduled_datetime'], name='sr_sched_pending_release_idx',
+                         condition=models.Q(schedule_type='scheduled', released_at__isnull=True)),
+            models.Index(fields=['scheduled_datetime'], name='sr_sched_pending_reminder_idx',
+                         condition=models.Q(schedule_type='scheduled', reminder_sent_at__isnull=True)),
+        ]
+
+    def is_in_pool(self):
+        return self.assigned_guide_id is None and (self.schedule_type == 'immediate' or self.released_at is not None)
+
+    def release_if_due(self, now):
+        """Al crearla, una programada dentro de la anticipación entra directo al pool."""
+        if (self.schedule_type == 'scheduled' and self.released_at is None and self.scheduled_datetime
+                and self.scheduled_datetime <= now + scheduled_release_lead()):
+            self.released_at = now
+
+    def reset_schedule(self, now):
+        """Con otro horario se vuelve a liberar y a recordar (dispatch_scheduled)."""
+        self.released_at = None
+        self.reminder_sent_at = None
+        self.release_if_due(now)
+
+    def save(self, *args, **kwargs):
+        now = timezone.now()
+        if self._state.adding:
+            self.release_if_due(now)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # como ChangeTrackingModel.save, acá para poder sumar origin_cell y updated_at
+            update_fields = self.changed_fields()
+            if update_fields == []:
+                return
+        extra = {'updated_at'}
+        if update_fields is not None and {'schedule_type', 'scheduled_datetime'} & set(update_fields):
+            self.reset_schedule(now)
+            extra.update({'released_at', 'reminder_sent_at'})
+        if self._state.adding or (update_fields is not None and 'confirmed' in update_fields):
+            self.feedback_pending = self.confirmed and self.assigned_guide_id is not None
+            extra.add('feedback_pending')
+        if update_fields is None or {'origin_lat', 'origin_lng'} & set(update_fields):
+            self.origin_cell = geo.cell_for(self.origin_lat, self.origin_lng)
+            extra.add('origin_cell')
+        self.updated_at = now
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | extra
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {self.get_service_type_display()} - {self.origin_text} -> {self.dest_text}"
 
+class ServiceRequestTombstone(models.Model):
+    """
+    Solicitud borrada (ver signals.py), para que ?since= le avise a los clientes que
+    la tenían sincronizada. Sin claves foráneas: la fila sobrevive a la solicitud y a los usuarios.
+    """
+    request_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True)
+    guide_id = models.BigIntegerField(null=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'deleted_at'], name='tombstone_user_deleted_idx'),
+            models.Index(fields=['guide_id', 'deleted_at'], name='tombstone_guide_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Solicitud {self.request_id} borrada @ {self.deleted_at}"
+
 class ServiceRequestMilestone(models.Model):
     request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, related_name='milestones')
     milestone = models.CharField(max_length=50, choices=MILESTONE_CHOICES)
@@ -88,6 +366,10 @@ class ServiceRequestMilestone(models.Model):
     class Meta:
         unique_together = ('request', 'milestone')  # cada hito registrado una vez
         ordering = ['recorded_at']
+        indexes = [
+            # analytics.rollup_days: entregas (milestone = 'delivered') de un rango de fechas
+            models.Index(fields=['milestone', 'recorded_at'], name='milestone_kind_recorded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.request.id} - {self.get_milestone_display()} @ {self.recorded_at}"
@@ -107,4 +389,127 @@ class ServiceRating(models.Model):
         ]
 
     def __str__(self):
-        return f"Rating {self.stars} for req {self.request_id} by {self.user_id}"
\ No newline at end of file
+        return f"Rating {self.stars} for req {self.request_id} by {self.user_id}"
+
+class MilestoneDailySummary(models.Model):
+    """
+    Duraciones de cada etapa del servicio agregadas por día de entrega, guía y tipo de
+    servicio (ver analytics.py). El histograma permite combinar días y calcular p50/p95
+    sin volver a leer los hitos.
+    """
+    day = models.DateField()
+    guide = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='milestone_summaries')
+    service_type = models.CharField(max_length=20)
+    stage = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    histogram = models.JSONField(default=list)  # cantidades por tramo de analytics.BUCKET_BOUNDS
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'guide', 'service_type', 'stage'], name='milestone_summary_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='milestone_summary_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} guía {self.guide_id} {self.service_type} {self.stage}: {self.count}"
+
+class GuideAvailability(models.Model):
+    """
+    Disponibilidad y última ubicación informada por el guía (GuideAvailabilityView);
+    la usa el motor de asignación (matching.py).
+    """
+    guide = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='availability')
+    available = models.BooleanField(default=False)
+    lat = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    lng = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # matching: available AND updated_at >= ?
+            models.Index(fields=['updated_at'], name='availability_active_idx', condition=models.Q(available=True)),
+        ]
+
+    def __str__(self):
+        return f"Guía {self.guide_id} {'disponible' if self.available else 'no disponible'}"
+
+class GuideRatingStats(models.Model):
+    """
+    Agregados de ServiceRating por guía, mantenidos incrementalmente (ver signals.py)
+    para que el perfil público no recorra todas las calificaciones en cada lectura.
+    """
+    guide = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='rating_stats')
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def rating_avg(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0.0
+
+    @property
+    def histogram(self):
+        return {str(n): getattr(self, f'stars_{n}') for n in range(1, 6)}
+
+    @classmethod
+    def record(cls, guide_id, stars, delta=1):
+        # UPDATE atómico con F() para no perder incrementos concurrentes
+        changes = {
+            'rating_count': models.F('rating_count') + delta,
+            'rating_sum': models.F('rating_sum') + delta * stars,
+            f'stars_{stars}': models.F(f'stars_{stars}') + delta,
+        }
+        if delta < 0:
+            changes = {field: Greatest(value, 0) for field, value in changes.items()}
+        changes['updated_at'] = timezone.now()
+        if cls.objects.filter(guide_id=guide_id).update(**changes) or delta < 0:
+            # una baja sin fila no crea nada: al borrar al guía el CASCADE elimina sus
+            # estadísticas antes que sus calificaciones
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(guide_id=guide_id, rating_count=delta, rating_sum=delta * stars,
+                                   **{f'stars_{stars}': delta})
+        except IntegrityError:
+            # otro proceso creó la fila entre el UPDATE y el INSERT
+            cls.objects.filter(guide_id=guide_id).update(**changes)
+
+    @classmethod
+    def rebuild(cls):
+        """Recalcula la tabla completa desde ServiceRating con una sola query agrupada."""
+        rows = ServiceRating.objects.values('guide_id').annotate(
+            rating_count=models.Count('id'),
+            rating_sum=models.Sum('stars'),
+            **{f'stars_{n}': models.Count('id', filter=models.Q(stars=n)) for n in range(1, 6)},
+        ).order_by()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(cls(**row) for row in rows)
+        return cls.objects.count()
+
+    def __str__(self):
+        return f"Stats guía {self.guide_id}: {self.rating_count} calificaciones"
+
+
+class OutboxEvent(models.Model):
+    """
+    Evento en tiempo real publicado por un proceso sin conexiones SSE (dispatch_scheduled,
+    match_requests). Se guarda en la misma transacción que el cambio que anuncia y cada
+    proceso web lo lleva a su broker (events.OutboxRelay). Se borra pasado
+    EVENT_OUTBOX_RETENTION_MINUTES (events.prune_outbox).
+    """
+    channels = models.JSONField()
+    event_type = models.CharField(max_length=50)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.event_type} @ {self.created_at}"
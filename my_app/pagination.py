@@ -0,0 +1,139 @@
+import base64
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .renderers import FastJSONRenderer
+
+
+class KeysetPagination:
+    """
+    Paginación por cursor sobre (created_at, id). Cada página es un WHERE sobre
+    el último elemento de la anterior, así que el costo no crece con el offset.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_page_size = 50
+    max_page_size = 200
+
+    def __init__(self, descending=False):
+        self.descending = descending
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_ordering(self):
+        if self.descending:
+            return ('-created_at', '-id')
+        return ('created_at', 'id')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.default_page_size))
+        except (TypeError, ValueError):
+            return self.default_page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj):
+        # obj puede ser una instancia o una fila .values() (FastServiceRequestSerializer)
+        if isinstance(obj, dict):
+            created_at, pk = obj['created_at'], obj['id']
+        else:
+            created_at, pk = obj.created_at, obj.id
+        raw = f"{created_at.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, value):
+        try:
+            raw = base64.urlsafe_b64decode(value.encode()).decode()
+            created_at, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Cursor inválido.")
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.get_ordering())
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            if self.descending:
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+
+        # una fila extra para saber si hay página siguiente sin hacer COUNT
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+def prepare_queryset(queryset, serializer_class):
+    """Los serializers rápidos (fast_serializers.py) leen filas .values() en lugar de instancias."""
+    prepare = getattr(serializer_class, 'prepare', None)
+    return prepare(queryset) if prepare else queryset
+
+
+def stream_json_array(queryset, serializer_class, chunk_size=200):
+    """
+    Genera un array JSON serializando de a `chunk_size` filas; la memoria queda
+    acotada al tamaño del chunk y no al del historial completo.
+    """
+    renderer = FastJSONRenderer()
+    rows = queryset.iterator(chunk_size=chunk_size)
+    yield b'['
+    first = True
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        body = renderer.render(serializer_class(chunk, many=True).data)
+        # quitamos los corchetes del array de cada chunk para concatenarlos
+        yield (b'' if first else b',') + body[1:-1]
+        first = False
+    yield b']'
+
+
+def list_response(request, queryset, serializer_class, descending=False):
+    """
+    Respuesta común de los listados de ServiceRequest:
+    - ?stream=1 emite el listado completo como array JSON en chunks
+    - ?cursor= / ?page_size= pagina por (created_at, id)
+    - sin parámetros devuelve el listado completo como antes
+    """
+    paginator = KeysetPagination(descending=descending)
+    queryset = prepare_queryset(queryset.order_by(*paginator.get_ordering()), serializer_class)
+
+    if request.query_params.get('stream') in ('1', 'true'):
+        return StreamingHttpResponse(
+            stream_json_array(queryset, serializer_class),
+            content_type='application/json',
+        )
+
+    if paginator.is_requested(request):
+        page = paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
+    return Response(serializer_class(queryset, many=True).data)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db import read_from_primary
+
+KEY_PREFIX = 'zoolito:resp'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def guide_profile_scope(guide_id):
+    return f'guide-profile:{guide_id}'
+
+
+def user_history_scope(user_id):
+    return f'user-history:{user_id}'
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def cache_stats():
+    """Contadores de hits/misses/304 de este proceso."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _version_key(scope):
+    return f'{KEY_PREFIX}:ver:{scope}'
+
+
+def _scope_version(scope):
+    version = cache.get(_version_key(scope))
+    if version is None:
+        # versión aleatoria: si la clave se pierde nunca se reutiliza una versión vieja
+        cache.add(_version_key(scope), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(scope))
+    return version
+
+
+def _bump(scopes):
+    cache.set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def invalidate(*scopes):
+    """
+    Invalida todas las respuestas cacheadas de los scopes (cualquier query string).
+    Se invalida de inmediato y otra vez al hacer commit, para descartar lo que otra
+    request haya cacheado leyendo el estado previo al commit.
+    """
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _etag_for(data):
+    body = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return quote_etag(hashlib.md5(body.encode()).hexdigest())
+
+
+def cached_response(request, scope, build):
+    """
+    Devuelve la respuesta cacheada del scope para esta URL o la construye con
+    build() -> data. Soporta If-None-Match respondiendo 304 con el ETag vigente.
+    """
+    key = f'{KEY_PREFIX}:{scope}:{_scope_version(scope)}:{request.get_full_path()}'
+    entry = cache.get(key)
+    if entry is None:
+        _count('miss')
+        # desde 'default': una réplica atrasada justo después de invalidate() volvería a
+        # cachear lo viejo bajo la versión nueva
+        with read_from_primary():
+            data = build()
+        entry = (_etag_for(data), data)
+        cache.set(key, entry, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    else:
+        _count('hit')
+    etag, data = entry
+
+    client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in client_etags or '*' in client_etags:
+        _count('not_modified')
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    # el cliente debe revalidar siempre; el ETag hace barata la revalidación
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,91 @@
+"""
+Despacho de solicitudes programadas (comando dispatch_scheduled):
+- liberación: las programadas entran al pool de los guías SCHEDULED_RELEASE_LEAD_MINUTES
+  antes de scheduled_datetime (request.created para los guías)
+- recordatorios: SCHEDULED_REMINDER_LEAD_MINUTES antes se avisa al dueño y al guía
+  asignado (request.reminder)
+El worker no tiene conexiones SSE: los eventos se guardan en OutboxEvent en la misma
+transacción que marca released_at/reminder_sent_at y los entregan los procesos web.
+Cada pasada lee sólo el rango vencido de índices parciales sobre las pendientes
+(ver ServiceRequest.Meta.indexes), en lotes, así que el costo no depende de cuántas
+reservas futuras haya. Las programadas cuyo horario ya pasó (p.ej. las anteriores a
+released_at/reminder_sent_at) no generan eventos: la primera pasada sólo las marca
+como liberadas y nunca reciben recordatorio.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .events import GUIDES_CHANNEL, guide_channel, publish_via_outbox, request_event_data, user_channel
+from .models import ServiceRequest, scheduled_release_lead
+
+EVENT_FIELDS = [
+    'id', 'user_id', 'assigned_guide_id', 'service_type', 'schedule_type', 'scheduled_datetime',
+    'origin_text', 'origin_lat', 'origin_lng', 'dest_text', 'created_at',
+]
+
+
+def reminder_lead():
+    return timedelta(minutes=getattr(settings, 'SCHEDULED_REMINDER_LEAD_MINUTES', 30))
+
+
+def _claim(pending, flag, now, horizon, batch_size, events_for):
+    """
+    Marca `flag`=now en hasta batch_size solicitudes con scheduled_datetime <= horizon y
+    guarda sus eventos (events_for(sr) -> [(channels, type, data)]) en la misma
+    transacción. Devuelve cuántas marcó. El UPDATE vuelve a exigir flag IS NULL: con
+    varios workers cada solicitud la procesa uno solo.
+    """
+    with transaction.atomic():
+        ids = list(pending.filter(scheduled_datetime__lte=horizon)
+                   .order_by('scheduled_datetime').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        claimed = ServiceRequest.objects.filter(id__in=ids, **{f'{flag}__isnull': True}).update(**{flag: now})
+        if claimed:
+            batch = ServiceRequest.objects.filter(id__in=ids, **{flag: now}).only(*EVENT_FIELDS)
+            publish_via_outbox([event for sr in batch for event in events_for(sr)])
+        return claimed
+
+
+def release_due_requests(now=None, batch_size=500):
+    """Libera al pool las programadas que entran en la anticipación. Devuelve cuántas."""
+    now = now or timezone.now()
+    pending = ServiceRequest.objects.filter(schedule_type='scheduled', released_at__isnull=True)
+
+    def events_for(sr):
+        # update() no dispara signals; las ya asignadas o con el horario vencido no se anuncian
+        if sr.assigned_guide_id is None and sr.scheduled_datetime >= now:
+            return [([GUIDES_CHANNEL], 'request.created', request_event_data(sr))]
+        return []
+
+    released = 0
+    while True:
+        count = _claim(pending, 'released_at', now, now + scheduled_release_lead(), batch_size, events_for)
+        released += count
+        if count < batch_size:
+            return released
+
+
+def send_due_reminders(now=None, batch_size=500):
+    """Avisa al dueño y al guía de las programadas que se acercan. Devuelve cuántas."""
+    now = now or timezone.now()
+    # sólo las que todavía no empezaron ni se entregaron: el rango leído del índice es [now, horizonte]
+    pending = ServiceRequest.objects.filter(schedule_type='scheduled', reminder_sent_at__isnull=True,
+                                            scheduled_datetime__gte=now, confirmed=False)
+    def events_for(sr):
+        channels = [user_channel(sr.user_id)] if sr.user_id else []
+        if sr.assigned_guide_id:
+            channels.append(guide_channel(sr.assigned_guide_id))
+        return [(channels, 'request.reminder', {
+            'id': sr.id, 'scheduled_datetime': sr.scheduled_datetime, 'guide_id': sr.assigned_guide_id,
+        })]
+
+    sent = 0
+    while True:
+        count = _claim(pending, 'reminder_sent_at', now, now + reminder_lead(), batch_size, events_for)
+        sent += count
+        if count < batch_size:
+            return sent
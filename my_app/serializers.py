@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.contrib.auth.models import User
-from .models import Pet, ServiceRequest, ServiceRequestMilestone, Profile, ServiceRating
+from .models import GuideAvailability, Pet, ServiceRequest, ServiceRequestMilestone, Profile, ServiceRating
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 
 class PetSerializer(serializers.ModelSerializer):
@@ -41,19 +44,43 @@ class RegisterSerializer(serializers.ModelSerializer):
         password = validated_data.pop('password')
         user = User(**validated_data)
         user.set_password(password)
-        user.save()
-        # crear perfil y asignar rol
-        # solución recomendada: crear o actualizar el profile si ya existe
-        profile, created = Profile.objects.get_or_create(user=user, defaults={'role': role})
-        if not created:
-            # si ya existía, actualizamos el role en caso de que venga distinto
-            profile.role = role
-            profile.save()
-
+        # el signal create_profile crea el perfil con este rol: usuario y perfil
+        # quedan en dos INSERT dentro de la misma transacción
+        user._initial_role = role
+        with transaction.atomic():
+            user.save()
         return user
 
+def role_for(user):
+    profile = getattr(user, 'profile', None)
+    return profile.role if profile else 'user'
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Agrega el rol del usuario como claim del refresh token (ver RoleRefreshToken)."""
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['role'] = role_for(user)
+        return token
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Al emitir un token de acceso relee el rol del perfil (una query por refresh): un
+    cambio de rol llega con el próximo refresh y no al vencer el refresh token.
+    """
+    @property
+    def access_token(self):
+        role = Profile.objects.filter(user_id=self.payload.get(api_settings.USER_ID_CLAIM))\
+            .values_list('role', flat=True).first()
+        # también queda en el refresh rotado (ROTATE_REFRESH_TOKENS)
+        self['role'] = role or 'user'
+        return super().access_token
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RoleRefreshToken
+
 def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user)
+    refresh = RoleTokenObtainPairSerializer.get_token(user)
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -83,8 +110,31 @@ class ServiceRatingSerializer(serializers.ModelSerializer):
         fields = ['id', 'stars', 'comment', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+class OwnedPetField(serializers.PrimaryKeyRelatedField):
+    """
+    Con context['owned_pets'] ({id: Pet} del usuario, cargado con una sola query en las
+    vistas en lote) valida la mascota sin ir a la base por cada ítem.
+    """
+    default_error_messages = {
+        'not_owned': "Esta mascota no pertenece al usuario autenticado.",
+    }
+
+    def to_internal_value(self, data):
+        owned = self.context.get('owned_pets')
+        if owned is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in owned:
+            self.fail('not_owned')
+        return owned[pk]
+
 class ServiceRequestSerializer(serializers.ModelSerializer):
-    pet = serializers.PrimaryKeyRelatedField(queryset=Pet.objects.all(), required=False, allow_null=True)
+    pet = OwnedPetField(queryset=Pet.objects.all(), required=False, allow_null=True)
     pet_detail = PetSerializer(source='pet', read_only=True)
     milestones = ServiceRequestMilestoneSerializer(many=True, read_only=True)
     rating = ServiceRatingSerializer(read_only=True)  # rating si existe
@@ -102,6 +152,41 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'confirmed', 'milestones', 'rating']
 
+    # representación compacta para las pantallas de listado
+    COMPACT_FIELDS = [
+        'id', 'service_type', 'schedule_type', 'scheduled_datetime',
+        'origin_text', 'dest_text', 'pet', 'created_at', 'confirmed',
+    ]
+    EXPANDABLE_FIELDS = ['pet_detail', 'milestones', 'rating']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def fieldset_from_params(cls, params):
+        """
+        Campos pedidos con ?fields=a,b y ?expand=pet_detail,milestones,rating, o None
+        (representación completa) si no viene ninguno de los dos. Sin ?fields= (o vacío)
+        se parte de COMPACT_FIELDS; ?expand= suma las relaciones anidadas.
+        """
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        fields = [f for f in params.get('fields', '').split(',') if f] or list(cls.COMPACT_FIELDS)
+        expand = [f for f in params.get('expand', '').split(',') if f]
+        errors = {}
+        unknown = [f for f in fields if f not in cls.Meta.fields]
+        if unknown:
+            errors['fields'] = [f"Campos desconocidos: {', '.join(unknown)}"]
+        unknown = [f for f in expand if f not in cls.EXPANDABLE_FIELDS]
+        if unknown:
+            errors['expand'] = [f"Sólo se pueden expandir: {', '.join(cls.EXPANDABLE_FIELDS)}"]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return tuple(dict.fromkeys(fields + expand))
+
     def validate(self, data):
         schedule_type = data.get('schedule_type', getattr(self.instance, 'schedule_type', None))
         scheduled_datetime = data.get('scheduled_datetime', getattr(self.instance, 'scheduled_datetime', None))
@@ -116,15 +201,16 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         pet = validated_data.get('pet', None)
-        if pet and pet.owner != user:
+        if pet and pet.owner_id != user.id:
             raise serializers.ValidationError("Esta mascota no pertenece al usuario autenticado.")
         validated_data['user'] = user
         return ServiceRequest.objects.create(**validated_data)
 
     def update(self, instance, validated_data):
         user = self.context['request'].user
-        pet = validated_data.get('pet', instance.pet)
-        if pet and pet.owner != user:
+        # sólo se valida la mascota si cambia; leer instance.pet costaría una query
+        pet = validated_data.get('pet')
+        if pet and pet.owner_id != user.id:
             raise serializers.ValidationError("La mascota seleccionada no pertenece al usuario autenticado.")
         for field in [
             'service_type','schedule_type','scheduled_datetime',
@@ -135,12 +221,29 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
         ]:
             if field in validated_data:
                 setattr(instance, field, validated_data[field])
+        # save() escribe sólo las columnas modificadas (ChangeTrackingModel)
         instance.save()
         return instance
 
+class GuideAvailabilitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GuideAvailability
+        fields = ['available', 'lat', 'lng', 'updated_at']
+        read_only_fields = ['updated_at']
+
+    def validate(self, attrs):
+        lat = attrs.get('lat', getattr(self.instance, 'lat', None))
+        lng = attrs.get('lng', getattr(self.instance, 'lng', None))
+        if (lat is None) != (lng is None):
+            raise serializers.ValidationError("lat y lng van juntas")
+        if lat is not None and not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise serializers.ValidationError("Coordenadas fuera de rango")
+        return attrs
+
 class GuidePublicProfileSerializer(serializers.Serializer):
     guide_id = serializers.IntegerField()
     username = serializers.CharField()
     full_name = serializers.CharField()
     rating_avg = serializers.FloatField()
-    rating_count = serializers.IntegerField()
\ No newline at end of file
+    rating_count = serializers.IntegerField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField())
\ No newline at end of file
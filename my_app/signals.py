@@ -1,13 +1,116 @@
-from django.db.models.signals import post_save
+from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import (
+    GuideRatingStats, Pet, Profile, ServiceRating, ServiceRequest, ServiceRequestMilestone, ServiceRequestTombstone,
+)
+from .authentication import invalidate_cached_user
+from .events import GUIDES_CHANNEL, publish_milestones, publish_on_commit, request_event_data
+from .response_cache import guide_profile_scope, invalidate, user_history_scope
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
+    # el perfil sólo se escribe al crear el usuario; RegisterSerializer indica el rol
+    # con _initial_role para que quede en el mismo INSERT
     if created:
-        Profile.objects.create(user=instance)
+        Profile.objects.create(user=instance, role=getattr(instance, '_initial_role', 'user'))
+
+@receiver(post_save, sender=ServiceRating)
+def add_rating_to_stats(sender, instance, created, **kwargs):
+    if created:
+        GuideRatingStats.record(instance.guide_id, instance.stars)
+
+@receiver(post_delete, sender=ServiceRating)
+def remove_rating_from_stats(sender, instance, **kwargs):
+    GuideRatingStats.record(instance.guide_id, instance.stars, delta=-1)
+
+# invalidación de las respuestas cacheadas (response_cache.py)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    # baja, cambio de contraseña, borrado, etc. deben verse en la próxima request
+    invalidate_cached_user(instance.id)
+
+PUBLIC_PROFILE_FIELDS = {'username', 'first_name', 'last_name'}
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def invalidate_guide_profile(sender, instance, update_fields=None, **kwargs):
+    # p.ej. la actualización de last_login no cambia el perfil público
+    if update_fields is not None and not PUBLIC_PROFILE_FIELDS & set(update_fields):
+        return
+    invalidate(guide_profile_scope(instance.id))
+
+@receiver(post_save, sender=ServiceRequest)
+@receiver(post_delete, sender=ServiceRequest)
+def invalidate_request_caches(sender, instance, **kwargs):
+    if instance.user_id:
+        invalidate(user_history_scope(instance.user_id))
+
+def _request_owner_id(milestone):
+    # evitamos cargar la solicitud si ya viene en la instancia (caso habitual en las vistas)
+    if ServiceRequestMilestone._meta.get_field('request').is_cached(milestone):
+        return milestone.request.user_id
+    return ServiceRequest.objects.filter(pk=milestone.request_id).values_list('user_id', flat=True).first()
+
+@receiver(post_save, sender=ServiceRequestMilestone)
+@receiver(post_delete, sender=ServiceRequestMilestone)
+def invalidate_milestone_caches(sender, instance, **kwargs):
+    user_id = _request_owner_id(instance)
+    if user_id:
+        invalidate(user_history_scope(user_id))
+
+@receiver(post_save, sender=ServiceRating)
+@receiver(post_delete, sender=ServiceRating)
+def invalidate_rating_caches(sender, instance, **kwargs):
+    invalidate(guide_profile_scope(instance.guide_id), user_history_scope(instance.user_id))
+
+# updated_at y bajas de las solicitudes para la sincronización incremental (sync.py)
+
+@receiver(post_save, sender=ServiceRequestMilestone)
+@receiver(post_delete, sender=ServiceRequestMilestone)
+def touch_request(sender, instance, **kwargs):
+    # CreateMilestoneView marca `request_touched` cuando el save() de la solicitud ya sella updated_at
+    if getattr(instance, 'request_touched', False):
+        return
+    ServiceRequest.objects.filter(pk=instance.request_id).touch()
+
+@receiver(post_save, sender=ServiceRating)
+@receiver(post_delete, sender=ServiceRating)
+def update_feedback_pending(sender, instance, signal, **kwargs):
+    # calificada: sale de PendingFeedbackList; sin calificación vuelve si sigue entregada
+    ServiceRequest.objects.filter(pk=instance.request_id).update(
+        feedback_pending=(models.Value(False) if signal is post_save else
+                          models.Q(confirmed=True, assigned_guide__isnull=False)),
+        updated_at=timezone.now(),
+    )
+
+@receiver(post_save, sender=Pet)
+@receiver(pre_delete, sender=Pet)
+def touch_pet_requests(sender, instance, created=False, **kwargs):
+    # pet_detail va dentro de la solicitud (y del historial cacheado); en pre_delete,
+    # antes de que el SET_NULL las desvincule
+    if not created:
+        ServiceRequest.objects.filter(pet=instance).touch()
+        invalidate(user_history_scope(instance.owner_id))
+
+@receiver(post_delete, sender=ServiceRequest)
+def record_tombstone(sender, instance, **kwargs):
+    ServiceRequestTombstone.objects.create(
+        request_id=instance.pk, user_id=instance.user_id, guide_id=instance.assigned_guide_id,
+    )
+
+# eventos en tiempo real para las conexiones SSE (events.py)
+
+@receiver(post_save, sender=ServiceRequest)
+def publish_request_created(sender, instance, created, **kwargs):
+    # las programadas lejanas se publican al liberarse (scheduling.release_due_requests)
+    if created and instance.is_in_pool():
+        publish_on_commit([GUIDES_CHANNEL], 'request.created', request_event_data(instance))
+
+@receiver(post_save, sender=ServiceRequestMilestone)
+def publish_milestone_created(sender, instance, created, **kwargs):
+    if created:
+        publish_milestones([instance], {instance.request_id: _request_owner_id(instance)})
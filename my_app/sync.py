@@ -0,0 +1,66 @@
+"""
+Sincronización incremental de los listados de solicitudes (?since=): en lugar del
+listado completo devuelve sólo las solicitudes con updated_at posterior al cursor
+(la solicitud, sus hitos, su calificación o su mascota cambiaron) y los ids de las
+borradas desde entonces (ServiceRequestTombstone).
+
+Respuesta: {"since": <cursor para la próxima vez>, "changed": [...], "deleted": [ids]}.
+Con ?since= vacío devuelve todo, para obtener el primer cursor. Se lee de 'default' y no de
+una réplica: lo que una réplica atrasada no tuviera quedaría antes del cursor devuelto y
+ese cliente no lo recibiría nunca.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db import read_from_primary
+from .pagination import prepare_queryset
+
+SINCE_PARAM = 'since'
+
+
+def is_requested(request):
+    return SINCE_PARAM in request.query_params
+
+
+def format_cursor(value):
+    # ISO 8601 en UTC con 'Z': sin '+' que haya que escapar en la query string
+    return value.astimezone(dt_timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def parse_cursor(value):
+    """datetime del cursor, o None si no es válido."""
+    if not value:
+        return datetime.min.replace(tzinfo=dt_timezone.utc)
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def delta_response(request, queryset, tombstones, serializer_class):
+    """
+    `queryset`: solicitudes visibles en el listado; `tombstones`: bajas del mismo
+    usuario o guía. Ambas lecturas van por índices (…, updated_at/deleted_at).
+    """
+    since = parse_cursor(request.query_params.get(SINCE_PARAM))
+    if since is None:
+        return Response({"detail": "since debe ser una fecha ISO 8601"}, status=status.HTTP_400_BAD_REQUEST)
+    # el próximo cursor se solapa unos segundos: una transacción que tomó su updated_at
+    # antes de ahora pero todavía no hizo commit aparece en la sincronización siguiente
+    cursor = timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 5))
+    changed = prepare_queryset(queryset.filter(updated_at__gt=since).order_by('updated_at', 'id'), serializer_class)
+    deleted = tombstones.filter(deleted_at__gt=since).order_by('deleted_at').values_list('request_id', flat=True)
+    with read_from_primary():
+        return Response({
+            'since': format_cursor(cursor),
+            'changed': serializer_class(changed, many=True).data,
+            'deleted': list(deleted),
+        })
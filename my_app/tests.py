@@ -1,3 +1,1591 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import re
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import geo
+from .analytics import STAGES, summarize, update_summaries
+from .db import ReadReplicaRouter, read_from_replicas
+from .events import (
+    GUIDES_CHANNEL, EventBroker, OutboxRelay, broker, guide_channel, prune_outbox, publish_via_outbox, user_channel,
+)
+from .fast_serializers import FastServiceRequestSerializer
+from .middleware import ReadReplicaMiddleware, _QueryRecorder
+from .matching import MatchGuide, MatchingParams, MatchRequest, run_matching, solve
+from .models import (
+    GuideAvailability, GuideRatingStats, MilestoneDailySummary, Pet, ServiceRequest, ServiceRequestMilestone, ServiceRating,
+    OutboxEvent, ServiceRequestTombstone,
+)
+from .renderers import FastJSONRenderer
+from .response_cache import cache_stats, reset_cache_stats
+from .scheduling import release_due_requests, send_due_reminders
+from .serializers import ServiceRequestSerializer, get_tokens_for_user
+from .throttling import take_token
+
+
+def make_user(username, role='user'):
+    user = User.objects.create_user(username=username, password='secret123')
+    user.profile.role = role
+    user.profile.save()
+    return user
+
+
+def make_request(user, guide=None, delivered=False, rated=False, **extra):
+    pet = Pet.objects.create(owner=user, name='Firulais', species='perro')
+    fields = {
+        'user': user,
+        'service_type': 'paseo',
+        'schedule_type': 'immediate',
+        'origin_text': 'Origen',
+        'dest_text': 'Destino',
+        'pet': pet,
+        'assigned_guide': guide,
+    }
+    fields.update(extra)
+    sr = ServiceRequest.objects.create(**fields)
+    if guide and delivered:
+        for milestone in ('arrival_origin', 'pet_on_board', 'delivered'):
+            ServiceRequestMilestone.objects.create(request=sr, milestone=milestone, recorded_by=guide)
+        sr.confirmed = True
+        sr.save()
+    if guide and rated:
+        ServiceRating.objects.create(request=sr, user=user, guide=guide, stars=5)
+    return sr
+
+
+class ServiceRequestListQueryCountTests(TestCase):
+    """Los listados deben costar las mismas queries con 1 fila que con muchas."""
+
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.client = APIClient()
+
+    def count_queries(self, user, url):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), len(response.data)
+
+    def assert_constant(self, user, url, add_rows):
+        add_rows(1)
+        few, rows_few = self.count_queries(user, url)
+        add_rows(5)
+        many, rows_many = self.count_queries(user, url)
+        self.assertGreater(rows_many, rows_few)
+        self.assertEqual(few, many)
+
+    def test_user_requests(self):
+        self.assert_constant(self.owner, reverse('requests'), lambda n: [
+            make_request(self.owner, self.guide, delivered=True, rated=True) for _ in range(n)
+        ])
+
+    def test_user_history(self):
+        self.assert_constant(self.owner, reverse('user-history-requests'), lambda n: [
+            make_request(self.owner, self.guide, delivered=True, rated=True) for _ in range(n)
+        ])
+
+    def test_pending_feedback(self):
+        self.assert_constant(self.owner, reverse('pending-feedback'), lambda n: [
+            make_request(self.owner, self.guide, delivered=True) for _ in range(n)
+        ])
+
+    def test_guide_available(self):
+        self.assert_constant(self.guide, reverse('guide-available'), lambda n: [
+            make_request(self.owner) for _ in range(n)
+        ])
+
+    def test_guide_assigned(self):
+        self.assert_constant(self.guide, reverse('guide-assigned'), lambda n: [
+            make_request(self.owner, self.guide, delivered=True, rated=True) for _ in range(n)
+        ])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.requests = [make_request(self.owner) for _ in range(7)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_walks_history_without_gaps_or_duplicates(self):
+        url = reverse('user-history-requests') + '?page_size=3'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted((sr.id for sr in self.requests), reverse=True))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('user-history-requests') + '?cursor=nope')
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_matches_plain_response(self):
+        plain = self.client.get(reverse('user-history-requests'))
+        streamed = self.client.get(reverse('user-history-requests') + '?stream=1')
+        self.assertTrue(streamed.streaming)
+        body = json.loads(b''.join(streamed.streaming_content))
+        self.assertEqual(body, json.loads(plain.content))
+
+
+class GuideNearbyRequestsTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.client = APIClient()
+        self.client.force_authenticate(self.guide)
+        # Santiago centro como referencia
+        self.near = make_request(self.owner, origin_lat='-33.4400000', origin_lng='-70.6500000')
+        self.nearer = make_request(self.owner, origin_lat='-33.4372000', origin_lng='-70.6506000')
+        self.far = make_request(self.owner, origin_lat='-33.0458000', origin_lng='-71.6197000')
+        self.no_coords = make_request(self.owner)
+
+    def test_origin_cell_maintained_on_save(self):
+        self.assertIsNotNone(self.near.origin_cell)
+        self.assertIsNone(self.no_coords.origin_cell)
+        self.near.origin_lat = self.far.origin_lat
+        self.near.origin_lng = self.far.origin_lng
+        self.near.save(update_fields=['origin_lat', 'origin_lng'])
+        self.near.refresh_from_db()
+        self.assertEqual(self.near.origin_cell, self.far.origin_cell)
+
+    def test_nearest_first_within_radius(self):
+        response = self.client.get(reverse('guide-available'), {'lat': -33.4372, 'lng': -70.6506, 'radius': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data], [self.nearer.id, self.near.id])
+        self.assertLess(response.data[0]['distance_km'], response.data[1]['distance_km'])
+
+    def test_limit(self):
+        response = self.client.get(reverse('guide-available'), {'lat': -33.4372, 'lng': -70.6506, 'limit': 1})
+        self.assertEqual([row['id'] for row in response.data], [self.nearer.id])
+
+    def test_invalid_coordinates(self):
+        response = self.client.get(reverse('guide-available'), {'lat': 'x', 'lng': -70.65})
+        self.assertEqual(response.status_code, 400)
+        for params in [{'lat': -33.44, 'lng': -70.65, 'radius': 'nan'}, {'lat': 'nan', 'lng': -70.65},
+                       {'lat': -33.44, 'lng': 'inf'}, {'lat': -33.44, 'lng': -70.65, 'radius': 'inf'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('guide-available'), params).status_code, 400)
+
+    def test_large_radius_uses_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN es específico de SQLite')
+        # pool repartido en ~10° de latitud: a 50 km no alcanzan las celdas de la grilla
+        ServiceRequest.objects.bulk_create([
+            ServiceRequest(user=self.owner, service_type='paseo', schedule_type='immediate',
+                           origin_text='Origen', dest_text='Destino',
+                           origin_lat=Decimal(-38 + (i % 100) / 10), origin_lng=Decimal(-75 + (i % 37) / 5))
+            for i in range(500)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertIsNone(geo.cells_in_box(*geo.bounding_box(-33.44, -70.65, 50)))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('guide-available'), {'lat': -33.44, 'lng': -70.65, 'radius': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.nearer.id, [row['id'] for row in response.data])
+        sql = next(q['sql'] for q in ctx.captured_queries if '"origin_lat" >=' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('sr_pool_origin_idx', plan)
+
+    def test_next_to_antimeridian(self):
+        edge = make_request(self.owner, origin_lat='10.0000000', origin_lng='179.9950000')
+        response = self.client.get(reverse('guide-available'), {'lat': 10, 'lng': 179.995, 'radius': 5})
+        self.assertEqual([row['id'] for row in response.data], [edge.id])
+        self.assertIn(geo.cell_for(10, 180), geo.cells_in_box(*geo.bounding_box(10, 179.995, 5)))
+
+
+class AcceptRequestConcurrencyTests(TransactionTestCase):
+    def test_single_winner_under_contention(self):
+        owner = make_user('owner')
+        guides = [make_user(f'guide{i}', role='guide') for i in range(6)]
+        sr = make_request(owner)
+        results = []
+        barrier = threading.Barrier(len(guides))
+
+        def accept(guide):
+            client = APIClient()
+            client.force_authenticate(guide)
+            barrier.wait()
+            try:
+                results.append((guide.id, client.post(reverse('request-accept', args=[sr.pk])).status_code))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(g,)) for g in guides]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        winners = [guide_id for guide_id, code in results if code == 200]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(sorted(code for _, code in results), [200] + [400] * (len(guides) - 1))
+        sr.refresh_from_db()
+        self.assertEqual(sr.assigned_guide_id, winners[0])
+
+    def test_accept_only_writes_assignment(self):
+        owner = make_user('owner')
+        guide = make_user('guide', role='guide')
+        sr = make_request(owner)
+        client = APIClient()
+        client.force_authenticate(guide)
+        with CaptureQueriesContext(connection) as ctx:
+            client.post(reverse('request-accept', args=[sr.pk]))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('observations', updates[0])
+
+    def test_accept_missing_request(self):
+        guide = make_user('guide', role='guide')
+        client = APIClient()
+        client.force_authenticate(guide)
+        self.assertEqual(client.post(reverse('request-accept', args=[999])).status_code, 404)
+
+
+class GuideRatingStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.client = APIClient()
+
+    def rate(self, stars):
+        sr = make_request(self.owner, self.guide, delivered=True)
+        self.client.force_authenticate(self.owner)
+        response = self.client.post(reverse('request-rating', args=[sr.pk]), {'stars': stars})
+        self.assertEqual(response.status_code, 201)
+
+    def test_rating_updates_stats_incrementally(self):
+        self.rate(5)
+        self.rate(3)
+        stats = GuideRatingStats.objects.get(guide=self.guide)
+        self.assertEqual((stats.rating_count, stats.rating_sum), (2, 8))
+        self.assertEqual(stats.histogram, {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1})
+
+    def test_profile_is_single_query(self):
+        self.rate(4)
+        self.rate(5)
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('guide-profile', args=[self.guide.pk]))
+        self.assertEqual(response.data['rating_avg'], 4.5)
+        self.assertEqual(response.data['rating_count'], 2)
+
+    def test_profile_without_ratings(self):
+        response = self.client.get(reverse('guide-profile', args=[self.guide.pk]))
+        self.assertEqual(response.data['rating_avg'], 0.0)
+        self.assertEqual(response.data['rating_count'], 0)
+
+    def test_rebuild_matches_incremental(self):
+        self.rate(2)
+        self.rate(5)
+        ServiceRating.objects.first().delete()
+        incremental = GuideRatingStats.objects.get(guide=self.guide)
+        GuideRatingStats.rebuild()
+        rebuilt = GuideRatingStats.objects.get(guide=self.guide)
+        self.assertEqual(
+            (rebuilt.rating_count, rebuilt.rating_sum, rebuilt.histogram),
+            (incremental.rating_count, incremental.rating_sum, incremental.histogram),
+        )
+        self.assertEqual(rebuilt.rating_count, 1)
+
+    def test_delete_guide_with_ratings(self):
+        for stars in (3, 4, 5):
+            self.rate(stars)
+        self.guide.delete()
+        self.assertFalse(GuideRatingStats.objects.exists())
+        self.assertFalse(ServiceRating.objects.exists())
+
+    def test_decrement_never_goes_below_zero(self):
+        self.rate(4)
+        GuideRatingStats.objects.filter(guide=self.guide).update(rating_count=0, rating_sum=0, stars_4=0)
+        ServiceRating.objects.get().delete()
+        stats = GuideRatingStats.objects.get(guide=self.guide)
+        self.assertEqual((stats.rating_count, stats.rating_sum, stats.stars_4), (0, 0, 0))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.sr = make_request(self.owner, self.guide)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_history_hit_and_not_modified(self):
+        url = reverse('user-history-requests')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(cache_stats(), {'miss': 1, 'hit': 2, 'not_modified': 1})
+
+    def test_history_invalidated_by_milestone_and_rating(self):
+        url = reverse('user-history-requests')
+        etag = self.client.get(url)['ETag']
+
+        ServiceRequestMilestone.objects.create(request=self.sr, milestone='arrival_origin', recorded_by=self.guide)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data[0]['milestones']), 1)
+
+        etag = response['ETag']
+        ServiceRating.objects.create(request=self.sr, user=self.owner, guide=self.guide, stars=4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['rating']['stars'], 4)
+
+    def test_history_invalidated_by_pet_changes(self):
+        url = reverse('user-history-requests')
+        etag = self.client.get(url)['ETag']
+        self.client.patch(reverse('pet-detail', args=[self.sr.pet_id]), {'name': 'Bobby'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['pet_detail']['name'], 'Bobby')
+
+        etag = response['ETag']
+        self.client.patch(reverse('pet-bulk'), [{'id': self.sr.pet_id, 'name': 'Toby'}], format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['pet_detail']['name'], 'Toby')
+
+        etag = response['ETag']
+        Pet.objects.get(pk=self.sr.pet_id).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data[0]['pet_detail'])
+
+    def test_profile_invalidated_by_rating(self):
+        url = reverse('guide-profile', args=[self.guide.pk])
+        self.assertEqual(self.client.get(url).data['rating_count'], 0)
+        ServiceRating.objects.create(request=self.sr, user=self.owner, guide=self.guide, stars=5)
+        self.assertEqual(self.client.get(url).data['rating_count'], 1)
+
+    def test_cache_is_per_user(self):
+        other = make_user('other')
+        self.client.get(reverse('user-history-requests'))
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('user-history-requests')).data, [])
+
+
+class ListEndpointQueryPlanTests(TestCase):
+    """Ningún listado debe recorrer la tabla completa de solicitudes (EXPLAIN QUERY PLAN de SQLite)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('owner')
+        cls.guide = make_user('guide', role='guide')
+        others = [make_user(f'other{i}') for i in range(5)]
+        pet = Pet.objects.create(owner=cls.owner, name='Firulais')
+        ServiceRequest.objects.bulk_create([
+            ServiceRequest(
+                user=(cls.owner if i % 6 == 0 else others[i % 5]), pet=pet,
+                service_type='paseo', schedule_type='immediate',
+                origin_text='Origen', dest_text='Destino',
+                assigned_guide=(cls.guide if i % 3 else None), confirmed=(i % 2 == 0),
+            )
+            for i in range(600)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+
+    def query_plans(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(client.get(url).status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if sql.startswith('SELECT') and '"my_app_servicerequest"' in sql:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                    plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans)
+        return plans
+
+    def assert_no_full_scan(self, user, url):
+        for sql, plan in self.query_plans(user, url):
+            for step in plan:
+                self.assertNotRegex(step, r'^SCAN my_app_servicerequest$', f'{url}: {sql}\n{plan}')
+                self.assertNotIn('TEMP B-TREE', step, f'{url}: {sql}\n{plan}')
+
+    def test_list_endpoints_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN es específico de SQLite')
+        for user, url in [
+            (self.owner, reverse('requests')),
+            (self.owner, reverse('user-history-requests')),
+            (self.owner, reverse('user-history-requests') + '?page_size=10'),
+            (self.owner, reverse('pending-feedback')),
+            (self.owner, reverse('pending-feedback-count')),
+            (self.guide, reverse('guide-available')),
+            (self.guide, reverse('guide-available') + '?page_size=10'),
+            (self.guide, reverse('guide-assigned')),
+        ]:
+            with self.subTest(url=url):
+                self.assert_no_full_scan(user, url)
+
+
+class MilestoneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.sr = make_request(self.owner, self.guide)
+        self.client = APIClient()
+        self.client.force_authenticate(self.guide)
+
+    def post_milestone(self, milestone, sr=None):
+        return self.client.post(reverse('request-milestones', args=[(sr or self.sr).pk]), {'milestone': milestone})
+
+    def test_sequence_and_duplicates(self):
+        self.assertEqual(self.post_milestone('pet_on_board').status_code, 400)
+        self.assertEqual(self.post_milestone('arrival_origin').status_code, 201)
+        self.assertEqual(self.post_milestone('arrival_origin').data['detail'], 'Hito ya registrado')
+        self.assertEqual(self.post_milestone('pet_on_board').status_code, 201)
+        self.assertEqual(self.post_milestone('delivered').status_code, 201)
+        self.sr.refresh_from_db()
+        self.assertTrue(self.sr.confirmed)
+
+    def test_only_assigned_guide(self):
+        other = make_user('other-guide', role='guide')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.post_milestone('arrival_origin').status_code, 403)
+
+    def test_query_count(self):
+        self.post_milestone('arrival_origin')
+        self.post_milestone('pet_on_board')
+        before = ServiceRequest.objects.values_list('updated_at', flat=True).get(pk=self.sr.pk)
+        # solicitud, hitos existentes, insert y update de confirmed (con updated_at) dentro de un savepoint
+        with self.assertNumQueries(6):
+            self.assertEqual(self.post_milestone('delivered').status_code, 201)
+        self.sr.refresh_from_db()
+        self.assertGreater(self.sr.updated_at, before)
+
+    def test_batch_for_several_requests(self):
+        second = make_request(self.owner, self.guide)
+        foreign = make_request(self.owner, make_user('other-guide', role='guide'))
+        items = [
+            {'request': self.sr.pk, 'milestone': 'arrival_origin'},
+            {'request': self.sr.pk, 'milestone': 'pet_on_board'},
+            {'request': self.sr.pk, 'milestone': 'delivered'},
+            {'request': second.pk, 'milestone': 'pet_on_board'},
+            {'request': second.pk, 'milestone': 'arrival_origin'},
+            {'request': foreign.pk, 'milestone': 'arrival_origin'},
+            {'request': 999999, 'milestone': 'arrival_origin'},
+            {'request': self.sr.pk, 'milestone': 'arrival_origin'},
+        ]
+        # solicitudes, hitos existentes, un insert y un update dentro de un savepoint
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('milestone-batch'), items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 201, 201, 400, 201, 403, 404, 400])
+        self.assertEqual(response.data['results'][0]['milestone']['milestone'], 'arrival_origin')
+        self.assertEqual(self.sr.milestones.count(), 3)
+        self.assertEqual(list(second.milestones.values_list('milestone', flat=True)), ['arrival_origin'])
+        self.sr.refresh_from_db()
+        self.assertTrue(self.sr.confirmed)
+
+    def test_batch_invalidates_history(self):
+        self.client.force_authenticate(self.owner)
+        self.client.get(reverse('user-history-requests'))
+        self.client.force_authenticate(self.guide)
+        self.client.post(reverse('milestone-batch'), [{'request': self.sr.pk, 'milestone': 'arrival_origin'}], format='json')
+        self.client.force_authenticate(self.owner)
+        history = self.client.get(reverse('user-history-requests'))
+        self.assertEqual(len(history.data[0]['milestones']), 1)
+
+    def test_batch_rejects_non_list(self):
+        response = self.client.post(reverse('milestone-batch'), {'request': self.sr.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SeedDataTests(TestCase):
+    def test_seed_data_is_consistent(self):
+        call_command('seed_data', users=3, guides=2, requests_per_user=4, stdout=io.StringIO())
+        self.assertEqual(ServiceRequest.objects.count(), 12)
+        self.assertEqual(User.objects.filter(profile__role='guide').count(), 2)
+        for sr in ServiceRequest.objects.all():
+            self.assertEqual(sr.origin_cell, geo.cell_for(sr.origin_lat, sr.origin_lng))
+        self.assertEqual(
+            sum(GuideRatingStats.objects.values_list('rating_count', flat=True)),
+            ServiceRating.objects.count(),
+        )
+
+
+@override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0})
+class RequestProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('pets'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+    @override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0, 'SLOW_REQUEST_MS': 0})
+    def test_slow_request_logged_with_duplicates(self):
+        with self.assertLogs('my_app.profiling', level='WARNING') as logs:
+            self.client.get(reverse('pets'))
+        record = json.loads(logs.output[0].split(':', 2)[2])
+        self.assertEqual(record['view'], 'pets')
+        self.assertEqual(record['status'], 200)
+        self.assertGreaterEqual(record['queries'], 1)
+
+    def test_recorder_fingerprints_repeated_sql(self):
+        recorder = _QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in (1, 2, 3):
+                list(Pet.objects.filter(pk=pk))
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.fingerprints.most_common(1)[0][1], 3)
+
+    @override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_untouched(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('pets')))
+
+
+class RegistrationQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_register_writes_user_and_profile_once(self):
+        data = {'username': 'nuevo', 'password': 'secret123', 'password2': 'secret123', 'role': 'guide'}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('register'), data)
+        self.assertEqual(response.status_code, 201)
+        writes = [q['sql'].split()[0] + ' ' + q['sql'].split()[2] for q in ctx.captured_queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(writes, ['INSERT "auth_user"', 'INSERT "my_app_profile"'])
+        self.assertEqual(User.objects.get(username='nuevo').profile.role, 'guide')
+
+    def test_default_role(self):
+        self.client.post(reverse('register'), {'username': 'u', 'password': 'secret123', 'password2': 'secret123'})
+        self.assertEqual(User.objects.get(username='u').profile.role, 'user')
+
+    def test_token_obtain_is_a_single_read(self):
+        make_user('owner')
+        # usuario y perfil (para el claim de rol) en un solo SELECT, sin escrituras
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('token_obtain_pair'), {'username': 'owner', 'password': 'secret123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(ctx.captured_queries[0]['sql'].startswith('SELECT'))
+
+    def test_last_login_update_is_single_write(self):
+        user = make_user('owner')
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+
+class RoleClaimAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.guide = make_user('guide', role='guide')
+        self.owner = make_user('owner')
+        self.client = APIClient()
+
+    def login(self, username):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': username, 'password': 'secret123'})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return response.data
+
+    def test_tokens_carry_role(self):
+        tokens = self.login('guide')
+        self.assertEqual(AccessToken(tokens['access'])['role'], 'guide')
+        refreshed = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(AccessToken(refreshed.data['access'])['role'], 'guide')
+
+    def test_refresh_rereads_role(self):
+        tokens = self.login('owner')
+        self.owner.profile.role = 'guide'
+        self.owner.profile.save()
+        refreshed = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(AccessToken(refreshed.data['access'])['role'], 'guide')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['access']}")
+        self.assertEqual(self.client.get(reverse('guide-assigned')).status_code, 200)
+
+    def test_register_tokens_carry_role(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'nuevo', 'password': 'secret123', 'password2': 'secret123', 'role': 'guide'})
+        self.assertEqual(AccessToken(response.data['tokens']['access'])['role'], 'guide')
+
+    def test_guide_poll_does_not_read_user_or_profile(self):
+        self.login('guide')
+        self.client.get(reverse('guide-assigned'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('guide-assigned'))
+        self.assertEqual(response.status_code, 200)
+        for query in ctx.captured_queries:
+            self.assertNotIn('"auth_user"', query['sql'].split('FROM', 1)[1].split('WHERE')[0])
+            self.assertNotIn('my_app_profile', query['sql'])
+
+    def test_user_role_rejected_by_claim(self):
+        self.login('owner')
+        self.assertEqual(self.client.get(reverse('guide-assigned')).status_code, 403)
+
+    def test_deactivated_user_is_rejected(self):
+        self.login('owner')
+        self.assertEqual(self.client.get(reverse('current-user')).status_code, 200)
+        self.owner.is_active = False
+        self.owner.save()
+        self.assertEqual(self.client.get(reverse('current-user')).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.login('owner')
+        self.assertEqual(self.client.get(reverse('current-user')).status_code, 200)
+        self.owner.delete()
+        self.assertEqual(self.client.get(reverse('current-user')).status_code, 401)
+
+
+# el relay del outbox (un thread con su propia conexión) se prueba aparte
+@override_settings(EVENT_OUTBOX_POLL_SECONDS=0)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+
+    def test_request_and_milestone_events_published_on_commit(self):
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            sr = make_request(self.owner)
+            self.assertFalse(publish.called)
+        publish.assert_called_once()
+        channels, event_type, data = publish.call_args.args
+        self.assertEqual((channels, event_type, data['id']), ([GUIDES_CHANNEL], 'request.created', sr.id))
+
+        client = APIClient()
+        client.force_authenticate(self.guide)
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse('request-accept', args=[sr.pk]))
+            client.post(reverse('request-milestones', args=[sr.pk]), {'milestone': 'arrival_origin'})
+        self.assertEqual([c.args[1] for c in publish.call_args_list], ['request.accepted', 'milestone.created'])
+        self.assertIn(user_channel(self.owner.id), publish.call_args_list[1].args[0])
+
+    def test_wsgi_request_rejected(self):
+        response = self.client.get(reverse('events'))
+        self.assertEqual(response.status_code, 501)
+
+    async def test_sse_stream_delivers_events(self):
+        token = get_tokens_for_user(self.guide)['access']
+        response = await self.async_client.get(reverse('events'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+
+        # se publica desde otro thread, como lo haría una vista sync
+        thread = threading.Thread(target=broker.publish, args=([GUIDES_CHANNEL], 'request.created', {'id': 7}))
+        thread.start()
+        chunk = await asyncio.wait_for(anext(chunks), 2)
+        thread.join()
+        self.assertEqual(chunk, b'event: request.created\ndata: {"id": 7}\n\n')
+        await chunks.aclose()
+        # streaming_content no cierra el generador de la vista; se cierra acá y no en el GC
+        await response._iterator.aclose()
+
+    def test_outbox_relay_delivers_worker_events_once(self):
+        OutboxEvent.objects.create(channels=[GUIDES_CHANNEL], event_type='request.created', data={'id': 1},
+                                   created_at=timezone.now() - timedelta(minutes=30))
+        local = EventBroker()
+        relay = OutboxRelay(local)
+        relay.reset()
+        with mock.patch.object(local, 'publish') as publish:
+            publish_via_outbox([([GUIDES_CHANNEL], 'request.created', {'id': 7})])
+            self.assertEqual(relay.poll(), 1)
+            # dentro de la ventana de solape se vuelve a leer pero no se repite
+            self.assertEqual(relay.poll(), 0)
+        publish.assert_called_once_with([GUIDES_CHANNEL], 'request.created', {'id': 7})
+        self.assertEqual(prune_outbox(), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    async def test_broker_unsubscribes_and_flags_overflow(self):
+        small = EventBroker(queue_size=1)
+        async with small.subscribe(['a', 'b']) as sub:
+            self.assertEqual(small.subscriber_count(), 1)
+            small.publish(['a', 'b'], 'x', {})
+            small.publish(['a'], 'y', {})
+            await asyncio.sleep(0)
+            self.assertEqual(sub.queue.qsize(), 1)
+            self.assertTrue(sub.overflowed)
+        self.assertEqual(small.subscriber_count(), 0)
+
+    async def test_sse_requires_token(self):
+        response = await self.async_client.get(reverse('events'))
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncReadViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        make_request(self.owner, self.guide, delivered=True, rated=True)
+        make_request(self.owner, self.guide)
+        make_request(self.owner)
+        self.owner_auth = {'Authorization': f"Bearer {get_tokens_for_user(self.owner)['access']}"}
+        self.guide_auth = {'Authorization': f"Bearer {get_tokens_for_user(self.guide)['access']}"}
+
+    async def assert_same_as_sync(self, sync_name, async_name, headers, args=()):
+        expected = await sync_to_async(self.client.get)(reverse(sync_name, args=args), headers=headers)
+        response = await self.async_client.get(reverse(async_name, args=args), headers=headers)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        return response
+
+    async def test_async_variants_match_sync_output(self):
+        await self.assert_same_as_sync('user-history-requests', 'async-user-history-requests', self.owner_auth)
+        await self.assert_same_as_sync('guide-available', 'async-guide-available', self.guide_auth)
+        await self.assert_same_as_sync('guide-assigned', 'async-guide-assigned', self.guide_auth)
+        await self.assert_same_as_sync('current-user', 'async-current-user', self.owner_auth)
+        await self.assert_same_as_sync('guide-profile', 'async-guide-profile', {}, args=[self.guide.pk])
+
+    async def test_async_permissions(self):
+        await self.assert_same_as_sync('guide-available', 'async-guide-available', self.owner_auth)
+        await self.assert_same_as_sync('user-history-requests', 'async-user-history-requests', {})
+        await self.assert_same_as_sync('guide-profile', 'async-guide-profile', {}, args=[999])
+
+    @override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0})
+    async def test_profiling_counts_async_queries(self):
+        response = await self.async_client.get(reverse('async-user-history-requests'), headers=self.owner_auth)
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.sr = make_request(self.owner, self.guide, delivered=True, rated=True, observations='x' * 500)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def get(self, name, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(name), params)
+        return response, ctx.captured_queries
+
+    def test_full_representation_by_default(self):
+        response, _ = self.get('requests')
+        self.assertIn('milestones', response.data[0])
+        self.assertIn('observations', response.data[0])
+
+    def test_compact_list_skips_relations_and_long_columns(self):
+        response, queries = self.get('user-history-requests', expand='')
+        self.assertEqual(list(response.data[0]), [
+            'id', 'service_type', 'schedule_type', 'scheduled_datetime',
+            'origin_text', 'dest_text', 'pet', 'created_at', 'confirmed',
+        ])
+        self.assertEqual(response.data[0]['pet'], self.sr.pet_id)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('observations', queries[0]['sql'])
+        self.assertNotIn('quick_pet_notes', queries[0]['sql'])
+
+    def test_fields_and_expand(self):
+        response, queries = self.get('requests', fields='id,origin_text', expand='milestones,rating')
+        row = response.data[0]
+        self.assertEqual(list(row), ['id', 'origin_text', 'milestones', 'rating'])
+        self.assertEqual(len(row['milestones']), 3)
+        self.assertEqual(row['rating']['stars'], 5)
+        # solicitudes+rating en un JOIN y los hitos en un prefetch
+        self.assertEqual(len(queries), 2)
+
+    def test_guide_lists_and_pagination(self):
+        self.client.force_authenticate(self.guide)
+        make_request(self.owner)
+        response, _ = self.get('guide-available', fields='id,created_at', page_size=10)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'created_at'])
+        response, _ = self.get('guide-assigned', fields='id,confirmed')
+        self.assertEqual(response.data, [{'id': self.sr.id, 'confirmed': True}])
+
+    def test_unknown_fields_rejected(self):
+        response, _ = self.get('requests', fields='id,user')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+        response, _ = self.get('user-history-requests', expand='observations')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('expand', response.data)
+
+    def test_writes_ignore_fieldset(self):
+        response = self.client.post(reverse('requests') + '?fields=id', {
+            'service_type': 'paseo', 'schedule_type': 'immediate',
+            'origin_text': 'A', 'dest_text': 'B', 'observations': 'nota',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['observations'], 'nota')
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        make_request(self.owner, self.guide, delivered=True, rated=True, origin_lat='-33.4500001',
+                     origin_lng='-70.6600000', dest_lat='-33.5', dest_lng='-70.7')
+        make_request(self.owner, self.guide, schedule_type='scheduled',
+                     scheduled_datetime=datetime(2030, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc),
+                     observations='ñandú \u2028 "comillas"', quick_pet_notes='línea\nnueva')
+        make_request(self.owner, pet=None)
+        self.qs = ServiceRequest.objects.filter(user=self.owner).order_by('-created_at', '-id')
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def fast_data(self, fields=None):
+        serializer_class = FastServiceRequestSerializer.for_fieldset(fields)
+        return serializer_class(serializer_class.prepare(self.qs), many=True).data
+
+    def test_byte_identical_to_model_serializer(self):
+        expected = self.render(ServiceRequestSerializer(self.qs.with_details(), many=True).data)
+        self.assertEqual(self.render(self.fast_data()), expected)
+
+    def test_byte_identical_with_fieldsets(self):
+        for fields in [('id', 'origin_lat', 'created_at'), tuple(ServiceRequestSerializer.COMPACT_FIELDS),
+                       ('id', 'pet_detail', 'milestones'), ('rating', 'scheduled_datetime')]:
+            expected = ServiceRequestSerializer(self.qs.for_fieldset(fields), many=True, fields=fields).data
+            self.assertEqual(self.render(self.fast_data(fields)), self.render(expected), fields)
+
+    def test_fixed_query_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.fast_data()
+        self.assertEqual(len(ctx.captured_queries), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.fast_data(('id', 'origin_text'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_endpoints_match_drf_path(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        for params in [{}, {'page_size': 2}, {'expand': 'rating'}, {'stream': 1}]:
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZATION=False):
+                expected = client.get(reverse('user-history-requests'), params)
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZATION=True):
+                response = client.get(reverse('user-history-requests'), params)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            expected = b''.join(expected.streaming_content) if expected.streaming else expected.content
+            self.assertEqual(content, expected, params)
+
+
+class FastJSONRendererTests(TestCase):
+    data = {
+        'text': 'ñandú \u2028\u2029 "x"', 'decimal': Decimal('1.50'), 'float': 0.1,
+        'when': datetime(2024, 5, 6, 7, 8, 9, 123456, tzinfo=dt_timezone.utc),
+        'none': None, 'nested': [{'a': True}], 1: 'clave numérica',
+    }
+
+    def test_same_output_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_stdlib_fallback(self):
+        with mock.patch('my_app.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        big = {'n': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(big), JSONRenderer().render(big))
+
+    def test_indent_uses_json_renderer(self):
+        rendered = FastJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, JSONRenderer().render({'a': 1}, 'application/json; indent=2'))
+
+
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.other = make_user('other')
+        self.pet = Pet.objects.create(owner=self.owner, name='Firulais')
+        self.foreign_pet = Pet.objects.create(owner=self.other, name='Ajeno')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def request_item(self, **extra):
+        item = {'service_type': 'paseo', 'schedule_type': 'immediate', 'origin_text': 'A', 'dest_text': 'B'}
+        item.update(extra)
+        return item
+
+    def post_requests(self, items):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('request-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], len(ctx.captured_queries)
+
+    def test_bulk_create_pets(self):
+        response = self.client.post(reverse('pet-bulk'), [{'name': 'A'}, {'species': 'gato'}, {'name': 'B'}],
+                                    format='json')
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [201, 400, 201])
+        self.assertIn('name', results[1]['errors'])
+        self.assertEqual(results[2]['pet']['name'], 'B')
+        self.assertEqual(Pet.objects.filter(owner=self.owner).count(), 3)
+
+    def test_bulk_create_requests_with_per_item_errors(self):
+        results, _ = self.post_requests([
+            self.request_item(pet=self.pet.pk, origin_lat='-33.45', origin_lng='-70.66'),
+            self.request_item(pet=self.foreign_pet.pk),
+            self.request_item(dest_text=''),
+            'no es un objeto',
+        ])
+        self.assertEqual([r['status'] for r in results], [201, 400, 400, 400])
+        self.assertIn('pet', results[1]['errors'])
+        sr = ServiceRequest.objects.get(pk=results[0]['request']['id'])
+        self.assertEqual((sr.user, sr.pet), (self.owner, self.pet))
+        self.assertEqual(sr.origin_cell, geo.cell_for(sr.origin_lat, sr.origin_lng))
+        self.assertEqual(results[0]['request']['milestones'], [])
+
+    def test_query_count_does_not_grow_with_items(self):
+        _, few = self.post_requests([self.request_item(pet=self.pet.pk)])
+        _, many = self.post_requests([self.request_item(pet=self.pet.pk) for _ in range(20)])
+        self.assertEqual(few, many)
+
+    def test_bulk_create_invalidates_history_and_publishes(self):
+        self.client.get(reverse('user-history-requests'))
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            results, _ = self.post_requests([self.request_item(), self.request_item()])
+        self.assertEqual([c.args[1] for c in publish.call_args_list], ['request.created'] * 2)
+        self.assertEqual(len(self.client.get(reverse('user-history-requests')).data), 2)
+
+    def test_bulk_update(self):
+        mine = make_request(self.owner)
+        theirs = make_request(self.other)
+        response = self.client.patch(reverse('request-bulk'), [
+            {'id': mine.pk, 'observations': 'timbre roto', 'origin_lat': '-33.4', 'origin_lng': '-70.6'},
+            {'id': theirs.pk, 'observations': 'x'},
+            {'id': mine.pk, 'pet': self.foreign_pet.pk},
+        ], format='json')
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [200, 404, 400])
+        mine.refresh_from_db()
+        theirs.refresh_from_db()
+        self.assertEqual(mine.observations, 'timbre roto')
+        self.assertEqual(mine.origin_cell, geo.cell_for(mine.origin_lat, mine.origin_lng))
+        self.assertEqual(theirs.observations, '')
+
+    def test_bulk_update_rejects_bool_and_duplicate_ids(self):
+        mine = make_request(self.owner)
+        response = self.client.patch(reverse('request-bulk'), [
+            {'id': True, 'observations': 'x'},
+            {'id': mine.pk, 'observations': 'primera'},
+            {'id': mine.pk, 'observations': 'segunda'},
+        ], format='json')
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [400, 200, 400])
+        mine.refresh_from_db()
+        self.assertEqual(mine.observations, 'primera')
+
+    def test_rejects_non_list_and_too_many(self):
+        self.assertEqual(self.client.post(reverse('pet-bulk'), {'name': 'A'}, format='json').status_code, 400)
+        response = self.client.post(reverse('pet-bulk'), [{'name': 'A'}] * 101, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ChangeTrackingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.sr = make_request(self.owner, observations='o' * 1000, quick_pet_notes='n' * 1000)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def writes(self, method, url, data):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertIn(response.status_code, (200, 201))
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_patch_updates_only_changed_columns(self):
+        updates = self.writes('patch', reverse('request-detail', args=[self.sr.pk]), {'dest_text': 'Otro'})
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'^UPDATE "my_app_servicerequest" SET "dest_text" = \S+, "updated_at" = \S+ \S+ WHERE')
+
+    def test_coordinates_update_origin_cell(self):
+        updates = self.writes('patch', reverse('request-detail', args=[self.sr.pk]),
+                              {'origin_lat': '-33.45', 'origin_lng': '-70.66'})
+        set_clause = updates[0].split(' WHERE ')[0]
+        self.assertEqual(sorted(re.findall(r'"(\w+)" = ', set_clause)), ['origin_cell', 'origin_lat', 'origin_lng', 'updated_at'])
+        self.sr.refresh_from_db()
+        self.assertEqual(self.sr.origin_cell, geo.cell_for(self.sr.origin_lat, self.sr.origin_lng))
+
+    def test_unchanged_save_skips_update(self):
+        self.assertEqual(self.writes('patch', reverse('request-detail', args=[self.sr.pk]),
+                                     {'dest_text': self.sr.dest_text}), [])
+        self.assertEqual(self.writes('put', reverse('pet-detail', args=[self.sr.pet_id]),
+                                     {'name': 'Firulais', 'species': 'perro'}), [])
+
+    def test_pet_patch(self):
+        updates = self.writes('patch', reverse('pet-detail', args=[self.sr.pet_id]), {'notes': 'alérgico'})
+        self.assertRegex(updates[0], r'^UPDATE "my_app_pet" SET "notes" = \S+ WHERE')
+        self.assertEqual(Pet.objects.get(pk=self.sr.pet_id).notes, 'alérgico')
+
+    def test_tracking_after_save_refresh_and_deferred_fields(self):
+        sr = ServiceRequest.objects.only('id', 'dest_text').get(pk=self.sr.pk)
+        sr.dest_text = 'X'
+        self.assertEqual(sr.changed_fields(), ['dest_text'])
+        sr.save()
+        self.assertEqual(sr.changed_fields(), [])
+        sr.observations  # carga diferida: no cuenta como cambio
+        self.assertEqual(sr.changed_fields(), [])
+        ServiceRequest.objects.filter(pk=sr.pk).update(dest_text='Y')
+        sr.refresh_from_db()
+        self.assertEqual((sr.dest_text, sr.changed_fields()), ('Y', []))
+        self.assertIsNone(ServiceRequest(user=self.owner).changed_fields())
+
+
+class DatabaseRoutingTests(TestCase):
+    def test_reads_go_to_replicas_only_inside_read_block(self):
+        router = ReadReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica1', 'replica2']):
+            self.assertEqual(router.db_for_read(Pet), 'default')
+            with read_from_replicas():
+                self.assertIn(router.db_for_read(Pet), ['replica1', 'replica2'])
+                self.assertEqual(router.db_for_write(Pet), 'default')
+            self.assertFalse(router.allow_migrate('replica1', 'my_app'))
+            self.assertTrue(router.allow_migrate('default', 'my_app'))
+        with read_from_replicas():
+            self.assertEqual(router.db_for_read(Pet), 'default')
+
+    def test_middleware_marks_only_safe_methods(self):
+        seen = []
+        middleware = ReadReplicaMiddleware(lambda request: seen.append(ReadReplicaRouter().db_for_read(Pet)))
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            middleware(mock.Mock(method='GET'))
+            middleware(mock.Mock(method='POST'))
+        self.assertEqual(seen, ['replica1', 'default'])
+
+    def test_cached_responses_built_from_primary(self):
+        owner = make_user('owner')
+        make_request(owner)
+        client = APIClient()
+        client.force_authenticate(owner)
+        seen = []
+        route = ReadReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            seen.append((model, route(router, model, **hints)))
+            return 'default'
+
+        cache.clear()
+        with override_settings(DATABASE_REPLICAS=['replica1']), \
+                mock.patch.object(ReadReplicaRouter, 'db_for_read', record):
+            self.assertEqual(client.get(reverse('user-history-requests')).status_code, 200)
+        self.assertEqual({alias for model, alias in seen if model is ServiceRequest}, {'default'})
+
+    def test_sqlite_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            # 1 = NORMAL (SQLITE_PRAGMAS)
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(SCHEDULED_RELEASE_LEAD_MINUTES=60, SCHEDULED_REMINDER_LEAD_MINUTES=30)
+class ScheduledDispatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.client = APIClient()
+        self.client.force_authenticate(self.guide)
+        self.now = timezone.now()
+
+    def scheduled(self, minutes, **extra):
+        return make_request(self.owner, schedule_type='scheduled',
+                            scheduled_datetime=self.now + timedelta(minutes=minutes), **extra)
+
+    def available_ids(self):
+        return {item['id'] for item in self.client.get(reverse('guide-available')).json()}
+
+    def outbox(self):
+        return [(e.channels, e.event_type, e.data['id']) for e in OutboxEvent.objects.order_by('id')]
+
+    def test_future_requests_hidden_until_released(self):
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            later = self.scheduled(24 * 60)
+            soon = self.scheduled(30)
+        # sólo la que ya entra en la anticipación se publica al crearla
+        self.assertEqual([c.args[2]['id'] for c in publish.call_args_list], [soon.id])
+        self.assertEqual(self.available_ids(), {soon.id})
+        response = self.client.post(reverse('request-accept', args=[later.pk]))
+        self.assertEqual(response.status_code, 400)
+        later.refresh_from_db()
+        self.assertIsNone(later.assigned_guide_id)
+
+        tomorrow = self.now + timedelta(hours=23, minutes=30)
+        self.assertEqual(release_due_requests(now=tomorrow), 1)
+        self.assertEqual(release_due_requests(now=tomorrow), 0)
+        # el worker no tiene conexiones SSE: el evento queda en el outbox
+        self.assertEqual(self.outbox(), [([GUIDES_CHANNEL], 'request.created', later.id)])
+        self.assertEqual(self.available_ids(), {soon.id, later.id})
+
+    def test_release_in_batches(self):
+        requests = [self.scheduled(24 * 60 + i) for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_due_requests(now=self.now + timedelta(days=2), batch_size=2), 5)
+        self.assertEqual(ServiceRequest.objects.filter(released_at__isnull=False).count(), len(requests))
+
+    def test_reminders_sent_once(self):
+        assigned = self.scheduled(20, assigned_guide=self.guide)
+        self.scheduled(24 * 60)
+        self.assertEqual(send_due_reminders(), 1)
+        self.assertEqual(send_due_reminders(), 0)
+        self.assertEqual(self.outbox(), [
+            ([user_channel(self.owner.id), guide_channel(self.guide.id)], 'request.reminder', assigned.id),
+        ])
+
+    def test_past_requests_get_no_events(self):
+        # filas anteriores a released_at/reminder_sent_at: ya pasadas, entregadas o asignadas
+        past = [
+            self.scheduled(-24 * 60),
+            self.scheduled(-60, assigned_guide=self.guide, confirmed=True),
+            self.scheduled(20, assigned_guide=self.guide, confirmed=True),
+        ]
+        ServiceRequest.objects.filter(pk__in=[sr.pk for sr in past]).update(released_at=None)
+        self.assertEqual(release_due_requests(now=self.now), 3)
+        self.assertEqual(send_due_reminders(now=self.now), 0)
+        self.assertEqual(self.outbox(), [])
+
+    def test_reschedule_resets_release_and_reminder(self):
+        sr = self.scheduled(20, assigned_guide=self.guide)
+        send_due_reminders(now=self.now)
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.patch(reverse('request-detail', args=[sr.pk]),
+                                {'scheduled_datetime': (self.now + timedelta(days=1)).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        sr.refresh_from_db()
+        self.assertEqual((sr.released_at, sr.reminder_sent_at), (None, None))
+        self.assertEqual(send_due_reminders(now=self.now + timedelta(hours=23, minutes=40)), 1)
+
+        unassigned = self.scheduled(24 * 60)
+        response = client.patch(reverse('request-bulk'), [
+            {'id': unassigned.pk, 'scheduled_datetime': (self.now + timedelta(minutes=30)).isoformat()},
+        ], format='json')
+        self.assertEqual(response.data['results'][0]['status'], 200)
+        # dentro de la anticipación vuelve al pool en el mismo UPDATE
+        self.assertIn(unassigned.id, self.available_ids())
+
+    def test_command_runs_a_single_pass(self):
+        self.scheduled(24 * 60)
+        out = io.StringIO()
+        call_command('dispatch_scheduled', stdout=out)
+        self.assertIn('0 solicitudes liberadas', out.getvalue())
+
+    def test_pending_queries_use_partial_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN es específico de SQLite')
+        for i in range(50):
+            self.scheduled(24 * 60 + i)
+        with CaptureQueriesContext(connection) as ctx:
+            release_due_requests(now=self.now)
+            send_due_reminders(now=self.now)
+        # las dos búsquedas de pendientes (sin nada vencido no hay UPDATE)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 2)
+        with connection.cursor() as cursor:
+            for name, sql in zip(['release', 'reminder'], selects):
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn(f'sr_sched_pending_{name}_idx', plan)
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.delivered = make_request(self.owner, self.guide, delivered=True)
+        self.other = make_request(self.owner, self.guide)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def sync(self, url, since='', user=None):
+        if user:
+            self.client.force_authenticate(user)
+        response = self.client.get(url, {'since': since})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['since'], [item['id'] for item in data['changed']], data['deleted']
+
+    def test_history_returns_only_changes_since_cursor(self):
+        url = reverse('user-history-requests')
+        cursor, changed, deleted = self.sync(url)
+        self.assertEqual((sorted(changed), deleted), (sorted([self.delivered.id, self.other.id]), []))
+        self.assertEqual(self.sync(url, cursor)[1:], ([], []))
+
+        # la calificación cambia la solicitud aunque no se escriba ninguna de sus columnas
+        self.client.post(reverse('request-rating', args=[self.delivered.pk]), {'stars': 4})
+        cursor, changed, _ = self.sync(url, cursor)
+        self.assertEqual(changed, [self.delivered.id])
+
+        self.client.delete(reverse('request-detail', args=[self.other.pk]))
+        cursor, changed, deleted = self.sync(url, cursor)
+        self.assertEqual((changed, deleted), ([], [self.other.id]))
+
+    def test_reads_from_primary_with_replicas(self):
+        seen = []
+        route = ReadReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            seen.append((model, route(router, model, **hints)))
+            return 'default'
+
+        with override_settings(DATABASE_REPLICAS=['replica1']), \
+                mock.patch.object(ReadReplicaRouter, 'db_for_read', record):
+            self.sync(reverse('user-history-requests'))
+        aliases = {alias for model, alias in seen if model in (ServiceRequest, ServiceRequestTombstone)}
+        self.assertEqual(aliases, {'default'})
+
+    def test_guide_assigned_sees_milestones_and_pet_edits(self):
+        url = reverse('guide-assigned')
+        cursor, changed, _ = self.sync(url, user=self.guide)
+        self.assertEqual(sorted(changed), sorted([self.delivered.id, self.other.id]))
+        self.client.post(reverse('request-milestones', args=[self.other.pk]), {'milestone': 'arrival_origin'})
+        cursor, changed, _ = self.sync(url, cursor)
+        self.assertEqual(changed, [self.other.id])
+
+        self.client.force_authenticate(self.owner)
+        self.client.patch(reverse('pet-detail', args=[self.delivered.pet_id]), {'notes': 'muerde'})
+        self.assertEqual(self.sync(url, cursor, user=self.guide)[1], [self.delivered.id])
+
+    def test_internal_rewrites_do_not_resync(self):
+        url = reverse('user-history-requests')
+        cursor, _, _ = self.sync(url)
+        ServiceRequest.objects.filter(pk=self.other.pk).update(origin_cell=0)
+        call_command('rebuild_origin_cells', stdout=io.StringIO())
+        self.assertEqual(self.sync(url, cursor)[1], [])
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.origin_cell, geo.cell_for(self.other.origin_lat, self.other.origin_lng))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('user-history-requests'), {'since': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_delta_queries_use_updated_at_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN es específico de SQLite')
+        with CaptureQueriesContext(connection) as ctx:
+            self.sync(reverse('user-history-requests'), '2020-01-01T00:00:00Z')
+        sql = next(q['sql'] for q in ctx.captured_queries if 'updated_at' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('sr_user_updated_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class MatchingTests(TestCase):
+    params = MatchingParams(max_distance_km=10, max_active=1, load_penalty_km=2.0, rating_weight_km=1.0)
+
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.near = make_user('near-guide', role='guide')
+        self.far = make_user('far-guide', role='guide')
+
+    def test_solve_respects_distance_capacity_and_rating(self):
+        requests = [MatchRequest(1, -33.45, -70.66), MatchRequest(2, -33.451, -70.66), MatchRequest(3, -34.5, -70.66)]
+        guides = [MatchGuide(10, -33.45, -70.661, 5.0, 0), MatchGuide(20, -33.46, -70.66, 5.0, 0)]
+        # el 10 queda lleno con la 1; la 2 va al 20 y la 3 está fuera de radio
+        self.assertEqual(solve(requests, guides, self.params), [(1, 10), (2, 20)])
+        # a igual distancia gana el mejor calificado
+        guides = [MatchGuide(10, -33.46, -70.66, 3.0, 0), MatchGuide(20, -33.44, -70.66, 4.5, 0)]
+        self.assertEqual(solve(requests[:1], guides, self.params), [(1, 20)])
+        # la carga cuenta: el guía con una activa sólo toma otra si su capacidad lo permite
+        busy = [MatchGuide(10, -33.45, -70.66, 5.0, 1)]
+        self.assertEqual(solve(requests[:1], busy, self.params), [])
+        self.assertEqual(solve(requests[:1], busy, self.params._replace(max_active=2)), [(1, 10)])
+
+    def test_solve_next_to_antimeridian(self):
+        requests = [MatchRequest(1, 10.0, 179.995)]
+        guides = [MatchGuide(10, 10.0, 179.995, 5.0, 0), MatchGuide(20, 10.0, 180.0, 5.0, 0)]
+        self.assertEqual(solve(requests, guides, self.params), [(1, 10)])
+        self.assertEqual(solve(requests, guides[1:], self.params), [(1, 20)])
+
+    def set_location(self, guide, lat, lng, available=True):
+        client = APIClient()
+        client.force_authenticate(guide)
+        return client.patch(reverse('guide-availability'), {'available': available, 'lat': lat, 'lng': lng},
+                            format='json')
+
+    @override_settings(MATCHING_MAX_ACTIVE_PER_GUIDE=1)
+    def test_run_matching_assigns_in_one_transaction(self):
+        self.assertEqual(self.set_location(self.near, '-33.45', '-70.66').status_code, 200)
+        self.assertEqual(self.set_location(self.far, '-33.50', '-70.66').status_code, 200)
+        first = make_request(self.owner, origin_lat='-33.4501', origin_lng='-70.6601')
+        second = make_request(self.owner, origin_lat='-33.4502', origin_lng='-70.6602')
+        unlocated = make_request(self.owner)
+        later = make_request(self.owner, schedule_type='scheduled', origin_lat='-33.45', origin_lng='-70.66',
+                             scheduled_datetime=timezone.now() + timedelta(days=1))
+
+        assigned = run_matching()
+        self.assertEqual(assigned, [(first.id, self.near.id), (second.id, self.far.id)])
+        # match_requests no tiene conexiones SSE: los eventos van por el outbox
+        self.assertEqual(
+            sorted((e.event_type, e.data['id']) for e in OutboxEvent.objects.all()),
+            [('request.accepted', first.id), ('request.accepted', second.id)],
+        )
+        for sr in (unlocated, later):
+            sr.refresh_from_db()
+            self.assertIsNone(sr.assigned_guide_id)
+        # ambos guías están llenos
+        self.assertEqual(run_matching(), [])
+
+    def test_unavailable_and_stale_guides_ignored(self):
+        self.set_location(self.near, '-33.45', '-70.66', available=False)
+        self.set_location(self.far, '-33.45', '-70.66')
+        GuideAvailability.objects.filter(guide=self.far).update(updated_at=timezone.now() - timedelta(hours=1))
+        make_request(self.owner, origin_lat='-33.45', origin_lng='-70.66')
+        self.assertEqual(run_matching(), [])
+
+    def test_availability_validation(self):
+        self.assertEqual(self.set_location(self.near, '-33.45', None).status_code, 400)
+        self.assertEqual(self.set_location(self.near, '-95', '-70').status_code, 400)
+
+
+class MilestoneAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.admin = User.objects.create_superuser('admin', password='secret123')
+        self.start = datetime(2026, 3, 10, 12, 0, tzinfo=dt_timezone.utc)
+        # waits de 5, 10 y 20 minutos; pickup de 2 y trip de 30 en todas
+        for minutes in (5, 10, 20):
+            self.delivered(minutes)
+        self.delivered(5, service_type='veterinaria')
+        make_request(self.owner, self.guide)  # sin hitos: no cuenta
+
+    def delivered(self, wait_minutes, **extra):
+        sr = make_request(self.owner, self.guide, **extra)
+        ServiceRequest.objects.filter(pk=sr.pk).update(created_at=self.start)
+        offsets = {'arrival_origin': wait_minutes, 'pet_on_board': wait_minutes + 2, 'delivered': wait_minutes + 32}
+        for milestone, offset in offsets.items():
+            m = ServiceRequestMilestone.objects.create(request=sr, milestone=milestone, recorded_by=self.guide)
+            ServiceRequestMilestone.objects.filter(pk=m.pk).update(recorded_at=self.start + timedelta(minutes=offset))
+        return sr
+
+    def test_stage_durations_and_percentiles(self):
+        self.assertEqual(update_summaries(today=date(2026, 3, 12))[2], 8)
+        results = summarize(date(2026, 3, 1), date(2026, 3, 31))
+        by_key = {(r['service_type'], r['stage']): r for r in results}
+        wait = by_key[('paseo', 'wait')]
+        self.assertEqual(wait['count'], 3)
+        self.assertAlmostEqual(wait['avg_seconds'], (5 + 10 + 20) * 60 / 3, places=1)
+        # percentiles aproximados al tramo del histograma (25%)
+        self.assertLess(abs(wait['p50_seconds'] - 600), 150)
+        self.assertLess(abs(wait['p95_seconds'] - 1200), 300)
+        self.assertLess(abs(by_key[('paseo', 'trip')]['p50_seconds'] - 1800), 450)
+        self.assertEqual(by_key[('veterinaria', 'total')]['count'], 1)
+
+    def test_rollup_is_incremental_and_idempotent(self):
+        update_summaries(today=date(2026, 3, 12))
+        update_summaries(today=date(2026, 3, 12))
+        self.assertEqual(MilestoneDailySummary.objects.count(), 8)
+        # una entrega nueva en un día posterior sólo agrega ese día
+        self.start += timedelta(days=1)
+        self.delivered(7)
+        with CaptureQueriesContext(connection) as ctx:
+            first_day, _, rows = update_summaries(today=date(2026, 3, 12))
+        self.assertEqual(first_day, date(2026, 3, 10))
+        self.assertEqual(MilestoneDailySummary.objects.filter(day=date(2026, 3, 11)).count(), 4)
+        milestone_reads = [q for q in ctx.captured_queries if 'servicerequestmilestone' in q['sql']]
+        self.assertEqual(len(milestone_reads), 1)
+
+    def test_endpoint(self):
+        update_summaries(today=date(2026, 3, 12))
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        url = reverse('milestone-analytics')
+        self.assertEqual(client.get(url).status_code, 403)
+        client.force_authenticate(self.admin)
+        response = client.get(url, {'group_by': 'guide', 'from': '2026-03-01', 'to': '2026-03-31'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['stage'] for r in results], STAGES)
+        self.assertEqual({r['guide_id'] for r in results}, {self.guide.id})
+        self.assertEqual(results[0]['count'], 4)
+        self.assertEqual(client.get(url, {'group_by': 'pet'}).status_code, 400)
+        self.assertEqual(client.get(url, {'from': 'marzo'}).status_code, 400)
+
+    def test_command_report(self):
+        out = io.StringIO()
+        call_command('rollup_milestones', '--from', '2026-03-01', '--to', '2026-03-31', '--report', 'service_type',
+                     stdout=out)
+        self.assertIn('8 resúmenes guardados', out.getvalue())
+        self.assertIn('veterinaria', out.getvalue())
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.guide = make_user('guide', role='guide')
+
+    def test_token_bucket_allows_burst_then_refills(self):
+        state = None
+        for _ in range(3):
+            state, wait = take_token(state, 3, 60, now=100.0)
+            self.assertEqual(wait, 0)
+        self.assertEqual(take_token(state, 3, 60, now=100.0), (None, 20.0))
+        # 20 s después hay un token nuevo
+        state, wait = take_token(state, 3, 60, now=120.0)
+        self.assertEqual((state[0], wait), (0, 0))
+
+    @override_settings(RATE_LIMITS={'register': '2/hour'})
+    def test_register_rejected_before_hashing(self):
+        client = APIClient()
+        for i in range(2):
+            response = client.post(reverse('register'), {'username': f'u{i}', 'password': 'secret123', 'password2': 'secret123'})
+            self.assertEqual(response.status_code, 201)
+        with mock.patch('django.contrib.auth.hashers.make_password') as make_password, \
+                CaptureQueriesContext(connection) as ctx:
+            response = client.post(reverse('register'), {'username': 'u3', 'password': 'secret123', 'password2': 'secret123'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(make_password.called)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        # otra IP tiene su propio bucket
+        response = client.post(reverse('register'), {'username': 'u4', 'password': 'secret123', 'password2': 'secret123'},
+                               REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(RATE_LIMITS={'login': '1/min'})
+    def test_login_limited_per_ip(self):
+        client = APIClient()
+        credentials = {'username': 'guide', 'password': 'secret123'}
+        self.assertEqual(client.post(reverse('token_obtain_pair'), credentials).status_code, 200)
+        with mock.patch('django.contrib.auth.hashers.check_password') as check_password:
+            self.assertEqual(client.post(reverse('token_obtain_pair'), credentials).status_code, 429)
+        self.assertFalse(check_password.called)
+
+    @override_settings(RATE_LIMITS={'login': '2/min'})
+    def test_spoofed_forwarded_for_is_ignored(self):
+        client = APIClient()
+        credentials = {'username': 'guide', 'password': 'wrong'}
+        statuses = [client.post(reverse('token_obtain_pair'), credentials, HTTP_X_FORWARDED_FOR=f'1.2.3.{i}').status_code
+                    for i in range(4)]
+        self.assertEqual(statuses, [401, 401, 429, 429])
+
+    @override_settings(RATE_LIMITS={'guide-profile': '1/min'})
+    async def test_async_spoofed_forwarded_for_is_ignored(self):
+        url = reverse('async-guide-profile', args=[self.guide.pk])
+        self.assertEqual((await self.async_client.get(url, headers={'X-Forwarded-For': '1.2.3.1'})).status_code, 200)
+        response = await self.async_client.get(url, headers={'X-Forwarded-For': '1.2.3.2'})
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(RATE_LIMITS={'bulk-write': '1/min'})
+    def test_bulk_write_limited_per_user(self):
+        client = APIClient()
+        other = make_user('other')
+        for user, expected in [(self.guide, 200), (self.guide, 429), (other, 200)]:
+            client.force_authenticate(user)
+            response = client.post(reverse('pet-bulk'), [{'name': 'Firulais'}], format='json')
+            self.assertEqual(response.status_code, expected)
+
+    @override_settings(RATE_LIMITS={'guide-profile': '1/min'})
+    async def test_async_profile_limited(self):
+        url = reverse('async-guide-profile', args=[self.guide.pk])
+        self.assertEqual((await self.async_client.get(url)).status_code, 200)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+
+class PendingFeedbackTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.guide = make_user('guide', role='guide')
+        self.client = APIClient()
+
+    def pending_ids(self):
+        self.client.force_authenticate(self.owner)
+        return [item['id'] for item in self.client.get(reverse('pending-feedback')).data]
+
+    def post_milestones(self, sr, batch=False):
+        self.client.force_authenticate(self.guide)
+        milestones = ['arrival_origin', 'pet_on_board', 'delivered']
+        if batch:
+            self.client.post(reverse('milestone-batch'), [{'request': sr.pk, 'milestone': m} for m in milestones],
+                             format='json')
+        else:
+            for milestone in milestones:
+                self.client.post(reverse('request-milestones', args=[sr.pk]), {'milestone': milestone})
+
+    def test_delivered_sets_flag_and_rating_clears_it(self):
+        single = make_request(self.owner, self.guide)
+        batched = make_request(self.owner, self.guide)
+        make_request(self.owner, self.guide, delivered=True, rated=True)
+        make_request(self.owner)
+        self.assertEqual(self.pending_ids(), [])
+        self.post_milestones(single)
+        self.post_milestones(batched, batch=True)
+        self.assertCountEqual(self.pending_ids(), [single.pk, batched.pk])
+
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.post(reverse('request-rating', args=[single.pk]), {'stars': 4}).status_code, 201)
+        self.assertEqual(self.pending_ids(), [batched.pk])
+        ServiceRating.objects.get(request=single).delete()
+        self.assertCountEqual(self.pending_ids(), [single.pk, batched.pk])
+
+    def test_count_is_one_query(self):
+        for _ in range(3):
+            make_request(self.owner, self.guide, delivered=True)
+        make_request(self.owner, self.guide, delivered=True, rated=True)
+        make_request(make_user('other'), self.guide, delivered=True)
+        self.client.force_authenticate(self.owner)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('pending-feedback-count'))
+        self.assertEqual(response.data, {'count': 3})
+
+    def test_deleted_guide_leaves_the_list(self):
+        sr = make_request(self.owner, self.guide, delivered=True)
+        self.assertEqual(self.pending_ids(), [sr.pk])
+        self.guide.delete()
+        self.assertEqual(self.pending_ids(), [])
+        self.assertEqual(self.client.get(reverse('pending-feedback-count')).data, {'count': 0})
+
+    def test_rebuild_command(self):
+        sr = make_request(self.owner, self.guide, delivered=True)
+        rated = make_request(self.owner, self.guide, delivered=True, rated=True)
+        ServiceRequest.objects.filter(pk=sr.pk).update(feedback_pending=False)
+        ServiceRequest.objects.filter(pk=rated.pk).update(feedback_pending=True)
+        call_command('rebuild_feedback_pending', stdout=io.StringIO())
+        self.assertEqual(list(ServiceRequest.objects.filter(feedback_pending=True).values_list('id', flat=True)), [sr.pk])
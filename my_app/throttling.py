@@ -0,0 +1,112 @@
+"""
+Límite de requests por token bucket guardado en la caché de Django, para los
+endpoints abiertos (registro, login/refresh de JWT, perfil público). Cada vista
+elige su scope con `throttle_scope` y settings.RATE_LIMITS le da la tasa
+"cantidad/periodo": se permiten ráfagas de hasta `cantidad` requests y el bucket se
+recarga de forma continua a cantidad/periodo. Un scope sin tasa no se limita.
+
+Cuesta un get y un set de caché por request y corre antes del trabajo de la vista
+(lecturas, hashing de contraseñas). El get/set no es atómico: con requests
+simultáneas de la misma clave puede pasar alguna de más, a cambio de no tomar locks.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import SimpleRateThrottle
+
+KEY_PREFIX = 'zoolito:throttle'
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60). Periodos: s, min, hour, day (sólo cuenta la primera letra)."""
+    num, period = rate.split('/')
+    return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+def take_token(state, capacity, duration, now):
+    """
+    Aplica una request al estado (tokens, instante) del bucket. Devuelve
+    (estado nuevo, 0) si se permite o (None, segundos hasta el próximo token) si no.
+    """
+    tokens, stamp = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * capacity / duration)
+    if tokens < 1:
+        return None, (1 - tokens) * duration / capacity
+    return (tokens - 1, now), 0
+
+
+def rate_for(scope):
+    rate = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    return parse_rate(rate) if rate else None
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Throttle de DRF por scope (view.throttle_scope). Subclases: IP o usuario.
+    Las tasas se leen de settings.RATE_LIMITS en cada request, no de DEFAULT_THROTTLE_RATES.
+    """
+    cache = cache
+    timer = time.time
+    scope_attr = 'throttle_scope'
+
+    def __init__(self):
+        # el scope y la tasa dependen de la vista (ver allow_request)
+        self.wait_seconds = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        return f'{KEY_PREFIX}:{self.scope}:{self.get_ident_key(request)}'
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        rate = rate_for(self.scope) if self.scope else None
+        if rate is None:
+            return True
+        capacity, duration = rate
+        key = self.get_cache_key(request, view)
+        state, self.wait_seconds = take_token(self.cache.get(key), capacity, duration, self.timer())
+        if state is None:
+            return False
+        # el bucket lleno equivale a no tener clave: basta con que viva un periodo
+        self.cache.set(key, state, duration)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Por IP (respeta NUM_PROXIES de DRF para X-Forwarded-For)."""
+
+    def get_ident_key(self, request):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Por usuario autenticado; las requests anónimas cuentan por IP."""
+
+    def get_ident_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+async def acheck(request, scope, ident):
+    """
+    Versión para las vistas async (async_views.py): consume un token de `scope` para
+    la clave `ident`. Devuelve None si se permite o los segundos a esperar si no.
+    """
+    rate = rate_for(scope)
+    if rate is None:
+        return None
+    capacity, duration = rate
+    key = f'{KEY_PREFIX}:{scope}:{ident}'
+    state, wait = take_token(await cache.aget(key), capacity, duration, time.time())
+    if state is None:
+        return wait
+    await cache.aset(key, state, duration)
+    return None
@@ -1,26 +1,40 @@
 from django.urls import path
 from .views import (
     PetListCreateView, PetDetailView,
-    ServiceRequestListCreateView, ServiceRequestDetailView, RegisterView,
-    GuideAvailableRequestsList, GuideAssignedRequestsList,
-    AcceptRequestView, CreateMilestoneView, CurrentUserView,
-    CreateServiceRatingView, PendingFeedbackList,
-    GuidePublicProfileView, UserHistoryRequestsView
+    ServiceRequestListCreateView, ServiceRequestDetailView, PetBulkView, ServiceRequestBulkView, RegisterView,
+    GuideAvailableRequestsList, GuideAssignedRequestsList, GuideAvailabilityView,
+    AcceptRequestView, CreateMilestoneView, MilestoneBatchView, CurrentUserView,
+    CreateServiceRatingView, PendingFeedbackList, PendingFeedbackCountView,
+    GuidePublicProfileView, UserHistoryRequestsView, MilestoneAnalyticsView
 )
+from . import async_views
 
 urlpatterns = [
     path('pets/', PetListCreateView.as_view(), name='pets'),
     path('pets/<int:pk>/', PetDetailView.as_view(), name='pet-detail'),
+    path('pets/bulk/', PetBulkView.as_view(), name='pet-bulk'),
     path('requests/', ServiceRequestListCreateView.as_view(), name='requests'),
     path('requests/<int:pk>/', ServiceRequestDetailView.as_view(), name='request-detail'),
+    path('requests/bulk/', ServiceRequestBulkView.as_view(), name='request-bulk'),
     path('register/', RegisterView.as_view(), name='register'),
     path('guide/available-requests/', GuideAvailableRequestsList.as_view(), name='guide-available'),
     path('guide/assigned-requests/', GuideAssignedRequestsList.as_view(), name='guide-assigned'),
+    path('guide/availability/', GuideAvailabilityView.as_view(), name='guide-availability'),
     path('requests/<int:pk>/accept/', AcceptRequestView.as_view(), name='request-accept'),
     path('requests/<int:pk>/milestones/', CreateMilestoneView.as_view(), name='request-milestones'),
+    path('guide/milestones/batch/', MilestoneBatchView.as_view(), name='milestone-batch'),
     path('me/', CurrentUserView.as_view(), name='current-user'),
     path('requests/<int:pk>/rating/', CreateServiceRatingView.as_view(), name='request-rating'),
     path('requests/pending-feedback/', PendingFeedbackList.as_view(), name='pending-feedback'),
+    path('requests/pending-feedback/count/', PendingFeedbackCountView.as_view(), name='pending-feedback-count'),
     path('guides/<int:guide_id>/profile/', GuidePublicProfileView.as_view(), name='guide-profile'),
+    path('analytics/milestones/', MilestoneAnalyticsView.as_view(), name='milestone-analytics'),
+    path('events/', async_views.events_stream, name='events'),
     path('history/requests/', UserHistoryRequestsView.as_view(), name='user-history-requests'),
+    # variantes async de los endpoints de lectura (servir con zoolito.asgi)
+    path('async/history/requests/', async_views.user_history_requests, name='async-user-history-requests'),
+    path('async/guide/available-requests/', async_views.guide_available_requests, name='async-guide-available'),
+    path('async/guide/assigned-requests/', async_views.guide_assigned_requests, name='async-guide-assigned'),
+    path('async/guides/<int:guide_id>/profile/', async_views.guide_public_profile, name='async-guide-profile'),
+    path('async/me/', async_views.current_user, name='async-current-user'),
 ]
@@ -1,14 +1,31 @@
+import heapq
+import math
+from datetime import date, timedelta
+from functools import cached_property, partial
+
 from rest_framework import generics, permissions, status
 from .models import Pet, ServiceRequest
 from .serializers import PetSerializer, ServiceRequestSerializer
 from rest_framework.response import Response
 from .serializers import RegisterSerializer, get_tokens_for_user
 from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .models import ServiceRequest, ServiceRequestMilestone, Profile, MILESTONE_CHOICES, ServiceRating
+from .models import GuideAvailability, ServiceRequestTombstone
 from .serializers import ServiceRequestSerializer, ServiceRequestMilestoneSerializer, UserSerializer, GuidePublicProfileSerializer, ServiceRatingSerializer
+from .serializers import GuideAvailabilitySerializer, RoleTokenRefreshSerializer
 from django.shortcuts import get_object_or_404
-from django.db.models import Avg, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.conf import settings
+from .fast_serializers import FastServiceRequestSerializer
+from .pagination import list_response, prepare_queryset
+from . import analytics, geo, sync
+from .events import GUIDES_CHANNEL, guide_channel, publish_milestones, publish_on_commit, request_event_data
+from .response_cache import cached_response, guide_profile_scope, invalidate, user_history_scope
+from .throttling import IPTokenBucketThrottle
 
 
 
@@ -29,24 +46,214 @@ class PetDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Pet.objects.filter(owner=self.request.user)
 
 
-class ServiceRequestListCreateView(generics.ListCreateAPIView):
+def _fieldset(request):
+    """Campos pedidos con ?fields= / ?expand= (None = representación completa)."""
+    return ServiceRequestSerializer.fieldset_from_params(request.query_params)
+
+
+def _request_serializer(fieldset):
+    return partial(ServiceRequestSerializer, fields=fieldset)
+
+
+def _list_serializer(fieldset):
+    """Serializer de los listados grandes de sólo lectura (mismo JSON con cualquiera de los dos)."""
+    if getattr(settings, 'FAST_LIST_SERIALIZATION', False):
+        return FastServiceRequestSerializer.for_fieldset(fieldset)
+    return _request_serializer(fieldset)
+
+
+class ServiceRequestFieldsetMixin:
+    """?fields= / ?expand= en los GET; las escrituras usan siempre el serializer completo."""
+
+    @cached_property
+    def fieldset(self):
+        return _fieldset(self.request) if self.request.method == 'GET' else None
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.fieldset)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ServiceRequestListCreateView(ServiceRequestFieldsetMixin, generics.ListCreateAPIView):
     serializer_class = ServiceRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return ServiceRequest.objects.filter(user=self.request.user)
+        return ServiceRequest.objects.filter(user=self.request.user).for_fieldset(self.fieldset)
 
 
-class ServiceRequestDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ServiceRequestDetailView(ServiceRequestFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ServiceRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return ServiceRequest.objects.filter(user=self.request.user).for_fieldset(self.fieldset)
+
+def _item_id(item):
+    """El "id" de un ítem de BulkWriteView si es un entero (True/False no cuentan), si no None."""
+    pk = item.get('id')
+    return pk if isinstance(pk, int) and not isinstance(pk, bool) else None
+
+class BulkWriteView(APIView):
+    """
+    Alta y edición en lote: POST con una lista de objetos los crea y PATCH con una
+    lista de objetos con "id" los edita parcialmente. Se valida todo antes de escribir
+    (la propiedad, con queries IN) y los ítems válidos se guardan en una transacción con
+    bulk_create/bulk_update. Devuelve un resultado por ítem, en el mismo orden.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'bulk-write'  # por usuario (RATE_LIMITS)
+    max_items = 100
+    serializer_class = None
+    noun = None         # para los mensajes de error
+    result_key = None   # clave del objeto guardado en cada resultado
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_serializer_context(self, items):
+        return {'request': self.request}
+
+    def build(self, validated_data):
+        """Instancia nueva (sin guardar) a partir de los datos validados de un ítem."""
+        raise NotImplementedError
+
+    def after_write(self, objs, created):
+        """bulk_create/bulk_update no disparan signals: cachés y eventos van acá."""
+
+    def represent(self, objs):
+        return self.serializer_class(objs, many=True).data
+
+    def post(self, request):
+        return self.write(request, creating=True)
+
+    def patch(self, request):
+        return self.write(request, creating=False)
+
+    def write(self, request, creating):
+        items = request.data
+        error = _batch_error(items, self.max_items, self.noun)
+        if error:
+            return error
+        context = self.get_serializer_context(items)
+        if not creating:
+            ids = {_item_id(item) for item in items if isinstance(item, dict)} - {None}
+            instances = self.get_queryset().in_bulk(ids)
+            seen = set()
+
+        results = []
+        objs = []
+        fields = set()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results.append({"index": index, "status": 400, "detail": "Se espera un objeto."})
+                continue
+            instance = None
+            if not creating:
+                pk = _item_id(item)
+                if pk is None and 'id' in item:
+                    results.append({"index": index, "status": 400, "detail": "id inválido."})
+                    continue
+                instance = instances.get(pk)
+                if instance is None:
+                    results.append({"index": index, "status": 404, "detail": "No encontrado."})
+                    continue
+                # bulk_update escribiría una sola de las versiones del objeto
+                if pk in seen:
+                    results.append({"index": index, "status": 400, "detail": "id repetido en el envío."})
+                    continue
+                seen.add(pk)
+            serializer = self.serializer_class(instance, data=item, partial=not creating, context=context)
+            if not serializer.is_valid():
+                results.append({"index": index, "status": 400, "errors": serializer.errors})
+                continue
+            if creating:
+                objs.append(self.build(serializer.validated_data))
+            else:
+                for field, value in serializer.validated_data.items():
+                    setattr(instance, field, value)
+                fields.update(serializer.validated_data)
+                objs.append(instance)
+            results.append({"index": index, "status": 201 if creating else 200})
+
+        model = self.get_queryset().model
+        try:
+            with transaction.atomic():
+                if creating:
+                    objs = model.objects.bulk_create(objs)
+                elif fields:
+                    model.objects.bulk_update(objs, fields)
+        except IntegrityError:
+            return Response({"detail":"No se pudo guardar el envío. Reintente."}, status=status.HTTP_409_CONFLICT)
+        if objs and (creating or fields):
+            self.after_write(objs, creating)
+
+        data = iter(self.represent(objs))
+        for result in results:
+            if result["status"] in (200, 201):
+                result[self.result_key] = next(data)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class PetBulkView(BulkWriteView):
+    serializer_class = PetSerializer
+    noun = 'mascotas'
+    result_key = 'pet'
+
+    def get_queryset(self):
+        return Pet.objects.filter(owner=self.request.user)
+
+    def build(self, validated_data):
+        return Pet(owner=self.request.user, **validated_data)
+
+    def after_write(self, objs, created):
+        if not created:
+            # pet_detail de sus solicitudes cambió (?since= y el historial cacheado)
+            ServiceRequest.objects.filter(pet__in=objs).touch()
+            invalidate(user_history_scope(self.request.user.id))
+
+
+class ServiceRequestBulkView(BulkWriteView):
+    serializer_class = ServiceRequestSerializer
+    noun = 'solicitudes'
+    result_key = 'request'
+
     def get_queryset(self):
         return ServiceRequest.objects.filter(user=self.request.user)
 
+    def get_serializer_context(self, items):
+        # todas las mascotas referidas en el envío, con una sola query
+        pet_ids = set()
+        for item in items:
+            if isinstance(item, dict):
+                try:
+                    pet_ids.add(int(item['pet']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+        owned = Pet.objects.filter(owner=self.request.user).in_bulk(pet_ids) if pet_ids else {}
+        return {**super().get_serializer_context(items), 'owned_pets': owned}
+
+    def build(self, validated_data):
+        return ServiceRequest(user=self.request.user, **validated_data)
+
+    def after_write(self, objs, created):
+        invalidate(user_history_scope(self.request.user.id))
+        if created:
+            for sr in objs:
+                if sr.is_in_pool():
+                    publish_on_commit([GUIDES_CHANNEL], 'request.created', request_event_data(sr))
+
+    def represent(self, objs):
+        by_id = ServiceRequest.objects.with_details().in_bulk([sr.pk for sr in objs])
+        return ServiceRequestSerializer([by_id[sr.pk] for sr in objs], many=True).data
+
+
 class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = []  # AllowAny implicitly; si quieres explícito: [permissions.AllowAny]
+    # por IP y antes de validar: el hashing de la contraseña es lo caro
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'register'
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -65,8 +272,23 @@ class RegisterView(generics.CreateAPIView):
         }
         return Response(data, status=status.HTTP_201_CREATED)
     
+class RateLimitedTokenObtainPairView(TokenObtainPairView):
+    # por IP y antes de verificar la contraseña
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'login'
+
+class RateLimitedTokenRefreshView(TokenRefreshView):
+    # el rol del token de acceso nuevo sale del perfil, no del refresh token
+    serializer_class = RoleTokenRefreshSerializer
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'token-refresh'
+
 class IsGuide(permissions.BasePermission):
     def has_permission(self, request, view):
+        # con JWT el rol viene en el token y no hace falta leer el perfil
+        role = request.auth.get('role') if hasattr(request.auth, 'get') else None
+        if role is not None:
+            return role == 'guide'
         return hasattr(request.user, 'profile') and request.user.profile.role == 'guide'
 
 class GuideAvailableRequestsList(APIView):
@@ -74,62 +296,230 @@ class GuideAvailableRequestsList(APIView):
     """
     Listado de solicitudes activas que no están asignadas (o podrías listar asignadas al guía)
     """
+    NEARBY_DEFAULT_RADIUS_KM = 5
+    NEARBY_MAX_RADIUS_KM = 50
+    NEARBY_DEFAULT_LIMIT = 20
+    NEARBY_MAX_LIMIT = 100
+
     def get(self, request):
-        qs = ServiceRequest.objects.filter(assigned_guide__isnull=True).order_by('created_at')
-        serializer = ServiceRequestSerializer(qs, many=True)
-        return Response(serializer.data)
+        qs = ServiceRequest.objects.in_pool()
+        fieldset = _fieldset(request)
+        if 'lat' in request.query_params or 'lng' in request.query_params:
+            return self.get_nearby(request, qs, fieldset)
+        return list_response(request, qs.for_fieldset(fieldset), _list_serializer(fieldset))
+
+    def get_nearby(self, request, qs, fieldset=None):
+        """
+        Modo cercanía: ?lat=&lng=[&radius=km][&limit=] devuelve las solicitudes más
+        cercanas al guía dentro del radio, ordenadas por distancia.
+        """
+        params = request.query_params
+        try:
+            lat = float(params['lat'])
+            lng = float(params['lng'])
+            radius = float(params.get('radius', self.NEARBY_DEFAULT_RADIUS_KM))
+            limit = int(params.get('limit', self.NEARBY_DEFAULT_LIMIT))
+        except (KeyError, ValueError):
+            return Response({"detail": "lat y lng deben ser números válidos"}, status=status.HTTP_400_BAD_REQUEST)
+        # nan pasa todas las comparaciones de rango e inf no es un radio
+        if not all(map(math.isfinite, (lat, lng, radius))):
+            return Response({"detail": "lat y lng deben ser números válidos"}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0:
+            return Response({"detail": "Coordenadas o radio fuera de rango"}, status=status.HTTP_400_BAD_REQUEST)
+        radius = min(radius, self.NEARBY_MAX_RADIUS_KM)
+        limit = max(1, min(limit, self.NEARBY_MAX_LIMIT))
+
+        # se rankea sobre columnas mínimas y sólo se cargan completas las `limit` más cercanas
+        candidates = []
+        rows = qs.near(lat, lng, radius).values_list('id', 'origin_lat', 'origin_lng', 'created_at')
+        for pk, origin_lat, origin_lng, created_at in rows:
+            distance = geo.haversine_km(lat, lng, origin_lat, origin_lng)
+            if distance <= radius:
+                candidates.append((distance, created_at, pk))
+        nearest = heapq.nsmallest(limit, candidates)
+
+        by_id = ServiceRequest.objects.for_fieldset(fieldset).in_bulk([pk for _, _, pk in nearest])
+        data = ServiceRequestSerializer([by_id[pk] for _, _, pk in nearest], many=True, fields=fieldset).data
+        for row, (distance, _, _) in zip(data, nearest):
+            row['distance_km'] = round(distance, 3)
+        return Response(data)
 
 class GuideAssignedRequestsList(APIView):
     permission_classes = [permissions.IsAuthenticated, IsGuide]
     def get(self, request):
-        qs = ServiceRequest.objects.filter(assigned_guide=request.user).order_by('-created_at')
-        serializer = ServiceRequestSerializer(qs, many=True)
+        fieldset = _fieldset(request)
+        qs = ServiceRequest.objects.filter(assigned_guide=request.user).for_fieldset(fieldset)
+        serializer_class = _list_serializer(fieldset)
+        if sync.is_requested(request):
+            tombstones = ServiceRequestTombstone.objects.filter(guide_id=request.user.id)
+            return sync.delta_response(request, qs, tombstones, serializer_class)
+        qs = qs.order_by('-created_at')
+        serializer = serializer_class(prepare_queryset(qs, serializer_class), many=True)
+        return Response(serializer.data)
+
+class GuideAvailabilityView(APIView):
+    """Disponibilidad y ubicación del guía para la asignación automática (matching.py)."""
+    permission_classes = [permissions.IsAuthenticated, IsGuide]
+
+    def get_object(self, request):
+        return GuideAvailability.objects.filter(guide=request.user).first() or GuideAvailability(guide=request.user)
+
+    def get(self, request):
+        return Response(GuideAvailabilitySerializer(self.get_object(request)).data)
+
+    def patch(self, request):
+        serializer = GuideAvailabilitySerializer(self.get_object(request), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
         return Response(serializer.data)
 
 class AcceptRequestView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsGuide]
 
     def post(self, request, pk):
-        sr = get_object_or_404(ServiceRequest, pk=pk)
-        if sr.assigned_guide is not None:
-            return Response({"detail":"Ya asignada"}, status=status.HTTP_400_BAD_REQUEST)
-        sr.assigned_guide = request.user
-        sr.save()
-        return Response({"detail":"Asignada", "request_id": sr.id})
+        if ServiceRequest.objects.assign_guide(pk, request.user):
+            # el resto de los guías la quita de su listado; el guía asignado la suma a las suyas
+            publish_on_commit([GUIDES_CHANNEL, guide_channel(request.user.id)], 'request.accepted',
+                              {'id': pk, 'guide_id': request.user.id})
+            return Response({"detail":"Asignada", "request_id": pk})
+        # perdimos la carrera, la solicitud no existe o es programada y aún no se liberó
+        if get_object_or_404(ServiceRequest.objects.only('assigned_guide'), pk=pk).assigned_guide_id is None:
+            return Response({"detail":"Todavía no disponible"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"detail":"Ya asignada"}, status=status.HTTP_400_BAD_REQUEST)
+
+def _batch_error(items, max_items, noun):
+    """Respuesta 400 si el cuerpo de un envío en lote no es una lista de 1..max_items elementos."""
+    if not isinstance(items, list) or not items:
+        return Response({"detail":f"Se espera una lista de {noun}."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > max_items:
+        return Response({"detail":f"Máximo {max_items} {noun} por envío."}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+MILESTONE_ORDER = [m[0] for m in MILESTONE_CHOICES]
+
+def _milestone_error(milestone, existing):
+    """Valida un hito contra los ya registrados (`existing`); devuelve el mensaje de error o None."""
+    if milestone not in MILESTONE_ORDER:
+        return "Hito inválido."
+    # Verificar secuencia: permitir solo si el anterior hito ya existe (a excepción del primero)
+    idx = MILESTONE_ORDER.index(milestone)
+    if idx > 0 and MILESTONE_ORDER[idx-1] not in existing:
+        return f"Debe registrar primero el hito previo: {MILESTONE_ORDER[idx-1]}"
+    if milestone in existing:
+        return "Hito ya registrado"
+    return None
 
 class CreateMilestoneView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsGuide]
 
     def post(self, request, pk):
-        sr = get_object_or_404(ServiceRequest, pk=pk)
-        if sr.assigned_guide != request.user:
+        sr = get_object_or_404(ServiceRequest.objects.only('id', 'user_id', 'assigned_guide_id', 'confirmed'), pk=pk)
+        if sr.assigned_guide_id != request.user.id:
             return Response({"detail":"No autorizado. Sólo el guía asignado puede registrar hitos."}, status=status.HTTP_403_FORBIDDEN)
 
         milestone = request.data.get('milestone')
-        valid_milestones = [m[0] for m in MILESTONE_CHOICES]
-        if milestone not in valid_milestones:
-            return Response({"detail":"Hito inválido."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Verificar secuencia: permitir solo si el anterior hito ya existe (a excepción del primero)
-        order = valid_milestones
-        idx = order.index(milestone)
-        if idx > 0:
-            prev = order[idx-1]
-            if not sr.milestones.filter(milestone=prev).exists():
-                return Response({"detail":f"Debe registrar primero el hito previo: {prev}"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Evitar duplicados
-        if sr.milestones.filter(milestone=milestone).exists():
+        # una sola lectura de los hitos existentes para validar secuencia y duplicados
+        existing = set(sr.milestones.order_by().values_list('milestone', flat=True))
+        error = _milestone_error(milestone, existing)
+        if error:
+            return Response({"detail":error}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                m = ServiceRequestMilestone(request=sr, milestone=milestone, recorded_by=request.user)
+                # opcional: cambiar estado en ServiceRequest (ej. confirmed o similar) si milestone == delivered
+                confirm = milestone == 'delivered' and not sr.confirmed
+                # el save() de la solicitud ya sella updated_at: sin segundo UPDATE en touch_request
+                m.request_touched = confirm
+                m.save()
+                if confirm:
+                    sr.confirmed = True
+                    sr.save(update_fields=['confirmed'])
+        except IntegrityError:
+            # unique_together (request, milestone): otro envío lo registró primero
             return Response({"detail":"Hito ya registrado"}, status=status.HTTP_400_BAD_REQUEST)
-
-        m = ServiceRequestMilestone.objects.create(request=sr, milestone=milestone, recorded_by=request.user)
         serializer = ServiceRequestMilestoneSerializer(m)
-        # opcional: cambiar estado en ServiceRequest (ej. confirmed o similar) si milestone == delivered
-        if milestone == 'delivered':
-            sr.confirmed = True
-            sr.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    
+
+class MilestoneBatchView(APIView):
+    """
+    Sincronización de hitos registrados offline: recibe una lista
+    [{"request": id, "milestone": "..."}, ...] de una o varias solicitudes del guía,
+    valida todo con dos queries y guarda los hitos válidos en una sola transacción.
+    Devuelve un resultado por ítem, en el mismo orden.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsGuide]
+    max_items = 100
+
+    def post(self, request):
+        items = request.data
+        error = _batch_error(items, self.max_items, 'hitos')
+        if error:
+            return error
+
+        request_ids = set()
+        for item in items:
+            try:
+                request_ids.add(int(item.get('request')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        requests = ServiceRequest.objects.only('id', 'user_id', 'assigned_guide_id', 'confirmed').in_bulk(request_ids)
+        existing = {pk: set() for pk in requests}
+        for request_id, milestone in ServiceRequestMilestone.objects.filter(request_id__in=requests)\
+                .order_by().values_list('request_id', 'milestone'):
+            existing[request_id].add(milestone)
+
+        results = []
+        to_create = []
+        for index, item in enumerate(items):
+            try:
+                sr = requests.get(int(item.get('request')))
+            except (AttributeError, TypeError, ValueError):
+                results.append({"index": index, "status": 400, "detail": "request inválido"})
+                continue
+            if sr is None:
+                results.append({"index": index, "status": 404, "detail": "No encontrado."})
+                continue
+            if sr.assigned_guide_id != request.user.id:
+                results.append({"index": index, "status": 403,
+                                "detail": "No autorizado. Sólo el guía asignado puede registrar hitos."})
+                continue
+            milestone = item.get('milestone')
+            error = _milestone_error(milestone, existing[sr.id])
+            if error:
+                results.append({"index": index, "status": 400, "detail": error})
+                continue
+            # los hitos del mismo envío cuentan para validar la secuencia de los siguientes
+            existing[sr.id].add(milestone)
+            to_create.append(ServiceRequestMilestone(request=sr, milestone=milestone, recorded_by=request.user))
+            results.append({"index": index, "status": 201})
+
+        delivered = [m.request for m in to_create if m.milestone == 'delivered' and not m.request.confirmed]
+        try:
+            with transaction.atomic():
+                created = ServiceRequestMilestone.objects.bulk_create(to_create)
+                if created:
+                    # updated_at de todas (?since=) y confirmed/feedback_pending de las entregadas
+                    # (todas con guía) en un solo UPDATE
+                    delivered_ids = [sr.pk for sr in delivered]
+                    ServiceRequest.objects.filter(pk__in={m.request_id for m in created}).update(
+                        updated_at=timezone.now(),
+                        confirmed=Case(When(pk__in=delivered_ids, then=Value(True)), default=F('confirmed')),
+                        feedback_pending=Case(When(pk__in=delivered_ids, then=Value(True)),
+                                              default=F('feedback_pending')),
+                    )
+        except IntegrityError:
+            return Response({"detail":"Algún hito ya fue registrado por otro envío. Reintente."}, status=status.HTTP_409_CONFLICT)
+        # bulk_create/update no disparan signals
+        invalidate(*{user_history_scope(m.request.user_id) for m in created if m.request.user_id})
+        publish_milestones(created, {m.request_id: m.request.user_id for m in created})
+
+        created_data = iter(ServiceRequestMilestoneSerializer(created, many=True).data)
+        for result in results:
+            if result["status"] == 201:
+                result["milestone"] = next(created_data)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
 class CurrentUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -165,54 +555,96 @@ class CreateServiceRatingView(APIView):
         if stars < 1 or stars > 5:
             return Response({"detail":"stars debe estar entre 1 y 5"}, status=400)
 
-        rating = ServiceRating.objects.create(
-            request=sr,
-            user=request.user,
-            guide=sr.assigned_guide,
-            stars=stars,
-            comment=comment
-        )
+        # la calificación y los agregados del guía (signals.py) se guardan juntos
+        with transaction.atomic():
+            rating = ServiceRating.objects.create(
+                request=sr,
+                user=request.user,
+                guide_id=sr.assigned_guide_id,
+                stars=stars,
+                comment=comment
+            )
         return Response(ServiceRatingSerializer(rating).data, status=201)
 
 class PendingFeedbackList(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        qs = ServiceRequest.objects.filter(user=request.user)\
-            .filter(assigned_guide__isnull=False)\
-            .filter(confirmed=True) \
-            .filter(rating__isnull=True)
+        fieldset = _fieldset(request)
+        qs = ServiceRequest.objects.pending_feedback(request.user).for_fieldset(fieldset)
+        serializer = ServiceRequestSerializer(qs, many=True, fields=fieldset)
+        return Response(serializer.data)
 
-        # Si usas “delivered” en milestones, puedes ampliar:
-        # qs = ServiceRequest.objects.filter(user=request.user, assigned_guide__isnull=False).filter(
-        #    Q(confirmed=True) | Q(milestones__milestone='delivered')
-        # ).distinct().filter(rating__isnull=True)
+class PendingFeedbackCountView(APIView):
+    """Cantidad de solicitudes por calificar (badge de la app): un COUNT sobre el índice parcial."""
+    permission_classes = [permissions.IsAuthenticated]
 
-        serializer = ServiceRequestSerializer(qs, many=True)
-        return Response(serializer.data)
+    def get(self, request):
+        return Response({"count": ServiceRequest.objects.pending_feedback(request.user).count()})
     
 class GuidePublicProfileView(APIView):
     permission_classes = [permissions.AllowAny]  # o IsAuthenticated si prefieres
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'guide-profile'
 
     def get(self, request, guide_id):
-        guide = get_object_or_404(User, pk=guide_id)
-        agg = ServiceRating.objects.filter(guide=guide).aggregate(
-            rating_avg=Avg('stars'),
-            rating_count=Count('id')
-        )
+        return cached_response(request, guide_profile_scope(guide_id), lambda: self.build_profile(guide_id))
+
+    def build_profile(self, guide_id):
+        # una sola lectura por PK: los agregados vienen de GuideRatingStats
+        guide = get_object_or_404(User.objects.select_related('rating_stats'), pk=guide_id)
+        stats = getattr(guide, 'rating_stats', None)
         data = {
             "guide_id": guide.id,
             "username": guide.username,
             "full_name": f"{guide.first_name} {guide.last_name}".strip(),
-            "rating_avg": agg['rating_avg'] or 0.0,
-            "rating_count": agg['rating_count'] or 0,
+            "rating_avg": stats.rating_avg if stats else 0.0,
+            "rating_count": stats.rating_count if stats else 0,
+            "rating_histogram": stats.histogram if stats else {str(n): 0 for n in range(1, 6)},
         }
-        return Response(GuidePublicProfileSerializer(data).data)
+        return GuidePublicProfileSerializer(data).data
     
+class MilestoneAnalyticsView(APIView):
+    """
+    Duraciones de las etapas (p50/p95/promedio, en segundos) por tipo de servicio o por
+    guía: ?group_by=service_type|guide&from=AAAA-MM-DD&to=AAAA-MM-DD (por defecto los
+    últimos 30 días). Lee sólo los resúmenes diarios del comando rollup_milestones.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    default_days = 30
+
+    def get(self, request):
+        params = request.query_params
+        group_by = params.get('group_by', 'service_type')
+        if group_by not in analytics.GROUP_FIELDS:
+            return Response({"detail":"group_by debe ser service_type o guide"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            last_day = date.fromisoformat(params['to']) if 'to' in params else timezone.localdate()
+            first_day = date.fromisoformat(params['from']) if 'from' in params \
+                else last_day - timedelta(days=self.default_days - 1)
+        except ValueError:
+            return Response({"detail":"from y to deben ser fechas AAAA-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "from": first_day,
+            "to": last_day,
+            "group_by": group_by,
+            "results": analytics.summarize(first_day, last_day, group_by),
+        })
+
 class UserHistoryRequestsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        qs = ServiceRequest.objects.filter(user=request.user).order_by('-created_at')
-        serializer = ServiceRequestSerializer(qs, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        fieldset = _fieldset(request)
+        qs = ServiceRequest.objects.filter(user=request.user).for_fieldset(fieldset)
+        serializer_class = _list_serializer(fieldset)
+        if sync.is_requested(request):
+            tombstones = ServiceRequestTombstone.objects.filter(user_id=request.user.id)
+            return sync.delta_response(request, qs, tombstones, serializer_class)
+        if request.query_params.get('stream') in ('1', 'true'):
+            return list_response(request, qs, serializer_class, descending=True)
+        # la clave de caché incluye la query string: cada fieldset se cachea aparte
+        return cached_response(
+            request, user_history_scope(request.user.id),
+            lambda: list_response(request, qs, serializer_class, descending=True).data,
+        )
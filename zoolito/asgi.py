@@ -3,6 +3,11 @@ ASGI config for zoolito project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Required for the Server-Sent Events endpoint (/api/events/), whose in-process
+pub/sub only reaches clients connected to the same process, e.g.:
+
+    uvicorn zoolito.asgi:application --workers 1
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
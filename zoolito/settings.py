@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,14 +48,76 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'my_app.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # las vistas con throttle_scope se limitan por usuario (RATE_LIMITS)
+    'DEFAULT_THROTTLE_CLASSES': (
+        'my_app.throttling.UserTokenBucketThrottle',
+    ),
+    # proxies delante de la app: con 0 la IP de los límites es REMOTE_ADDR y un
+    # X-Forwarded-For enviado por el cliente no la cambia (con N, la N-ésima desde el final)
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
+    # orjson si está instalado, con la misma salida que JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': (
+        'my_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# token bucket por scope (my_app/throttling.py): "cantidad/periodo" permite ráfagas de
+# `cantidad` requests y se recarga a ese ritmo; un scope ausente no se limita
+RATE_LIMITS = {
+    'register': '10/hour',        # por IP
+    'login': '10/min',            # por IP
+    'token-refresh': '30/min',    # por IP
+    'guide-profile': '120/min',   # por IP
+    'bulk-write': '60/min',       # por usuario
+}
+
+# listados grandes (historial, listados del guía) con my_app.fast_serializers (opcional,
+# FAST_LIST_SERIALIZATION=True en el entorno); por defecto ServiceRequestSerializer
+FAST_LIST_SERIALIZATION = config('FAST_LIST_SERIALIZATION', default=False, cast=bool)
+
+# solicitudes programadas (comando dispatch_scheduled): minutos antes de scheduled_datetime
+# en que entran al listado de los guías y en que se avisa al dueño y al guía
+SCHEDULED_RELEASE_LEAD_MINUTES = config('SCHEDULED_RELEASE_LEAD_MINUTES', default=60, cast=int)
+SCHEDULED_REMINDER_LEAD_MINUTES = config('SCHEDULED_REMINDER_LEAD_MINUTES', default=30, cast=int)
+
+# eventos de los workers hacia las conexiones SSE (OutboxEvent, events.OutboxRelay): cada
+# proceso web con conexiones abiertas lee la tabla cada EVENT_OUTBOX_POLL_SECONDS (0 lo apaga)
+EVENT_OUTBOX_POLL_SECONDS = 1.0
+EVENT_OUTBOX_OVERLAP_SECONDS = 5        # commits tardíos que todavía se leen
+EVENT_OUTBOX_RETENTION_MINUTES = 10     # los workers borran los más viejos
+
+# asignación automática (my_app/matching.py, comando match_requests)
+MATCHING_BATCH_SIZE = 2000                  # solicitudes del pool por pasada
+MATCHING_MAX_DISTANCE_KM = 10               # distancia máxima guía -> origen
+MATCHING_MAX_ACTIVE_PER_GUIDE = 2           # solicitudes sin entregar por guía
+MATCHING_LOAD_PENALTY_KM = 2.0              # costo de cada solicitud activa del guía
+MATCHING_RATING_WEIGHT_KM = 1.0             # costo de cada estrella por debajo de 5
+MATCHING_LOCATION_MAX_AGE_MINUTES = 15      # ubicaciones más viejas no cuentan
+
+# ?since= (my_app/sync.py): segundos que cada cursor se solapa con la sincronización anterior
+SYNC_OVERLAP_SECONDS = 5
+
+SIMPLE_JWT = {
+    # agrega el claim "role" que usa IsGuide
+    "TOKEN_OBTAIN_SERIALIZER": "my_app.serializers.RoleTokenObtainPairSerializer",
 }
 
+AUTHENTICATION_BACKENDS = [
+    "my_app.authentication.ProfileModelBackend",
+]
+
+# segundos que CachedJWTAuthentication guarda el usuario autenticado (0 desactiva el cache)
+AUTH_USER_CACHE_TIMEOUT = 60
+
 MIDDLEWARE = [
+    "my_app.middleware.RequestProfilingMiddleware",  # primero, para medir también el resto del stack
+    "my_app.middleware.ReadReplicaMiddleware",
     "corsheaders.middleware.CorsMiddleware",       
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -63,6 +128,26 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Instrumentación por request (my_app.middleware): cabecera Server-Timing y log
+# estructurado en "my_app.profiling" de las requests lentas o con muchas queries.
+REQUEST_PROFILING = {
+    # fracción de requests instrumentadas; PROFILING_SAMPLE_RATE=1 para medirlas todas en local
+    "SAMPLE_RATE": config("PROFILING_SAMPLE_RATE", default=0.05, cast=float),
+    "SLOW_REQUEST_MS": 500,
+    "SLOW_QUERY_COUNT": 30,
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "my_app.profiling": {"handlers": ["console"], "level": "WARNING", "propagate": False},
+    },
+}
+
 ROOT_URLCONF = "zoolito.urls"
 CORS_ALLOW_ALL_ORIGINS = True  # dev; en prod usa CORS_ALLOWED_ORIGINS
 CORS_ALLOW_CREDENTIALS = True  # si usas cookies o necesitas enviar credenciales
@@ -99,13 +184,86 @@ WSGI_APPLICATION = "zoolito.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# Se configura por entorno (o .env), ver README:
+#   DB_ENGINE=sqlite (por defecto) | postgres
+#   DB_REPLICAS: réplicas de lectura separadas por coma (archivos en SQLite, hosts en Postgres)
+
+DB_ENGINE = config("DB_ENGINE", default="sqlite")
+# segundos que se reutiliza una conexión (0: una conexión por request)
+DB_CONN_MAX_AGE = config("DB_CONN_MAX_AGE", default=60, cast=int)
+
+if DB_ENGINE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DB_NAME", default="zoolito"),
+            "USER": config("DB_USER", default="zoolito"),
+            "PASSWORD": config("DB_PASSWORD", default=""),
+            "HOST": config("DB_HOST", default="localhost"),
+            "PORT": config("DB_PORT", default="5432"),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            # detrás de PgBouncer en modo transaction no se pueden usar cursores de servidor
+            "DISABLE_SERVER_SIDE_CURSORS": config("DB_PGBOUNCER", default=False, cast=bool),
+            "OPTIONS": {
+                "connect_timeout": config("DB_CONNECT_TIMEOUT", default=5, cast=int),
+                "options": f"-c statement_timeout={config('DB_STATEMENT_TIMEOUT_MS', default=30000, cast=int)}",
+            },
+        }
+    }
+    _replica_overrides = [{"HOST": host} for host in config("DB_REPLICAS", default="", cast=Csv())]
+elif DB_ENGINE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": config("DB_NAME", default=str(BASE_DIR / "db.sqlite3")),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "OPTIONS": {
+                # segundos que una escritura espera el lock antes de fallar con "database is locked"
+                "timeout": config("SQLITE_BUSY_TIMEOUT", default=20, cast=int),
+            },
+        }
+    }
+    _replica_overrides = [{"NAME": name} for name in config("DB_REPLICAS", default="", cast=Csv())]
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE desconocido: {DB_ENGINE!r} (sqlite o postgres)")
+
+for _index, _override in enumerate(_replica_overrides, start=1):
+    # en los tests las réplicas apuntan a la base de test de default
+    DATABASES[f"replica{_index}"] = {**DATABASES["default"], **_override, "TEST": {"MIRROR": "default"}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["my_app.db.ReadReplicaRouter"]
+
+# PRAGMA de cada conexión SQLite (my_app.db): WAL deja leer mientras otro escribe
+SQLITE_PRAGMAS = {
+    "journal_mode": config("SQLITE_JOURNAL_MODE", default="wal"),
+    "synchronous": config("SQLITE_SYNCHRONOUS", default="normal"),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# locmem es por proceso: con varios workers usar un backend compartido (redis/memcached)
+# para que la invalidación de my_app.response_cache llegue a todos.
+
+# con varios procesos (web, match_requests, dispatch_scheduled) la caché tiene que ser
+# compartida para que las invalidaciones y los límites de requests valgan para todos:
+# REDIS_URL=redis://localhost:6379/0 (pip install redis)
+REDIS_URL = config("REDIS_URL", default="")
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    } if REDIS_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "zoolito",
     }
 }
 
+# segundos que vive una respuesta cacheada (perfil de guía, historial)
+RESPONSE_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,11 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from my_app.views import RateLimitedTokenObtainPairView, RateLimitedTokenRefreshView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('api/', include('my_app.urls')),
     # Auth endpoints
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', RateLimitedTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', RateLimitedTokenRefreshView.as_view(), name='token_refresh'),
 ]